@@ -1,30 +1,64 @@
-from crewai import Agent
+import threading
 from textwrap import dedent
-from langchain_openai import ChatOpenAI
+from llm_pool import get_registry
+
+PROJECT_PLANNER = dict(
+    role="Senior Software Project Planner",
+    backstory=dedent("""You are an experienced software architect with 15+ years 
+    of experience in planning and structuring software projects across various domains."""),
+    goal=dedent("""Analyze project requirements and create comprehensive project plans 
+    including technology stack recommendations, timeline estimates, and development phases."""),
+)
+
+DOCUMENTATION_SPECIALIST = dict(
+    role="Technical Documentation Specialist",
+    backstory=dedent("""You are a technical writer who specializes in creating 
+    clear, comprehensive documentation for software projects."""),
+    goal=dedent("""Generate professional README files, API documentation, 
+    and project structure documentation that helps developers understand and contribute to projects."""),
+)
 
 class CustomAgents:
-    def __init__(self):
-        self.OpenAIGPT = ChatOpenAI(model_name="gpt-4o-mini", temperature=0.3)
+    MODEL_NAME = "gpt-4o-mini"
+    TEMPERATURE = 0.3
+
+    def __init__(self, streaming=False, callbacks=None):
+        self.OpenAIGPT = get_registry().get_llm(
+            self.MODEL_NAME,
+            self.TEMPERATURE,
+            streaming=streaming,
+            callbacks=callbacks,
+        )
+        self._templates = {}
+        self._templates_lock = threading.Lock()
+
+    def _from_template(self, name, build):
+        """Copy a prebuilt agent; crews mutate agents, so each run gets its own"""
+        with self._templates_lock:
+            template = self._templates.get(name)
+            if template is None:
+                template = self._templates[name] = build()
+        return template.copy()
 
     def project_planner_agent(self):
+        return self._from_template("planner", self._build_project_planner_agent)
+
+    def documentation_agent(self):
+        return self._from_template("documenter", self._build_documentation_agent)
+
+    def _build_project_planner_agent(self):
+        from crewai import Agent  # crewai takes seconds to import, so only once an agent is needed
         return Agent(
-            role="Senior Software Project Planner",
-            backstory=dedent("""You are an experienced software architect with 15+ years 
-            of experience in planning and structuring software projects across various domains."""),
-            goal=dedent("""Analyze project requirements and create comprehensive project plans 
-            including technology stack recommendations, timeline estimates, and development phases."""),
+            **PROJECT_PLANNER,
             allow_delegation=False,
             verbose=True,
             llm=self.OpenAIGPT,
         )
 
-    def documentation_agent(self):
+    def _build_documentation_agent(self):
+        from crewai import Agent
         return Agent(
-            role="Technical Documentation Specialist",
-            backstory=dedent("""You are a technical writer who specializes in creating 
-            clear, comprehensive documentation for software projects."""),
-            goal=dedent("""Generate professional README files, API documentation, 
-            and project structure documentation that helps developers understand and contribute to projects."""),
+            **DOCUMENTATION_SPECIALIST,
             allow_delegation=False,
             verbose=True,
             llm=self.OpenAIGPT,
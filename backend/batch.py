@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class RateLimiter:
+    """Token bucket limiting how many plan generations start per second
+
+    ``rate`` is the sustained number of starts per second and ``burst`` how
+    many may start back to back after an idle period. A rate of 0 disables
+    limiting. One instance can be shared by several batches running at once.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a generation may start"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+def validate_item(item):
+    """Error message for a malformed batch item, or None if it is usable"""
+    if isinstance(item, ValueError):
+        return str(item)
+    if not isinstance(item, dict):
+        return "Each item must be a JSON object"
+    if not item.get('project_name') or not item.get('project_description'):
+        return "Both project_name and project_description are required"
+    return None
+
+
+def read_jsonl(path):
+    """Batch items from a JSON Lines file; unparseable lines become ValueErrors"""
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(ValueError(f"Line {line_number} is not valid JSON: {e}"))
+    return items
+
+
+def run_batch(items, generate, parallelism=4, rate_limiter=None):
+    """Generate plans for ``items`` concurrently, yielding results as they finish
+
+    ``generate(project_name, project_description)`` returns a plan, or a
+    dict of result fields holding the ``plan`` (e.g. with its ``plan_id``).
+    At most ``parallelism`` items run at once and each start goes through
+    ``rate_limiter``. A failing item yields an error result instead of
+    stopping the batch. Closing the generator early drops items that have
+    not started yet.
+    """
+    def run_item(index, item):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        started = time.perf_counter()
+        output = generate(item['project_name'], item['project_description'])
+        fields = output if isinstance(output, dict) else {"plan": output}
+        return fields, time.perf_counter() - started
+
+    def result(index, item, **fields):
+        data = {"type": "result", "index": index}
+        if isinstance(item, dict):
+            if item.get('id') is not None:
+                data["id"] = item['id']
+            data["project_name"] = item.get('project_name')
+        data.update(fields)
+        return data
+
+    pool = ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="plan-batch")
+    futures = {}
+    try:
+        for index, item in enumerate(items):
+            error = validate_item(item)
+            if error:
+                yield result(index, item, status="error", error=error)
+                continue
+            futures[pool.submit(run_item, index, item)] = (index, item)
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, item = futures[future]
+                try:
+                    fields, seconds = future.result()
+                except Exception as e:
+                    yield result(index, item, status="error", error=str(e))
+                else:
+                    yield result(index, item, status="success", **fields, seconds=round(seconds, 3))
+    finally:
+        # Items already running finish in the background; queued ones are dropped
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def summarize(results):
+    """Summary line for a finished batch"""
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    return {"type": "summary", "total": len(results), "succeeded": succeeded,
+            "failed": len(results) - succeeded}
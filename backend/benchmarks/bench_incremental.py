@@ -0,0 +1,121 @@
+"""Token spend of incremental vs full plan regeneration as the edit grows
+
+Builds a synthetic previous plan (analysis and README with the usual
+"## " sections), edits 1..N requirements of its description, and compares
+what a full regeneration sends and receives with what the incremental path
+does: only the changed requirements plus the affected sections in, and
+only those sections back out. Completion tokens are estimated from the
+size of the sections being rewritten, so no LLM is needed.
+
+    cd backend
+    python -m benchmarks.bench_incremental --requirements 40
+"""
+import argparse
+
+from budget import count_tokens
+from incremental import affected_units, diff_requirements, heading_topic, rewrite_share, select_units, split_units
+from instrumentation import estimate_cost
+from tasks import CustomTasks
+
+AREAS = ["billing", "reporting", "calendar", "search", "admin", "notifications", "mobile", "analytics"]
+
+REQUIREMENT = "The {area} feature {i} must let teams filter, sort and export {area} records."
+EDITED = "The {area} feature {i} must let admins bulk edit {area} records over a webhook."
+
+
+def make_description(requirements, edits=0):
+    return " ".join(
+        (EDITED if i < edits else REQUIREMENT).format(i=i, area=AREAS[i % len(AREAS)])
+        for i in range(requirements)
+    )
+
+
+def by_area(requirements, line):
+    """Markdown with one "### " subsection per feature area, as the prompts ask for"""
+    return "\n\n".join(
+        f"### {area.title()}\n" + "\n".join(
+            line.format(i=i, area=area) for i in range(requirements) if AREAS[i % len(AREAS)] == area
+        )
+        for area in AREAS
+    )
+
+
+def make_analysis(requirements):
+    files = by_area(requirements, "- src/{area}/feature_{i}.py: views and models for feature {i}")
+    endpoints = by_area(requirements, "- GET /api/v1/{area}/feature-{i}/: list and filter records")
+    return (
+        f"## Project Structure\nOne Django app per feature area.\n\n{files}\n\n"
+        f"## API Design\nAll endpoints require a JWT.\n\n{endpoints}\n\n"
+        "## Technology Stack\nPython 3.12, Django 5.2, PostgreSQL 16, React 18\n\n"
+        "## Architecture\nLayered Django apps with service objects and a task queue\n\n"
+        "## Challenges\nExport jobs on large tables: stream results in batches"
+    )
+
+
+def make_readme(requirements):
+    tree = "\n".join(f"│   ├── feature_{i}.py" for i in range(requirements))
+    endpoints = by_area(requirements, "- `GET /api/v1/{area}/feature-{i}/`: list and filter records")
+    return (
+        "# TeamHub\n\n"
+        "## Project Introduction\nTeamHub helps teams manage records. Built with Django and React.\n\n"
+        f"## Project Structure\n```\nsrc/\n{tree}\n```\n\n"
+        f"## API Documentation\n{endpoints}"
+    )
+
+
+def full_tokens(tasks, description, analysis, readme):
+    prompt = (count_tokens(tasks.analysis_prompt("TeamHub", description))
+              + count_tokens(tasks.readme_prompt("TeamHub", analysis)))
+    return prompt, count_tokens(analysis) + count_tokens(readme)
+
+
+def incremental_tokens(tasks, old_description, description, analysis, readme):
+    # Same selection as ProjectPlanningService.regenerate_plan
+    diff = diff_requirements(old_description, description)
+    analysis_units = split_units(analysis)
+    targets = affected_units(analysis_units, diff.text)
+    analysis_text = select_units(analysis_units, targets)
+
+    readme_units = split_units(readme)
+    topics = {heading_topic(section) for section, _ in targets}
+    readme_targets = affected_units(readme_units, diff.text, topics=topics)
+    readme_text = select_units(readme_units, readme_targets)
+
+    prompt = (count_tokens(tasks.analysis_update_prompt("TeamHub", diff, analysis_text))
+              + count_tokens(tasks.readme_update_prompt("TeamHub", diff, analysis_text, readme_text)))
+    labels = [f"{section} / {sub}" if sub else section for section, sub in targets + readme_targets]
+    share = max(diff.change_ratio, rewrite_share(analysis_units, targets))
+    return prompt, count_tokens(analysis_text) + count_tokens(readme_text), share, labels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requirements", type=int, default=40)
+    parser.add_argument("--edits", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--max-change", type=float, default=0.5,
+                        help="PLAN_INCREMENTAL_MAX_CHANGE: above this share the service regenerates in full")
+    args = parser.parse_args(argv)
+
+    tasks = CustomTasks()
+    description = make_description(args.requirements)
+    analysis, readme = make_analysis(args.requirements), make_readme(args.requirements)
+    full_prompt, full_completion = full_tokens(tasks, description, analysis, readme)
+    full_cost = estimate_cost(tasks.model_name, full_prompt, full_completion)
+
+    print(f"{args.requirements} requirements; full regeneration: {full_prompt} prompt + "
+          f"~{full_completion} completion tokens (${full_cost * 1000:.4f}/1k)")
+    print(f"{'edits':>5} {'rewrite':>8} | {'prompt':>6} {'completion':>10} | {'tokens saved':>12} {'cost saved':>10} | sections")
+    for edits in args.edits:
+        edited = make_description(args.requirements, edits)
+        prompt, completion, share, sections = incremental_tokens(tasks, description, edited, analysis, readme)
+        if share > args.max_change:
+            print(f"{edits:>5} {share:>8.0%} | regenerated in full")
+            continue
+        cost = estimate_cost(tasks.model_name, prompt, completion)
+        saved = 1 - (prompt + completion) / (full_prompt + full_completion)
+        print(f"{edits:>5} {share:>8.0%} | {prompt:>6} {completion:>10} | "
+              f"{saved:>12.1%} {1 - cost / full_cost:>10.1%} | {', '.join(sections)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Per-request overhead of fresh vs pooled LLM clients
+
+Compares building a new ChatOpenAI (and HTTP connection) for every request,
+as the service used to, against the shared clients from ``llm_pool``. Runs
+entirely offline against the local fake OpenAI server.
+
+    cd backend
+    python -m benchmarks.bench_llm_pool --requests 200
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer, use_fake_openai
+
+
+def measure(label, make_llm, requests):
+    setup, total = [], []
+    for _ in range(requests):
+        started = time.perf_counter()
+        llm = make_llm()
+        built = time.perf_counter()
+        llm.invoke("ping")
+        finished = time.perf_counter()
+        setup.append(built - started)
+        total.append(finished - started)
+
+    print(
+        f"{label:>8}: setup {statistics.mean(setup) * 1000:7.3f} ms  "
+        f"request p50 {statistics.median(total) * 1000:7.3f} ms  "
+        f"mean {statistics.mean(total) * 1000:7.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer().start()
+    use_fake_openai(server)
+
+    # Imported after the environment points at the fake server
+    from langchain_openai import ChatOpenAI
+    import llm_pool
+    from agents import CustomAgents
+
+    def fresh():
+        return ChatOpenAI(model_name=CustomAgents.MODEL_NAME, temperature=CustomAgents.TEMPERATURE)
+
+    def pooled():
+        return llm_pool.get_registry().get_llm(CustomAgents.MODEL_NAME, CustomAgents.TEMPERATURE)
+
+    measure("fresh", fresh, args.requests)
+    fresh_connections = len(server.connections)
+
+    server.connections.clear()
+    measure("pooled", pooled, args.requests)
+    pooled_connections = len(server.connections)
+
+    print(f"TCP connections opened: fresh {fresh_connections}, pooled {pooled_connections}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Markdown clean-up cost on large plans: regex clean-up vs the single-pass normalizer
+
+Builds a README of about ``--size-kb`` KB (title, sections, a deep file
+tree and API docs) wrapped in a ```` ```markdown ```` fence, and times:
+
+* ``regex``: the previous ``clean_markdown_response``, which needs the
+  whole document and runs a DOTALL match over it
+* ``whole``: ``normalize_markdown`` on the whole document
+* ``chunked``: ``MarkdownNormalizer`` fed ``--chunk``-character pieces, as
+  streamed tokens reach it
+
+Both normalizer runs must produce the same text. ``--unclosed`` drops the
+wrapper's closing fence, the input where the DOTALL match scans the rest of
+the document from every newline and fails.
+
+    cd backend
+    python -m benchmarks.bench_markdown --size-kb 500
+"""
+import argparse
+import re
+import statistics
+import time
+
+from markdown_normalizer import MarkdownNormalizer, normalize_markdown
+
+
+def regex_clean(content):
+    """``clean_markdown_response`` before the normalizer replaced it"""
+    content = str(content).strip()
+    match = re.match(r'^```(?:markdown)?\s*\n(.*?)\n```$', content, re.DOTALL)
+    if match:
+        content = match.group(1).strip()
+    content = re.sub(r'^`{3,}(?:markdown)?\s*\n?', '', content)
+    content = re.sub(r'\n?`{3,}$', '', content)
+    return content.strip()
+
+
+def build_document(size_kb, unclosed):
+    parts = ["```markdown", "# Bench Project", "", "## Project Introduction", "",
+             "A generated plan used to time markdown clean-up. " * 8, ""]
+    feature = 0
+    while sum(len(part) + 1 for part in parts) < size_kb * 1024:
+        feature += 1
+        parts += [f"##Feature {feature} ##", "", "```", f"feature_{feature}/"]
+        for module in range(6):
+            last_module = module == 5
+            parts.append(f"{'└' if last_module else '├'}── module_{module}/")
+            for name in range(5):
+                column = "    " if last_module else "│   "
+                parts.append(f"{column}{'└' if name == 4 else '├'}── file_{name}.py  # Purpose of file {name}")
+        parts += ["```", "", f"### Feature {feature} API", ""]
+        parts += [f"- `GET /api/feature-{feature}/items/{n}/` returns item {n} with its details" for n in range(10)]
+        parts.append("")
+    if not unclosed:
+        parts.append("```")
+    return "\n".join(parts) + "\n"
+
+
+def chunked(text, size):
+    normalizer = MarkdownNormalizer()
+    out = [normalizer.feed(text[start:start + size]) for start in range(0, len(text), size)]
+    out.append(normalizer.finish())
+    return "".join(out)
+
+
+def timed(label, func, runs, size_kb):
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - started)
+    median = statistics.median(seconds)
+    print(f"{label:>8}: {median * 1000:8.2f} ms  {size_kb / 1024 / median:7.1f} MB/s  (median of {runs})")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-kb", type=int, default=500)
+    parser.add_argument("--chunk", type=int, default=16, help="characters per fed chunk, about a few tokens")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--unclosed", action="store_true", help="leave the wrapper fence unclosed")
+    args = parser.parse_args()
+
+    document = build_document(args.size_kb, args.unclosed)
+    size_kb = len(document.encode("utf-8")) / 1024
+    print(f"document: {size_kb:.0f} KB, {document.count(chr(10))} lines")
+    timed("regex", lambda: regex_clean(document), args.runs, size_kb)
+    whole = timed("whole", lambda: normalize_markdown(document), args.runs, size_kb)
+    streamed = timed("chunked", lambda: chunked(document, args.chunk), args.runs, size_kb)
+    if streamed != whole:
+        raise SystemExit("Chunked output differs from whole-document output")
+
+
+if __name__ == "__main__":
+    main()
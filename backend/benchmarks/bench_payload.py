@@ -0,0 +1,103 @@
+"""Plan response serialization time and bytes on the wire, JSON vs raw markdown
+
+For README plans of each ``--sizes`` size (in KB), builds the body of a
+``POST /api/generate-plan/`` response in both formats:
+
+* ``json``: the usual envelope rendered by DRF's ``JSONRenderer``, where
+  the plan is escaped into a JSON string
+* ``markdown``: the ``"format": "markdown"`` response, the plan encoded as is
+
+and sends each through ``CompressionMiddleware`` uncompressed, with gzip
+and, if the ``brotli`` package is installed, with brotli. Reports the bytes
+sent and the time to serialize plus compress.
+
+    cd backend
+    python -m benchmarks.bench_payload --sizes 10 50 200 500
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import time
+from pathlib import Path
+
+# Words of the project README, so plans compress like real prose does
+VOCABULARY = sorted(set(re.findall(r"[A-Za-z][A-Za-z_-]{2,}",
+                                   (Path(__file__).resolve().parents[2] / "README.md").read_text())))
+
+
+def build_plan(size_kb, seed=0):
+    """A README-shaped plan of about ``size_kb`` KB: sections, file trees and API lists"""
+    rng = random.Random(seed)
+
+    def words(count):
+        return " ".join(rng.choice(VOCABULARY) for _ in range(count))
+
+    parts = ["# Bench Project", "", "## Project Introduction", "", words(80) + ".", ""]
+    section = 0
+    while sum(len(part) + 1 for part in parts) < size_kb * 1024:
+        section += 1
+        name = rng.choice(VOCABULARY).lower()
+        parts += [f"## {words(3).title()}", "", words(40) + ".", "", "```", f"{name}/"]
+        for i in range(8):
+            connector = "└──" if i == 7 else "├──"
+            parts.append(f"{connector} {rng.choice(VOCABULARY).lower()}_{i}.py  # {words(6)}")
+        parts += ["```", "", f"### {words(2).title()} API", ""]
+        parts += [f"- `{rng.choice(['GET', 'POST', 'PUT', 'DELETE'])} /api/{name}/{rng.choice(VOCABULARY).lower()}/`: {words(10)}"
+                  for _ in range(6)]
+        parts.append("")
+    return "\n".join(parts)
+
+
+def timed(func, runs):
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - started)
+    return result, statistics.median(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 500], help="plan sizes in KB")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "buildpilot_api.settings")
+    import django
+    django.setup()
+    from rest_framework.renderers import JSONRenderer
+    from project_api import middleware
+    from project_api.middleware import CompressionMiddleware
+
+    compression = CompressionMiddleware(lambda request: None)
+    encodings = ["identity", "gzip"] + (["br"] if middleware.brotli is not None else [])
+    formats = {
+        "json": lambda plan: JSONRenderer().render({
+            "message": "success",
+            "plan": plan,
+            "plan_id": "0" * 32,
+            "download_url": f"/api/plans/{'0' * 32}/download/",
+            "run_id": "0" * 32,
+        }),
+        "markdown": lambda plan: plan.encode("utf-8"),
+    }
+
+    print(f"{'plan':>8} {'format':>9} {'encoding':>9} {'bytes':>9} {'ratio':>6} {'serialize':>10} {'compress':>9}")
+    for size_kb in args.sizes:
+        plan = build_plan(size_kb)
+        for name, serialize in formats.items():
+            body, serialize_seconds = timed(lambda: serialize(plan), args.runs)
+            for encoding in encodings:
+                if encoding == "identity":
+                    sent, compress_seconds = body, 0.0
+                else:
+                    sent, compress_seconds = timed(lambda: compression.compress(body, encoding), args.runs)
+                print(f"{len(plan) // 1024:>6}KB {name:>9} {encoding:>9} {len(sent):>9} "
+                      f"{len(sent) / len(body):>6.2f} {serialize_seconds * 1000:>8.2f}ms {compress_seconds * 1000:>7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
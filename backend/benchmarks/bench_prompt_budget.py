@@ -0,0 +1,203 @@
+"""Prompt tokens and latency before and after prompt budgeting
+
+Builds both task prompts for short, medium and oversized project
+descriptions, once with the original (pre-budgeting) prompt templates and
+once through ``CustomTasks``, then sends them to the in-process stub LLM.
+The stub charges ``--prefill-tokens-per-second`` for prompt processing, so
+latency reflects prompt size the way a real model's time to first token does.
+
+    cd backend
+    python -m benchmarks.bench_prompt_budget --prefill-tokens-per-second 5000
+"""
+import argparse
+import time
+from textwrap import dedent
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agents import DOCUMENTATION_SPECIALIST, PROJECT_PLANNER
+from benchmarks.stub_llm import StubChatModel
+from budget import count_tokens
+from instrumentation import estimate_cost
+from tasks import CustomTasks, PROJECT_ANALYSIS_OUTPUT, README_GENERATION_OUTPUT
+
+# The task templates as they were before budgeting, kept as the baseline
+LEGACY_ANALYSIS_PROMPT = dedent("""
+    Analyze the following project and create a comprehensive project plan:
+
+    Project Name: {project_name}
+    Project Description: {project_description}
+
+    Your analysis should emphasize and provide detailed coverage of:
+
+    1. **DETAILED PROJECT STRUCTURE PLANNING** (Primary Focus):
+       - Design a comprehensive file and directory structure
+       - Specify EVERY file that should be created with their exact purposes
+       - Include configuration files, utility files, and helper modules
+
+    2. API design:
+       - Design and document EVERY API endpoint
+       - Specify URL patterns and provide a brief explanation of what it does
+       - Plan authentication and authorization mechanisms
+
+    3. Supporting analysis sections:
+       - Technology stack recommendations with specific versions
+       - Project architecture overview and design patterns
+       - Potential challenges and specific solutions
+
+    IMPORTANT: Return only the plain text content without any markdown code block wrappers (no ```markdown or ``` tags).
+    """)
+
+LEGACY_ANALYSIS_OUTPUT = "A detailed project analysis with comprehensive project structure planning and API design as the main focus, in plain text format"
+
+LEGACY_README_PROMPT = dedent("""
+    Create a professional README.md file for the project "{project_name}":
+
+    Based on this analysis: {project_analysis}
+
+    The README should follow this structure and prioritize these sections:
+
+    1. **Project Introduction** (First Section):
+       - Project title: {project_name}
+       - Comprehensive project description and overview
+       - Technology stack and prerequisites
+
+    2. **DETAILED PROJECT STRUCTURE** (Primary Focus):
+       - List EVERY file and directory in the project
+       - Include file paths and organization logic
+       - Provide a comprehensive file tree structure
+
+    3. API documentation:
+       - Document EVERY API endpoint
+       - Include URL paths and brief explanation
+       - Explain API versioning and rate limiting if applicable
+
+    Make the project structure section extremely detailed.
+
+    Format it as a complete, professional README.md file with proper markdown formatting.
+
+    IMPORTANT: Return only the markdown content without wrapping it in code blocks.
+    Do NOT use ```markdown or ``` tags to wrap the output. Return the raw markdown content directly.
+    """)
+
+LEGACY_README_OUTPUT = "A complete, professional README.md file with detailed project structure as the main focus, in raw markdown format"
+
+BASE_DESCRIPTION = (
+    "A task management web app for small teams. Users sign up, create projects, "
+    "assign tasks with due dates and priorities, and comment on tasks. "
+    "It needs a REST API, a React frontend and email notifications. "
+)
+
+REQUIREMENT = (
+    "Requirement {i}: the {area} module must support filtering, sorting and "
+    "exporting records, with audit logging for every change. "
+)
+
+AREAS = ["billing", "reporting", "calendar", "search", "admin", "integrations", "mobile", "analytics"]
+
+
+def make_description(requirements, repeats=1):
+    """A project description with ``requirements`` distinct requirements
+
+    ``repeats`` pastes the requirements that many times, like users who
+    paste the same spec twice.
+    """
+    body = "".join(
+        REQUIREMENT.format(i=i, area=AREAS[i % len(AREAS)]) for i in range(requirements)
+    )
+    return BASE_DESCRIPTION + "\n\n" + "\n\n".join([body] * repeats)
+
+
+def messages(persona, description, expected_output):
+    # Same message layout as AsyncProjectPlanningService._ainvoke
+    return [
+        SystemMessage(content=(
+            f"You are {persona['role']}. {persona['backstory']}\n"
+            f"Your personal goal is: {persona['goal']}"
+        )),
+        HumanMessage(content=(
+            f"{description}\n\n"
+            f"This is the expected criteria for your final answer: {expected_output}"
+        )),
+    ]
+
+
+def legacy_prompts(name, description, analysis):
+    return (
+        messages(PROJECT_PLANNER, LEGACY_ANALYSIS_PROMPT.format(
+            project_name=name, project_description=description,
+        ), LEGACY_ANALYSIS_OUTPUT),
+        messages(DOCUMENTATION_SPECIALIST, LEGACY_README_PROMPT.format(
+            project_name=name, project_analysis=analysis,
+        ), LEGACY_README_OUTPUT),
+    )
+
+
+def budgeted_prompts(tasks, name, description, analysis):
+    return (
+        messages(PROJECT_PLANNER, tasks.analysis_prompt(name, description), PROJECT_ANALYSIS_OUTPUT),
+        messages(DOCUMENTATION_SPECIALIST, tasks.readme_prompt(name, analysis), README_GENERATION_OUTPUT),
+    )
+
+
+def measure(llm, stages, model_name):
+    prompt_tokens = sum(
+        count_tokens(str(message.content), model_name) for stage in stages for message in stage
+    )
+    started = time.perf_counter()
+    for stage in stages:
+        llm.invoke(stage)
+    return prompt_tokens, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before prompt processing")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=5000)
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="0 means instant")
+    parser.add_argument("--response-tokens", type=int, default=200)
+    parser.add_argument("--analysis-tokens", type=int, default=3000,
+                        help="Size of the analysis fed into the README prompt")
+    parser.add_argument("--description-budget", type=int, default=None)
+    parser.add_argument("--analysis-budget", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    tasks = CustomTasks(
+        description_budget=args.description_budget,
+        analysis_budget=args.analysis_budget,
+    )
+    llm = StubChatModel(
+        latency=args.latency,
+        prompt_tokens_per_second=args.prefill_tokens_per_second,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+    )
+    analysis = " ".join(
+        f"Component {i} lives in src/module_{i}.py and exposes /api/v1/resource_{i}/."
+        for i in range(args.analysis_tokens // 20)
+    )
+    cases = [
+        ("short", make_description(0)),
+        ("medium", make_description(20)),
+        ("long", make_description(150)),
+        ("pasted twice", make_description(60, repeats=2)),
+    ]
+
+    print(f"description budget {tasks.description_budget} tokens, "
+          f"analysis budget {tasks.analysis_budget} tokens, "
+          f"analysis {count_tokens(analysis)} tokens")
+    print(f"{'description':>14} {'input':>7} | {'before':>14} | {'after':>14} | {'saved':>6} {'cost saved':>11}")
+    for label, description in cases:
+        before_tokens, before_s = measure(llm, legacy_prompts("TaskFlow", description, analysis), tasks.model_name)
+        after_tokens, after_s = measure(llm, budgeted_prompts(tasks, "TaskFlow", description, analysis), tasks.model_name)
+        saved = 1 - after_tokens / before_tokens
+        cost_saved = (estimate_cost(tasks.model_name, before_tokens, 0)
+                      - estimate_cost(tasks.model_name, after_tokens, 0))
+        print(f"{label:>14} {count_tokens(description):>7} | "
+              f"{before_tokens:>6} {before_s * 1000:>5.0f} ms | "
+              f"{after_tokens:>6} {after_s * 1000:>5.0f} ms | "
+              f"{saved:>6.1%} ${cost_saved * 1000:>9.4f}/1k")
+
+
+if __name__ == "__main__":
+    main()
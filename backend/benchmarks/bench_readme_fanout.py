@@ -0,0 +1,72 @@
+"""README stage wall time: one long completion vs concurrent section fan-out
+
+Runs the pipeline against the in-process stub LLM, once with the README
+written in a single completion of ``--response-tokens`` tokens and once
+with ``PLAN_README_FANOUT`` on, where each of the README sections is a
+separate completion of an equal share of those tokens. Generation speed
+(``--tokens-per-second``) dominates real README calls, so the README
+stage should shrink roughly by the number of sections.
+
+    cd backend
+    python -m benchmarks.bench_readme_fanout --tokens-per-second 200 --response-tokens 600
+"""
+import argparse
+import os
+import statistics
+import tempfile
+
+
+def setup_environment():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "buildpilot_api.settings")
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "sk-fake"
+    os.environ.setdefault("OTEL_SDK_DISABLED", "true")  # No crewai telemetry calls
+    os.environ["PLAN_CACHE_BACKEND"] = "none"
+    # Pipeline checkpoints go to a throwaway directory
+    os.environ["GENERATED_PLANS_DIR"] = tempfile.mkdtemp(prefix="bench-fanout-")
+
+    import django
+    django.setup()
+
+
+def measure(label, fanout, args, response_tokens):
+    from benchmarks.stub_llm import install_stub_llm
+    from project_api.ai_service import ProjectPlanningService
+    from tasks import CustomTasks
+
+    install_stub_llm(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                     response_tokens=response_tokens)
+    readme, total = [], []
+    for i in range(args.runs):
+        service = ProjectPlanningService()
+        service.tasks = CustomTasks(readme_fanout=fanout)
+        run = service.new_run()
+        # A distinct name per run so no run resumes or coalesces with another
+        service.generate_project_plan(f"Bench {label} {i}", "A todo app with a REST API.",
+                                      use_cache=False, timings=run)
+        timings = run.to_dict()
+        readme.append(timings["stages"]["readme"]["seconds"])
+        total.append(timings["total_seconds"])
+    print(f"{label:>8}: readme stage {statistics.median(readme):7.3f} s  "
+          f"total {statistics.median(total):7.3f} s  (median of {args.runs})")
+    return statistics.median(readme)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--response-tokens", type=int, default=600, help="tokens in the whole README")
+    args = parser.parse_args()
+
+    setup_environment()
+    from tasks import README_SECTIONS
+
+    sections = len(README_SECTIONS)
+    single = measure("single", False, args, args.response_tokens)
+    fanout = measure("fan-out", True, args, args.response_tokens // sections)
+    print(f"{sections} sections: README stage {single / fanout:.1f}x faster with fan-out")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""LLM calls against a throttling, stalling API: plain client vs resilient transport
+
+Starts the fake OpenAI server with a request rate limit and periodic stalls,
+then sends the same workload through:
+
+  * ``plain``: ChatOpenAI over a plain pooled httpx client, relying on the
+    OpenAI SDK's default retries;
+  * ``resilient``: the transport ``llm_pool`` uses (header-driven pacing,
+    jittered retries), optionally with hedging (``--hedge``).
+
+    cd backend
+    python -m benchmarks.bench_resilience --requests 80 --concurrency 8 \\
+        --requests-per-minute 1200 --burst 10 --stall-every 15 --stall-seconds 3 --hedge
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.run_benchmark import percentile
+from llm_transport import LatencyTracker, ResilientTransport, RetryPolicy
+
+
+def make_plain(server):
+    return ChatOpenAI(
+        model_name="gpt-4o-mini",
+        api_key="sk-fake",
+        base_url=server.base_url,
+        http_client=httpx.Client(limits=httpx.Limits(max_connections=20)),
+    ), None
+
+
+def make_resilient(server, hedge, min_samples):
+    policy = RetryPolicy(
+        max_retries=6,
+        base_delay=0.25,
+        hedge=hedge,
+        latency=LatencyTracker(min_samples=min_samples),
+    )
+    transport = ResilientTransport(httpx.HTTPTransport(limits=httpx.Limits(max_connections=20)), policy)
+    return ChatOpenAI(
+        model_name="gpt-4o-mini",
+        api_key="sk-fake",
+        base_url=server.base_url,
+        max_retries=0,
+        http_client=httpx.Client(transport=transport),
+    ), policy
+
+
+def run(label, args, make_llm):
+    server = FakeOpenAIServer(
+        latency=args.latency,
+        response_tokens=args.response_tokens,
+        requests_per_minute=args.requests_per_minute,
+        burst=args.burst,
+        stall_every=args.stall_every,
+        stall_seconds=args.stall_seconds,
+    ).start()
+    llm, policy = make_llm(server)
+    latencies, errors = [], []
+
+    def one(index):
+        started = time.perf_counter()
+        try:
+            llm.invoke(f"Plan project {index}")
+        except Exception as e:
+            errors.append(type(e).__name__)
+            return
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"{label:>10}: ok {len(latencies)}/{args.requests}  "
+          f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+          f"mean {statistics.mean(latencies) * 1000 if latencies else 0:7.1f} ms  "
+          f"wall {elapsed:5.2f} s  server 429s {server.throttled}")
+    if policy is not None:
+        stats = policy.stats()
+        print(f"{'':>10}  retries {stats['retries']}  hedges {stats['hedges']} "
+              f"(won {stats['hedge_wins']})")
+    if errors:
+        print(f"{'':>10}  errors: {', '.join(sorted(set(errors)))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=80)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--response-tokens", type=int, default=50)
+    parser.add_argument("--requests-per-minute", type=int, default=1200)
+    parser.add_argument("--burst", type=int, default=10, help="Rate limit bucket size")
+    parser.add_argument("--stall-every", type=int, default=15)
+    parser.add_argument("--stall-seconds", type=float, default=3.0)
+    parser.add_argument("--hedge", action="store_true", help="Hedge calls slower than the recent p95")
+    parser.add_argument("--hedge-min-samples", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    print(f"{args.requests} requests at concurrency {args.concurrency}; server allows "
+          f"{args.requests_per_minute}/min (burst {args.burst}) and stalls every {args.stall_every}th request "
+          f"for {args.stall_seconds:g} s")
+    run("plain", args, make_plain)
+    run("resilient", args, lambda server: make_resilient(server, args.hedge, args.hedge_min_samples))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Interactive queue wait under bulk load, one FIFO queue vs fair priority lanes
+
+Simulates generations as sleeps of about ``--hold`` seconds behind an
+``AdmissionController`` with ``--slots`` slots. ``--interactive-clients``
+clients each send a request, wait for it and pause, for ``--duration``
+seconds. Three runs:
+
+* ``idle``: interactive clients only
+* ``fifo``: one bulk client also pushes ``--bulk-threads`` generations at a
+  time, everyone in a single FIFO queue (all requests in one lane, no
+  batch cap), as before the scheduler
+* ``fair``: the bulk client's work goes to the batch lane, which may use
+  ``--batch-slots`` slots and waits behind interactive requests
+
+Reports interactive queue wait and execution time, and the bulk client's
+throughput. Interactive p95 wait under ``fair`` should stay close to
+``idle``.
+
+    cd backend
+    python -m benchmarks.bench_scheduler --duration 10
+"""
+import argparse
+import os
+import random
+import statistics
+import threading
+import time
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def simulate(controller, args, bulk_lane=None, fifo=False):
+    from project_api.scheduler import INTERACTIVE
+
+    deadline = time.monotonic() + args.duration
+    waits, holds, bulk_done = [], [], [0]
+    lock = threading.Lock()
+
+    def generate(client, lane, rng):
+        if fifo:
+            # A client of its own per request turns round-robin into arrival order
+            client = object()
+        started = time.monotonic()
+        with controller.admit(client, lane=lane):
+            admitted = time.monotonic()
+            time.sleep(rng.uniform(0.5, 1.5) * args.hold)
+        return admitted - started, time.monotonic() - admitted
+
+    def interactive(index):
+        rng = random.Random(index)
+        while time.monotonic() < deadline:
+            waited, held = generate(f"user-{index}", INTERACTIVE, rng)
+            with lock:
+                waits.append(waited)
+                holds.append(held)
+            time.sleep(rng.expovariate(1 / args.think))
+
+    def bulk(index):
+        rng = random.Random(1000 + index)
+        while time.monotonic() < deadline:
+            generate("bulk", bulk_lane, rng)
+            with lock:
+                bulk_done[0] += 1
+
+    threads = [threading.Thread(target=interactive, args=(i,)) for i in range(args.interactive_clients)]
+    if bulk_lane is not None:
+        threads += [threading.Thread(target=bulk, args=(i,)) for i in range(args.bulk_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return waits, holds, bulk_done[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--batch-slots", type=int, default=4)
+    parser.add_argument("--hold", type=float, default=0.2, help="mean generation time in seconds")
+    parser.add_argument("--think", type=float, default=0.5, help="mean pause between a client's requests")
+    parser.add_argument("--interactive-clients", type=int, default=8)
+    parser.add_argument("--bulk-threads", type=int, default=32)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "buildpilot_api.settings")
+    import django
+    django.setup()
+    from project_api.admission import AdmissionController
+    from project_api.scheduler import BATCH, INTERACTIVE
+
+    unbounded = dict(max_per_client=10 ** 6, max_queue=10 ** 6, queue_timeout=None)
+    runs = {
+        "idle": (AdmissionController(args.slots, batch_slots=args.batch_slots, **unbounded), None, False),
+        "fifo": (AdmissionController(args.slots, **unbounded), INTERACTIVE, True),
+        "fair": (AdmissionController(args.slots, batch_slots=args.batch_slots, **unbounded), BATCH, False),
+    }
+
+    print(f"{'run':>5} {'requests':>9} {'wait p50':>9} {'wait p95':>9} {'wait max':>9} "
+          f"{'exec p50':>9} {'exec p95':>9} {'bulk/s':>7}")
+    for name, (controller, bulk_lane, fifo) in runs.items():
+        waits, holds, bulk_done = simulate(controller, args, bulk_lane, fifo)
+        print(f"{name:>5} {len(waits):>9} {statistics.median(waits) * 1000:>7.1f}ms "
+              f"{percentile(waits, 0.95) * 1000:>7.1f}ms {max(waits) * 1000:>7.1f}ms "
+              f"{statistics.median(holds) * 1000:>7.1f}ms {percentile(holds, 0.95) * 1000:>7.1f}ms "
+              f"{bulk_done / args.duration:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Similarity cache lookup latency against index size
+
+Fills a ``SimilarPlanIndex`` with synthetic project descriptions (kind of
+app, frontend, backend, database and an extra feature) and times lookups
+of reworded descriptions at each ``--sizes`` index size. A lookup reads
+the query's columns of every entry, and the first one after an add also
+refreshes the row norms, so both grow linearly with the entries, which
+``PLAN_SIMILARITY_MAX_ENTRIES`` caps. Also reports how many rewordings of an
+indexed description are found (hits) and how many descriptions of a
+different app are wrongly matched (false hits) at ``--threshold``.
+
+    cd backend
+    python -m benchmarks.bench_similarity --sizes 100 1000 5000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+# Each kind of app with the features a description of it usually lists
+KINDS = {
+    "todo list": "tasks with due dates, reminders and shared lists",
+    "blog": "posts, comments, tags and an editor",
+    "chat": "channels, direct messages and typing indicators",
+    "online shop": "product catalog, cart, checkout and order history",
+    "weather dashboard": "forecasts, maps and saved locations",
+    "recipe manager": "recipes, ingredients, meal plans and shopping lists",
+    "fitness tracker": "workouts, goals, progress charts and streaks",
+    "note taking": "notebooks, rich text notes and tags",
+    "inventory system": "stock levels, suppliers and purchase orders",
+    "booking platform": "availability calendars, reservations and reminders",
+    "expense tracker": "expenses, budgets, categories and monthly reports",
+    "kanban board": "boards, columns, cards and assignees",
+    "forum": "threads, replies, votes and moderation",
+    "url shortener": "short links, click analytics and custom aliases",
+    "survey builder": "questions, responses and result charts",
+    "job board": "job postings, applications and company profiles",
+}
+FRONTENDS = ["React", "Vue", "Angular", "Svelte", "Next.js"]
+BACKENDS = ["Django", "Flask", "Rails", "Express", "FastAPI", "Spring Boot", "Laravel"]
+DATABASES = ["PostgreSQL", "MySQL", "MongoDB", "SQLite"]
+FEATURES = ["user authentication", "dark mode", "email notifications", "an admin panel",
+            "file uploads", "real-time updates", "payments", "full-text search"]
+
+# The first template is what gets indexed; the others reword it
+TEMPLATES = [
+    "A {kind} app with {details}. Use {front} and {back} with {db}, and add {feature}.",
+    "{front} + {back} {kind}: {details}, plus {feature}. Data is stored in {db}.",
+    "Build a {kind} application ({front} frontend, {back} API, {db} database) with {details} and {feature}.",
+]
+
+
+def project(rng):
+    kind = rng.choice(list(KINDS))
+    return dict(kind=kind, details=KINDS[kind], front=rng.choice(FRONTENDS), back=rng.choice(BACKENDS),
+                db=rng.choice(DATABASES), feature=rng.choice(FEATURES))
+
+
+def describe(fields, template=0):
+    return TEMPLATES[template].format(**fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--dimensions", type=int, default=2048)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "buildpilot_api.settings")
+    import django
+    django.setup()
+    from project_api.similarity import SimilarPlanIndex
+
+    for size in args.sizes:
+        rng = random.Random(size)
+        index = SimilarPlanIndex(threshold=args.threshold, max_entries=size, dimensions=args.dimensions)
+        projects = [project(rng) for _ in range(size)]
+        for i, fields in enumerate(projects):
+            index.add(describe(fields), f"Project {i}", f"# Project {i}")
+
+        # The first lookup after adding plans also refreshes the IDF and row norms
+        started = time.perf_counter()
+        index.lookup(describe(projects[0]))
+        refresh = time.perf_counter() - started
+
+        seconds, hits, false_hits = [], 0, 0
+        for i in range(args.lookups):
+            fields = rng.choice(projects)
+            if i % 2:
+                # The same project, reworded
+                query = describe(fields, template=rng.randrange(1, len(TEMPLATES)))
+            else:
+                # A different kind of app on the same stack
+                kind = rng.choice([kind for kind in KINDS if kind != fields["kind"]])
+                query = describe(dict(fields, kind=kind, details=KINDS[kind]))
+            started = time.perf_counter()
+            match = index.lookup(query)
+            seconds.append(time.perf_counter() - started)
+            if match is not None:
+                if i % 2:
+                    hits += 1
+                elif projects[match_index(match)]["kind"] != kind:
+                    false_hits += 1
+
+        reworded = args.lookups // 2
+        memory_mb = index._vectors.nbytes / 2 ** 20
+        print(f"{size:>6} entries ({memory_mb:5.1f} MB): lookup p50 {statistics.median(seconds) * 1000:6.2f} ms  "
+              f"p99 {sorted(seconds)[int(len(seconds) * 0.99)] * 1000:6.2f} ms  "
+              f"after an add {refresh * 1000:6.2f} ms  "
+              f"hits {hits}/{reworded}  false hits {false_hits}/{args.lookups - reworded}")
+
+
+def match_index(match):
+    return int(match.project_name.split()[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Startup import cost of the CLI and Django workers, from ``-X importtime``
+
+Each target runs in a fresh interpreter with ``python -X importtime`` and
+reports its wall time and the slowest top-level imports. ``django`` is what
+a worker loads before serving its first request (e.g. a health check),
+``cli`` is ``main.py`` up to its prompts, and ``generation`` adds the crew
+and LLM libraries the first plan generation loads (or ``PLAN_PRELOAD``).
+The first two must not import crewai or LangChain at all.
+
+Times are compared with ``startup_baseline.json``; ``--check`` exits
+non-zero when a target is more than ``--tolerance`` slower than its
+baseline or imports a library it should load lazily. The fastest of
+``--runs`` interpreters still varies by about 10% from one invocation to
+the next, so the checked-in baseline is the median of several invocations
+rather than a single ``--save-baseline`` run; refresh it the same way after
+an intended change.
+
+    cd backend
+    python -m benchmarks.bench_startup --check
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BASELINE = Path(__file__).with_name("startup_baseline.json")
+
+DJANGO_SETUP = "import django; django.setup(); import buildpilot_api.urls"
+
+TARGETS = {
+    "django": DJANGO_SETUP,
+    "cli": "import main",
+    "generation": DJANGO_SETUP + "; from project_api.ai_service import preload; preload()",
+}
+
+# Libraries that only plan generation needs
+LAZY_MODULES = ("crewai", "langchain_core", "langchain_openai")
+EAGER_ALLOWED = {"generation"}
+
+# Run in the child: time the target and list which lazy libraries it loaded
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+{code}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def parse_importtime(stderr):
+    """``(module, cumulative seconds)`` of the top-level imports in ``-X importtime`` output"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # Nested imports are indented under their importer
+            imports.append((name.strip(), int(cumulative) / 1e6))
+    return imports
+
+
+def measure(code, runs):
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE="buildpilot_api.settings",
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY") or "sk-fake",
+        OTEL_SDK_DISABLED="true",
+        PLAN_PRELOAD="false",
+    )
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-W", "ignore", "-c",
+             CHILD.format(code=code, lazy=LAZY_MODULES)],
+            capture_output=True, text=True, env=env, check=True,
+        )
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        data["imports"] = parse_importtime(result.stderr)
+        if best is None or data["seconds"] < best["seconds"]:
+            best = data
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per target; the fastest counts")
+    parser.add_argument("--top", type=int, default=5, help="slowest top-level imports to list")
+    parser.add_argument("--check", action="store_true", help="exit 1 on a regression against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over the baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    results, failures = {}, []
+    for name, code in TARGETS.items():
+        data = measure(code, args.runs)
+        results[name] = round(data["seconds"], 3)
+        expected = baseline.get(name)
+        versus = f" (baseline {expected:.3f} s)" if expected else ""
+        print(f"{name:>10}: {data['seconds']:.3f} s{versus}")
+        for module, seconds in sorted(data["imports"], key=lambda item: -item[1])[:args.top]:
+            print(f"{'':>12}{seconds:7.3f} s  {module}")
+
+        if data["loaded"] and name not in EAGER_ALLOWED:
+            failures.append(f"{name} imports {', '.join(data['loaded'])} at startup")
+        if expected and data["seconds"] > expected * (1 + args.tolerance):
+            failures.append(f"{name} takes {data['seconds']:.3f} s, baseline {expected:.3f} s")
+
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline saved to {BASELINE}")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Local stand-in for the OpenAI chat completions API
+
+Lets benchmarks exercise the real ChatOpenAI/HTTP stack without network
+access or API spend. Responses are deterministic: a markdown document of
+``response_tokens`` tokens, delivered after ``latency`` seconds at
+``tokens_per_second`` (or instantly when that is 0). Streaming requests are
+answered with server-sent chunks like the real API. Point clients at it
+with ``use_fake_openai(server)``.
+
+It can also misbehave like the real API under load. ``requests_per_minute``
+enforces a request rate limit with OpenAI's ``x-ratelimit-*`` headers and
+429 responses carrying ``retry-after-ms``. ``stall_every``/``stall_seconds``
+make every Nth request hang before answering.
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_plan_tokens(count):
+    """Deterministic markdown tokens shaped roughly like a generated README
+
+    Starts with the ReAct-style final answer marker that crew agents ask the
+    model for, so each agent finishes in a single LLM call as with the real API.
+    """
+    tokens = [
+        "Thought: I now can give a great answer\nFinal Answer: ",
+        "# Fake Project\n\n",
+        "## Project Structure\n\n",
+        "```\n",
+        "project/\n",
+    ]
+    i = 0
+    while len(tokens) < count - 1:
+        tokens.append(f"├── module_{i}.py\n" if i % 8 else f"\n## Section {i // 8}\n\n")
+        i += 1
+    tokens.append("```\n")
+    return tokens[:max(count, 1)]
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        number = self.server.record_request(self.client_address)
+
+        allowed, rate_headers, wait = self.server.take_rate_limit()
+        if not allowed:
+            self._throttled(rate_headers, wait)
+            return
+        self._rate_headers = rate_headers
+        if self.server.stall_every and number % self.server.stall_every == 0:
+            time.sleep(self.server.stall_seconds)
+
+        prompt = " ".join(str(m.get("content", "")) for m in request.get("messages", []))
+        tokens = fake_plan_tokens(self.server.response_tokens)
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": len(tokens),
+            "total_tokens": estimate_tokens(prompt) + len(tokens),
+        }
+
+        time.sleep(self.server.latency)
+        if request.get("stream"):
+            self._stream(request, tokens, usage)
+        else:
+            self._complete(request, tokens, usage)
+
+    def end_headers(self):
+        for name, value in getattr(self, "_rate_headers", {}).items():
+            self.send_header(name, value)
+        super().end_headers()
+
+    def _throttled(self, rate_headers, wait):
+        body = json.dumps({"error": {
+            "message": "Rate limit reached for requests",
+            "type": "requests",
+            "code": "rate_limit_exceeded",
+        }}).encode("utf-8")
+        self._rate_headers = dict(rate_headers, **{"retry-after-ms": str(int(wait * 1000))})
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _token_delay(self):
+        tps = self.server.tokens_per_second
+        return 1.0 / tps if tps else 0.0
+
+    def _complete(self, request, tokens, usage):
+        time.sleep(self._token_delay() * len(tokens))
+        body = json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, request, tokens, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        delay = self._token_delay()
+        for i, token in enumerate(tokens):
+            last = i == len(tokens) - 1
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": token} if i == 0 else {"content": token},
+                    "finish_reason": "stop" if last else None,
+                }],
+            }
+            if last:
+                chunk["usage"] = usage
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            if delay:
+                time.sleep(delay)
+
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, tokens_per_second=0,
+                 response_tokens=200, requests_per_minute=0, burst=None, stall_every=0,
+                 stall_seconds=0.0, handler=FakeOpenAIHandler):
+        super().__init__((host, port), handler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst or requests_per_minute  # Bucket size; OpenAI allows a minute's worth
+        self.stall_every = stall_every
+        self.stall_seconds = stall_seconds
+        self.requests = 0
+        self.throttled = 0
+        self.connections = set()
+        self._stats_lock = threading.Lock()
+        self._bucket = float(self.burst)
+        self._bucket_updated = time.monotonic()
+
+    def handle_error(self, request, client_address):
+        # Clients drop connections on purpose (hedged or cancelled requests)
+        pass
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record_request(self, client_address):
+        with self._stats_lock:
+            self.requests += 1
+            self.connections.add(client_address)
+            return self.requests
+
+    def take_rate_limit(self):
+        """``(allowed, x-ratelimit headers, seconds until a request is available)``"""
+        if not self.requests_per_minute:
+            return True, {}, 0.0
+        rate = self.requests_per_minute / 60.0
+        with self._stats_lock:
+            now = time.monotonic()
+            self._bucket = min(self.burst, self._bucket + (now - self._bucket_updated) * rate)
+            self._bucket_updated = now
+            allowed = self._bucket >= 1
+            if allowed:
+                self._bucket -= 1
+            else:
+                self.throttled += 1
+            remaining = int(self._bucket)
+            headers = {
+                "x-ratelimit-limit-requests": str(self.burst),
+                "x-ratelimit-remaining-requests": str(remaining),
+                "x-ratelimit-reset-requests": f"{(self.burst - self._bucket) / rate:.3f}s",
+            }
+            return allowed, headers, (1 - self._bucket) / rate if not allowed else 0.0
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def use_fake_openai(server):
+    """Point OpenAI clients created from now on at ``server``"""
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "sk-fake"
+    os.environ["OPENAI_API_BASE"] = server.base_url
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the fake OpenAI server")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--response-tokens", type=int, default=400)
+    parser.add_argument("--requests-per-minute", type=int, default=0, help="0 means no rate limit")
+    parser.add_argument("--burst", type=int, default=None, help="Rate limit bucket size")
+    parser.add_argument("--stall-every", type=int, default=0, help="Stall every Nth request; 0 never")
+    parser.add_argument("--stall-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        port=args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        requests_per_minute=args.requests_per_minute,
+        burst=args.burst,
+        stall_every=args.stall_every,
+        stall_seconds=args.stall_seconds,
+    )
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
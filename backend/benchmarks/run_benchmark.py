@@ -0,0 +1,216 @@
+"""Offline throughput/latency benchmark for plan generation
+
+Swaps the OpenAI client for an in-process stub (``--backend stub``) or the
+local fake OpenAI server (``--backend server``), then drives either
+``ProjectPlanningService`` directly or ``POST /api/generate-plan/`` through
+Django's test client at the requested concurrency. No network access or
+API key is needed, and the same flags give the same workload every run.
+With ``--backend server`` crewai's token counter also tries to fetch its
+tiktoken encoding; pre-populate ``TIKTOKEN_CACHE_DIR`` to keep that offline.
+
+    cd backend
+    python -m benchmarks.run_benchmark --target api --concurrency 8 --requests 64 \\
+        --latency 0.2 --tokens-per-second 500 --response-tokens 400
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def setup_environment(args):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "buildpilot_api.settings")
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "sk-fake"
+    os.environ.setdefault("OTEL_SDK_DISABLED", "true")  # No crewai telemetry calls
+    # Measure generation itself, not the plan cache or request coalescing
+    os.environ["PLAN_CACHE_BACKEND"] = "none"
+
+    server = None
+    if args.backend == "server":
+        from benchmarks.fake_openai import FakeOpenAIServer, use_fake_openai
+        server = FakeOpenAIServer(
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            response_tokens=args.response_tokens,
+        ).start()
+        use_fake_openai(server)
+
+    import django
+    django.setup()
+
+    if args.backend == "stub":
+        from benchmarks.stub_llm import install_stub_llm
+        install_stub_llm(
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            response_tokens=args.response_tokens,
+        )
+    else:
+        import llm_pool
+        llm_pool.reload()
+    return server
+
+
+def record_stages(stages, timings):
+    for name, summary in timings["stages"].items():
+        stages.setdefault(name, []).append(summary["seconds"])
+
+
+def make_service_runner():
+    from project_api.ai_service import ProjectPlanningService
+
+    def run(index, stages):
+        service = ProjectPlanningService()
+        timings = service.new_run()
+        service.generate_project_plan(
+            f"Benchmark Project {index}",
+            f"A benchmark project number {index} with a REST API and a web frontend.",
+            use_cache=False,
+            timings=timings,
+        )
+        record_stages(stages, timings.to_dict())
+
+    return run
+
+
+def make_api_runner():
+    from django.test import Client
+
+    def run(index, stages):
+        client = Client(HTTP_HOST="localhost")
+        response = client.post(
+            "/api/generate-plan/",
+            {
+                "project_name": f"Benchmark Project {index}",
+                "project_description": f"A benchmark project number {index} with a REST API and a web frontend.",
+                "use_cache": False,
+                "include_timings": True,
+            },
+            content_type="application/json",
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.content[:200]!r}")
+        record_stages(stages, response.json()["timings"])
+
+    return run
+
+
+def run_benchmark(args):
+    runner = make_service_runner() if args.target == "service" else make_api_runner()
+    stages = {}
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(index):
+        started = time.perf_counter()
+        try:
+            runner(index, stages)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    # Warm up imports, clients and agent templates outside the measurement
+    for i in range(args.warmup):
+        one(-1 - i)
+    latencies.clear()
+    errors.clear()
+    stages.clear()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "target": args.target,
+        "backend": args.backend,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": elapsed,
+        "requests_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "mean": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        },
+        "stage_ms": {
+            name: statistics.mean(values) * 1000
+            for name, values in stages.items() if values
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_report(result):
+    print(f"target={result['target']} backend={result['backend']} "
+          f"concurrency={result['concurrency']} requests={result['requests']} "
+          f"errors={result['errors']}")
+    if result["first_error"]:
+        print(f"  first error: {result['first_error']}")
+    latency = result["latency_ms"]
+    print(f"  throughput: {result['requests_per_s']:.2f} req/s over {result['elapsed_s']:.2f} s")
+    print(f"  latency ms: p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+          f"p99 {latency['p99']:.1f}  mean {latency['mean']:.1f}")
+    for name, value in result["stage_ms"].items():
+        print(f"  stage {name:>14}: {value:.1f} ms mean")
+    print(f"  peak RSS: {result['peak_rss_mb']:.1f} MB")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["service", "api"], default="service")
+    parser.add_argument("--backend", choices=["stub", "server"], default="stub")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="0 means instant")
+    parser.add_argument("--response-tokens", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = setup_environment(args)
+    try:
+        result = run_benchmark(args)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""In-process stand-in for ChatOpenAI
+
+Same deterministic output and pacing as the fake server, but without any
+HTTP, so benchmarks isolate the backend's own overhead. Install it with
+``install_stub_llm(...)``, which swaps it into the LLM client registry.
+"""
+import asyncio
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from benchmarks.fake_openai import estimate_tokens, fake_plan_tokens
+
+
+class StubChatModel(BaseChatModel):
+    # Deliberately ``model`` rather than ``model_name``: crewai only attaches
+    # its tiktoken-based token counter when ``model_name`` is present, and
+    # that counter downloads encodings from the network.
+    model: str = "stub"
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    response_tokens: int = 200
+    # Prompt processing speed; 0 means prompt size does not affect latency
+    prompt_tokens_per_second: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "stub-chat"
+
+    def _usage(self, messages, tokens):
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+
+    def _combine_llm_outputs(self, llm_outputs):
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        for output in llm_outputs:
+            for key, value in ((output or {}).get("token_usage") or {}).items():
+                usage[key] = usage.get(key, 0) + value
+        return {"token_usage": usage, "model_name": self.model}
+
+    def _token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _first_token_delay(self, messages):
+        if not self.prompt_tokens_per_second:
+            return self.latency
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        return self.latency + prompt_tokens / self.prompt_tokens_per_second
+
+    def _result(self, messages, tokens):
+        usage = self._usage(messages, tokens)
+        message = AIMessage(content="".join(tokens), response_metadata={"token_usage": usage})
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": usage, "model_name": self.model},
+        )
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        tokens = fake_plan_tokens(self.response_tokens)
+        time.sleep(self._first_token_delay(messages) + self._token_delay() * len(tokens))
+        return self._result(messages, tokens)
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        tokens = fake_plan_tokens(self.response_tokens)
+        await asyncio.sleep(self._first_token_delay(messages) + self._token_delay() * len(tokens))
+        return self._result(messages, tokens)
+
+    def _stream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        time.sleep(self._first_token_delay(messages))
+        delay = self._token_delay()
+        for token in fake_plan_tokens(self.response_tokens):
+            if delay:
+                time.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def install_stub_llm(latency=0.0, tokens_per_second=0.0, response_tokens=200):
+    """Make every agent built from now on use the in-process stub"""
+    import llm_pool
+
+    def factory(model_name, temperature, streaming, callbacks):
+        return StubChatModel(
+            model=model_name,
+            latency=latency,
+            tokens_per_second=tokens_per_second,
+            response_tokens=response_tokens,
+            callbacks=callbacks,
+        )
+
+    return llm_pool.reload(llm_factory=factory)
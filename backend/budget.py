@@ -0,0 +1,100 @@
+import logging
+import os
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Token budgets for the variable parts of the task prompts; 0 disables trimming
+DESCRIPTION_TOKEN_BUDGET = int(os.getenv('PROMPT_DESCRIPTION_TOKEN_BUDGET', '1500'))
+ANALYSIS_TOKEN_BUDGET = int(os.getenv('PROMPT_ANALYSIS_TOKEN_BUDGET', '6000'))
+
+# Share of a trimmed text's budget kept from its beginning; the rest comes from the end
+HEAD_SHARE = 0.7
+
+TRIM_MARKER = "[... trimmed to fit the prompt budget ...]"
+
+
+@lru_cache(maxsize=8)
+def _encoding(model_name):
+    """tiktoken encoding for ``model_name``, or None to fall back to estimates"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken missing, or its encoding files can't be fetched offline
+        return None
+
+
+def count_tokens(text, model_name="gpt-4o-mini"):
+    """Number of tokens ``text`` uses for ``model_name``"""
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def fit_to_budget(text, max_tokens, model_name="gpt-4o-mini", label="text"):
+    """``text`` as it is if it fits ``max_tokens``, otherwise with its middle trimmed
+
+    The opening (usually the project summary) and the ending (usually the
+    most specific requirements) are kept, split by ``HEAD_SHARE``. Cuts fall
+    on line boundaries, so markdown lists, tables and file trees keep their
+    layout.
+    """
+    text = str(text)
+    tokens = count_tokens(text, model_name)
+    if not max_tokens or tokens <= max_tokens:
+        return text
+
+    marker_tokens = count_tokens(TRIM_MARKER, model_name)
+    available = max(max_tokens - marker_tokens, 1)
+    lines = text.split("\n")
+    head = _take(lines, int(available * HEAD_SHARE), model_name)
+    head_tokens = count_tokens("\n".join(head), model_name) if head else 0
+    tail = _take(lines[len(head):], available - head_tokens, model_name, from_end=True)
+    trimmed = "\n".join(head + [TRIM_MARKER] + tail)
+
+    logger.info("Prompt budget for %s: trimmed %d -> %d tokens (budget %d)",
+                label, tokens, count_tokens(trimmed, model_name), max_tokens)
+    return trimmed
+
+
+def _take(lines, max_tokens, model_name, from_end=False):
+    """Whole lines from the start (or end) of ``lines`` within ``max_tokens``
+
+    Only a first line that is too long on its own is cut.
+    """
+    if max_tokens <= 0:
+        return []
+    if from_end:
+        lines = lines[::-1]
+
+    taken, used = [], 0
+    for line in lines:
+        cost = count_tokens(line, model_name) + 1  # The newline
+        if used + cost > max_tokens:
+            if not taken:
+                piece = _cut(line, max_tokens - 1, model_name, from_end)
+                if piece.strip():
+                    taken.append(piece)
+            break
+        taken.append(line)
+        used += cost
+
+    if from_end:
+        taken.reverse()
+    return taken
+
+
+def _cut(text, max_tokens, model_name, from_end=False):
+    """Characters from the start (or end) of ``text`` within ``max_tokens``"""
+    chars = max(max_tokens, 0) * 4
+    while chars > 0:
+        piece = text[-chars:] if from_end else text[:chars]
+        if count_tokens(piece, model_name) <= max_tokens:
+            return piece.lstrip() if from_end else piece.rstrip()
+        chars = int(chars * 0.9)
+    return ""
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'project_api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,11 +89,124 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Serve /api/health/ and /api/generate-plan/ with the native async views.
+# asgi.py turns this on, so ASGI deployments get them by default.
+ASYNC_VIEWS = os.getenv('DJANGO_ASYNC_VIEWS', 'False').lower() == 'true'
+
+# Background plan generation jobs (POST /api/generate-plan/ with "mode": "async")
+PLAN_JOB_WORKERS = int(os.getenv('PLAN_JOB_WORKERS', '4'))
+PLAN_JOB_MAX_PENDING = int(os.getenv('PLAN_JOB_MAX_PENDING', '100'))
+PLAN_JOB_RESULT_TTL = int(os.getenv('PLAN_JOB_RESULT_TTL', '3600'))  # seconds
+
+# Cache for generated plans, keyed on the inputs, model and prompt text.
+# BACKEND is 'memory' (per process), 'file' (shared on disk) or 'none'.
+PLAN_CACHE = {
+    'BACKEND': os.getenv('PLAN_CACHE_BACKEND', 'memory'),
+    'LOCATION': Path(os.getenv('PLAN_CACHE_DIR', BASE_DIR / 'plan_cache')),
+    'TTL': int(os.getenv('PLAN_CACHE_TTL', '86400')),  # seconds
+    'MAX_ENTRIES': int(os.getenv('PLAN_CACHE_MAX_ENTRIES', '500')),
+}
+
+# Coalescing of identical in-flight plan generations. LOCK_DIR enables
+# coordination between worker processes on one host; set it to None to
+# coalesce within a process only.
+PLAN_SINGLE_FLIGHT = {
+    'LOCK_DIR': Path(os.getenv('PLAN_LOCK_DIR', BASE_DIR / 'plan_locks')),
+    'TIMEOUT': int(os.getenv('PLAN_SINGLE_FLIGHT_TIMEOUT', '600')),  # seconds
+    'RESULT_TTL': 60,  # seconds a finished result stays available to waiters
+}
+
+# Admission control and scheduling for plan generation: at most
+# MAX_CONCURRENT run at once. Interactive requests (sync, streaming) may
+# hold MAX_PER_CLIENT slots per client; up to MAX_QUEUE more wait
+# QUEUE_TIMEOUT seconds for a slot before getting a 503. Batch work (async
+# jobs, batch items) uses at most BATCH_SLOTS slots and waits behind
+# interactive requests, unless it has waited AGING_SECONDS longer.
+# Clients take turns in each lane; CLIENT_WEIGHTS ("client=weight,...")
+# gives some of them more turns. Enable TRUST_X_FORWARDED_FOR behind a
+# proxy (e.g. Render) to tell clients apart.
+PLAN_ADMISSION = {
+    'MAX_CONCURRENT': int(os.getenv('PLAN_MAX_CONCURRENT', '8')),
+    'MAX_PER_CLIENT': int(os.getenv('PLAN_MAX_PER_CLIENT', '2')),
+    'MAX_QUEUE': int(os.getenv('PLAN_ADMISSION_QUEUE', '32')),
+    'QUEUE_TIMEOUT': float(os.getenv('PLAN_ADMISSION_TIMEOUT', '30')),  # seconds
+    'BATCH_SLOTS': int(os.getenv('PLAN_BATCH_SLOTS', '4')),
+    'AGING_SECONDS': float(os.getenv('PLAN_QUEUE_AGING', '60')),
+    'CLIENT_WEIGHTS': {
+        client.strip(): int(weight)
+        for client, _, weight in (
+            item.rpartition('=') for item in os.getenv('PLAN_CLIENT_WEIGHTS', '').split(',') if item
+        )
+    },
+    'TRUST_X_FORWARDED_FOR': os.getenv('PLAN_TRUST_X_FORWARDED_FOR', 'False').lower() == 'true',
+}
+
+# Persistent store for generated plans: gzip files plus a SQLite index
+GENERATED_PLANS_DIR = Path(os.getenv('GENERATED_PLANS_DIR', BASE_DIR / 'generated_plans'))
+PLANS_PAGE_SIZE = int(os.getenv('PLANS_PAGE_SIZE', '20'))
+PLANS_MAX_PAGE_SIZE = 100
+# Stored plans older than MAX_AGE seconds, and the oldest beyond MAX_COUNT,
+# are removed as new ones are saved; 0 keeps them
+PLANS_MAX_AGE = int(os.getenv('PLANS_MAX_AGE', str(90 * 24 * 3600)))
+PLANS_MAX_COUNT = int(os.getenv('PLANS_MAX_COUNT', '10000'))
+
+# Batch plan generation. PARALLELISM caps concurrent generations per batch,
+# RATE_LIMIT caps generation starts per second across all batches (0 = off).
+PLAN_BATCH = {
+    'MAX_ITEMS': int(os.getenv('PLAN_BATCH_MAX_ITEMS', '100')),
+    'PARALLELISM': int(os.getenv('PLAN_BATCH_PARALLELISM', '4')),
+    'RATE_LIMIT': float(os.getenv('PLAN_BATCH_RATE_LIMIT', '1')),
+    'BURST': int(os.getenv('PLAN_BATCH_BURST', '4')),
+}
+
+# Checkpoints of each generation's analysis and README stages, so failed
+# runs resume from the last finished stage. A run still marked running after
+# STALE_AFTER seconds is treated as abandoned.
+PIPELINE_RUNS = {
+    'LOCATION': GENERATED_PLANS_DIR,
+    'TTL': int(os.getenv('PIPELINE_RUN_TTL', str(7 * 24 * 3600))),  # seconds
+    'STALE_AFTER': int(os.getenv('PIPELINE_RUN_STALE_AFTER', '900')),  # seconds
+}
+
+# Regenerating a stored plan for an edited description rewrites only the
+# affected sections, unless more than this share of the requirements or of
+# the analysis would change
+PLAN_INCREMENTAL_MAX_CHANGE = float(os.getenv('PLAN_INCREMENTAL_MAX_CHANGE', '0.5'))
+
+# Opt-in reuse of plans for near-duplicate descriptions: a plan whose
+# description scores at least THRESHOLD (cosine similarity of hashed TF-IDF
+# vectors, 0-1) is returned, retitled, instead of generating a new one. The
+# index is kept per process and holds at most MAX_ENTRIES plans.
+PLAN_SIMILARITY_CACHE = {
+    'ENABLED': os.getenv('PLAN_SIMILARITY_CACHE', 'False').lower() == 'true',
+    'THRESHOLD': float(os.getenv('PLAN_SIMILARITY_THRESHOLD', '0.8')),
+    'MAX_ENTRIES': int(os.getenv('PLAN_SIMILARITY_MAX_ENTRIES', '1000')),
+    'DIMENSIONS': int(os.getenv('PLAN_SIMILARITY_DIMENSIONS', '2048')),
+    'TTL': int(os.getenv('PLAN_SIMILARITY_TTL', '86400')),  # seconds
+}
+
+# brotli or gzip compression of API responses, negotiated by Accept-Encoding.
+# Streaming responses and bodies under MIN_SIZE bytes are sent as they are.
+# brotli is used when the package is installed.
+RESPONSE_COMPRESSION = {
+    'ENABLED': os.getenv('RESPONSE_COMPRESSION', 'True').lower() == 'true',
+    'MIN_SIZE': int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', '1024')),  # bytes
+    'GZIP_LEVEL': int(os.getenv('RESPONSE_GZIP_LEVEL', '5')),
+    'BROTLI_QUALITY': int(os.getenv('RESPONSE_BROTLI_QUALITY', '5')),
+}
+
+# crewai and LangChain are imported on the first plan generation. Set
+# PLAN_PRELOAD to import them and build the agents when a worker starts.
+PLAN_PRELOAD = os.getenv('PLAN_PRELOAD', 'False').lower() == 'true'
+
 # Add CORS settings for frontend
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Vite dev server
     "https://build-pilot-rho.vercel.app",
 ]
 
+# Let the frontend read the plan IDs of "format": "markdown" responses
+CORS_EXPOSE_HEADERS = ['X-Plan-Id', 'X-Run-Id', 'Server-Timing']
+
 
 # CORS_ALLOW_ALL_ORIGINS = True  # Only for development
\ No newline at end of file
@@ -0,0 +1,321 @@
+"""Incremental plan regeneration: diff descriptions and splice plan sections
+
+A resubmitted description usually differs from the previous one by a
+sentence or two. ``diff_requirements`` finds the requirements that changed,
+``affected_units`` picks the parts of the analysis or README those changes
+touch (``### `` subsections where a section has them, otherwise whole
+``## `` sections), and ``splice_units`` puts the regenerated parts back in
+place of the old ones, leaving the rest of the document untouched.
+"""
+import difflib
+import re
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(])')
+_BULLET = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+')
+_HEADINGS = {level: re.compile(rf'^{"#" * level}\s+(.+?)\s*#*\s*$') for level in (2, 3)}
+_FENCE = re.compile(r'^\s*(```|~~~)')
+_WORD = re.compile(r'[a-z][a-z0-9+#.-]*[a-z0-9+#]|[a-z]')
+
+STOPWORDS = frozenset("""
+    a an and are as at be by can could for from has have in into is it its
+    may must need needs of on or should so that the their them then there
+    these they this to use used uses using want wants was we were will with
+    would also each every all any some app application project users
+    user support supports allow allows able
+""".split())
+
+# Words that point at a section topic even when the section does not use them
+TOPIC_KEYWORDS = {
+    "structure": frozenset("""
+        file files folder folders directory directories module modules component
+        components page pages screen screens layout structure frontend backend
+        mobile test tests testing script scripts config configuration
+    """.split()),
+    "api": frozenset("""
+        api apis endpoint endpoints rest graphql grpc route routes request
+        requests auth authentication authorization login logout signup oauth jwt
+        token tokens webhook webhooks integration integrations versioning
+        rate-limit rate-limiting
+    """.split()),
+    "stack": frozenset("""
+        stack technology technologies language languages framework frameworks
+        library libraries python django flask fastapi node express react vue
+        angular svelte next typescript javascript java kotlin swift flutter go
+        rust database databases postgres postgresql mysql sqlite mongodb redis
+        elasticsearch kafka docker kubernetes aws gcp azure firebase version
+        versions
+    """.split()),
+}
+
+# Headings whose wording identifies their topic
+_TOPIC_HEADINGS = {
+    "structure": ("structure", "files", "layout"),
+    "api": ("api", "endpoint"),
+    "stack": ("stack", "technolog", "introduction", "prerequisite"),
+}
+
+# Sections a requirement lands in when nothing more specific matches, e.g. a new feature
+DEFAULT_TOPICS = ("structure", "api")
+
+
+def split_requirements(text):
+    """Split a project description into requirement sentences"""
+    requirements = []
+    for line in str(text).splitlines():
+        line = _BULLET.sub('', line).strip()
+        for sentence in _SENTENCE_END.split(line):
+            sentence = ' '.join(sentence.split())
+            if sentence:
+                requirements.append(sentence)
+    return requirements
+
+
+class RequirementsDiff:
+    """Requirements removed from and added to a project description
+
+    An edited sentence shows up as both removed (old wording) and added
+    (new wording).
+    """
+
+    def __init__(self, removed, added, unchanged):
+        self.removed = removed
+        self.added = added
+        self.unchanged = unchanged
+
+    @property
+    def changed(self):
+        return bool(self.removed or self.added)
+
+    @property
+    def change_ratio(self):
+        """Share of requirements touched by the edit, from 0 to 1"""
+        touched = len(self.removed) + len(self.added)
+        total = touched + 2 * self.unchanged
+        return touched / total if total else 0.0
+
+    @property
+    def text(self):
+        return '\n'.join(self.removed + self.added)
+
+    def to_dict(self):
+        return {
+            "removed": list(self.removed),
+            "added": list(self.added),
+            "unchanged": self.unchanged,
+        }
+
+
+def diff_requirements(old_description, new_description):
+    """Compare two descriptions requirement by requirement"""
+    old = split_requirements(old_description)
+    new = split_requirements(new_description)
+    # Compare normalized sentences so case and spacing edits do not count
+    matcher = difflib.SequenceMatcher(
+        None, [s.lower() for s in old], [s.lower() for s in new], autojunk=False
+    )
+    removed, added, unchanged = [], [], 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            unchanged += i2 - i1
+            continue
+        removed.extend(old[i1:i2])
+        added.extend(new[j1:j2])
+    return RequirementsDiff(removed, added, unchanged)
+
+
+def split_sections(markdown, level=2):
+    """Split a document into ``(heading, text)`` pairs at headings of ``level``
+
+    The text before the first heading comes back with ``heading`` None.
+    Each section's text includes its heading line; headings inside code
+    fences (e.g. a file tree) are ignored.
+    """
+    pattern = _HEADINGS[level]
+    sections = []
+    heading, lines, in_fence = None, [], False
+    for line in str(markdown).splitlines():
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else pattern.match(line)
+        if match:
+            if heading is not None or any(l.strip() for l in lines):
+                sections.append((heading, '\n'.join(lines).strip()))
+            heading, lines = match.group(1), []
+        lines.append(line)
+    if heading is not None or any(l.strip() for l in lines):
+        sections.append((heading, '\n'.join(lines).strip()))
+    return sections
+
+
+def split_units(document):
+    """Split a document into the units incremental regeneration rewrites
+
+    Returns ``(section, subsection, text)`` triples: one per ``### ``
+    subsection for sections that have them, otherwise one per ``## ``
+    section. A section's own heading line and any text before its first
+    subsection form a unit with ``subsection`` None, as does the text
+    before the first section (with ``section`` None as well).
+    """
+    units = []
+    for heading, text in split_sections(document):
+        if heading is None:
+            units.append((None, None, text))
+            continue
+        heading_line, _, body = text.partition('\n')
+        subsections = split_sections(body, level=3)
+        if not any(sub for sub, _ in subsections):
+            units.append((heading, None, text))
+            continue
+        lead = [heading_line] + [sub_text for sub, sub_text in subsections if sub is None]
+        units.append((heading, None, '\n\n'.join(lead)))
+        units.extend((heading, sub, sub_text) for sub, sub_text in subsections if sub)
+    return units
+
+
+def join_units(units):
+    return '\n\n'.join(text for _, _, text in units if text)
+
+
+def has_sections(document):
+    return any(section for section, _, _ in split_units(document))
+
+
+def normalize_heading(heading):
+    """Compare headings regardless of numbering, emphasis and case"""
+    if heading is None:
+        return None
+    heading = re.sub(r'^[\d.)\s]+', '', heading.replace('*', '').replace('_', ' '))
+    return ' '.join(heading.lower().split())
+
+
+def _key(section, subsection):
+    return normalize_heading(section), normalize_heading(subsection)
+
+
+def unit_label(section, subsection):
+    return f"{section} / {subsection}" if subsection else section
+
+
+def heading_topic(heading):
+    name = normalize_heading(heading) or ''
+    for topic, words in _TOPIC_HEADINGS.items():
+        if any(word in name for word in words):
+            return topic
+    return None
+
+
+def content_terms(text):
+    return {word for word in _WORD.findall(str(text).lower()) if word not in STOPWORDS}
+
+
+def affected_units(units, changed_text, topics=()):
+    """``(section, subsection)`` pairs of the units a change is likely to touch
+
+    A unit is affected when the change shares a word with it that few other
+    units use (e.g. the name of the feature that changed). Failing that, a
+    section is affected as a whole (all of its units) when the change mentions
+    its topic, like "endpoint" for the API section, or when its topic is in
+    ``topics``. A change that matches nothing, such as a brand-new feature,
+    lands in the structure and API sections.
+    """
+    terms = content_terms(changed_text)
+    named = [(section, sub, content_terms(text)) for section, sub, text in units if section]
+    if not named:
+        return []
+    # Words used by more than a quarter of the units say little about where a change belongs
+    common = max(2, len(named) // 4)
+
+    groups = {}
+    for section, sub, words in named:
+        groups.setdefault(section, []).append((sub, words))
+
+    affected, fallback = [], []
+    for section, members in groups.items():
+        topic = heading_topic(section)
+        hits = [
+            (section, sub) for sub, words in members
+            if any(sum(term in other for _, _, other in named) <= common for term in terms & words)
+        ]
+        whole = [(section, sub) for sub, _ in members]
+        if not hits and (topic in topics or (topic and terms & TOPIC_KEYWORDS[topic])):
+            hits = whole
+        affected.extend(hits)
+        if topic in DEFAULT_TOPICS:
+            fallback.extend(whole)
+
+    return affected or fallback or [(section, sub) for section, _, _ in named]
+
+
+def select_units(units, targets):
+    """Markdown with just the ``targets`` units, under their section headings"""
+    wanted = {_key(section, sub) for section, sub in targets}
+    parts, open_section = [], None
+    for section, sub, text in units:
+        if _key(section, sub) not in wanted:
+            continue
+        if sub is not None and section != open_section:
+            parts.append(f"## {section}")
+        open_section = section
+        parts.append(text)
+    return '\n\n'.join(parts)
+
+
+def rewrite_share(units, targets):
+    """Share of the document, by length, that rewriting ``targets`` regenerates"""
+    total = len(join_units(units))
+    return len(select_units(units, targets)) / total if total else 1.0
+
+
+def _with_heading(old_text, new_text):
+    """New unit text under the old heading line, so headings stay consistent"""
+    body = new_text.partition('\n')[2].strip()
+    if not body:
+        return old_text
+    heading_line, _, old_body = old_text.partition('\n')
+    # Keep the old spacing between heading and body
+    separator = '\n\n' if old_body.startswith('\n') else '\n'
+    return f"{heading_line}{separator}{body}"
+
+
+def splice_units(units, replacement, targets):
+    """Replace the ``targets`` units with their regenerated text
+
+    ``replacement`` is the markdown the model returned for
+    ``select_units(units, targets)``. Units are matched by heading and keep
+    their original heading line; a target missing from the replacement keeps
+    its old text. A targeted section's subsections replace the ones with the
+    same heading, and only ``### `` headings the document does not have yet
+    (e.g. for a new feature) are added, at the end of that section. Returns
+    the spliced document and the labels of the units that were rewritten or
+    added.
+    """
+    wanted = {_key(section, sub) for section, sub in targets}
+    wanted_sections = {key[0] for key in wanted}
+    existing = {_key(section, sub) for section, sub, _ in units}
+    rewritten, added, seen = {}, {}, set()
+    for section, sub, text in split_units(replacement):
+        key = _key(section, sub)
+        if key in seen or key[0] not in wanted_sections:
+            continue
+        seen.add(key)  # The model may repeat a heading; the first copy wins
+        if key in wanted or key in existing:
+            rewritten[key] = text
+        elif sub is not None:
+            added.setdefault(key[0], []).append((sub, text))
+
+    spliced, changed = [], []
+    for index, (section, sub, text) in enumerate(units):
+        key = _key(section, sub)
+        if key in rewritten:
+            new_text = _with_heading(text, rewritten.pop(key))
+            if new_text != text:
+                text = new_text
+                changed.append(unit_label(section, sub))
+        spliced.append((section, sub, text))
+        next_section = units[index + 1][0] if index + 1 < len(units) else None
+        if section and _key(next_section, None)[0] != key[0]:
+            # Last unit of this section: new subsections go here
+            for new_sub, new_text in added.pop(key[0], []):
+                spliced.append((section, new_sub, new_text))
+                changed.append(unit_label(section, new_sub))
+    return join_units(spliced), changed
@@ -0,0 +1,226 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# USD per 1M tokens as (prompt, completion); override with LLM_PRICE_PROMPT /
+# LLM_PRICE_COMPLETION for models missing here
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+_current_run = contextvars.ContextVar("plan_run", default=None)
+
+
+def current_run():
+    """The PlanRun LLM calls in this context are attributed to, if any"""
+    return _current_run.get()
+
+
+def estimate_tokens(char_count):
+    """Rough token count for English text, ~4 characters per token"""
+    return (char_count + 3) // 4
+
+
+def estimate_cost(model_name, prompt_tokens, completion_tokens):
+    """Estimated USD cost of a call, or None for unknown models"""
+    if os.getenv('LLM_PRICE_PROMPT') and os.getenv('LLM_PRICE_COMPLETION'):
+        prices = (float(os.getenv('LLM_PRICE_PROMPT')), float(os.getenv('LLM_PRICE_COMPLETION')))
+    else:
+        prices = MODEL_PRICING.get(model_name)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class PlanRun:
+    """Timings and token usage for one plan generation
+
+    Stages are recorded as consecutive spans: starting a stage ends the
+    previous one. LLM calls made while a run is active (see ``activate``)
+    are attributed to the current stage, which lets each stage's wall time
+    be split into time spent waiting on the LLM and orchestration overhead.
+    """
+
+    def __init__(self, model_name=None):
+        self.model_name = model_name
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.outcome = None
+        self.spans = []
+        self._current = None
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """End the current stage (if any) and start ``name``"""
+        now = time.perf_counter()
+        with self._lock:
+            if self._current is not None:
+                self._current["end"] = now
+            self._current = {
+                "stage": name,
+                "start": now,
+                "end": None,
+                "llm_seconds": 0.0,
+                "llm_calls": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+            }
+            self.spans.append(self._current)
+
+    def finish(self, outcome="success"):
+        now = time.perf_counter()
+        with self._lock:
+            if self._current is not None and self._current["end"] is None:
+                self._current["end"] = now
+            self._current = None
+            self.finished_at = now
+            self.outcome = outcome
+        METRICS.observe_run(self)
+
+    def record_llm_call(self, seconds, prompt_tokens, completion_tokens):
+        with self._lock:
+            span = self._current
+            if span is None:
+                return
+            span["llm_seconds"] += seconds
+            span["llm_calls"] += 1
+            span["prompt_tokens"] += prompt_tokens
+            span["completion_tokens"] += completion_tokens
+
+    @contextmanager
+    def activate(self):
+        """Attribute LLM calls made in this context to this run"""
+        token = _current_run.set(self)
+        try:
+            yield self
+        finally:
+            _current_run.reset(token)
+
+    def stage_summaries(self):
+        """Spans merged by stage name, in first-seen order"""
+        merged = {}
+        with self._lock:
+            for span in self.spans:
+                end = span["end"] if span["end"] is not None else time.perf_counter()
+                summary = merged.setdefault(span["stage"], {
+                    "seconds": 0.0,
+                    "llm_seconds": 0.0,
+                    "llm_calls": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                })
+                summary["seconds"] += end - span["start"]
+                for key in ("llm_seconds", "llm_calls", "prompt_tokens", "completion_tokens"):
+                    summary[key] += span[key]
+        for summary in merged.values():
+            summary["overhead_seconds"] = max(0.0, summary["seconds"] - summary["llm_seconds"])
+        return merged
+
+    def to_dict(self):
+        stages = self.stage_summaries()
+        prompt_tokens = sum(s["prompt_tokens"] for s in stages.values())
+        completion_tokens = sum(s["completion_tokens"] for s in stages.values())
+        end = self.finished_at or time.perf_counter()
+        return {
+            "total_seconds": round(end - self.started_at, 4),
+            "stages": {
+                name: {key: round(value, 4) if isinstance(value, float) else value
+                       for key, value in summary.items()}
+                for name, summary in stages.items()
+            },
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated_cost_usd": estimate_cost(self.model_name, prompt_tokens, completion_tokens),
+        }
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms rendered in Prometheus text format"""
+
+    BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, labels=(), value=1.0):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name, value, labels=()):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    "buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0,
+                }
+            index = bisect_left(self.BUCKETS, value)
+            if index < len(self.BUCKETS):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def observe_run(self, run):
+        data = run.to_dict()
+        self.inc("buildpilot_plan_generations_total", [("outcome", run.outcome)])
+        self.observe("buildpilot_plan_duration_seconds", data["total_seconds"])
+        for stage, summary in run.stage_summaries().items():
+            labels = [("stage", stage)]
+            self.observe("buildpilot_stage_duration_seconds", summary["seconds"], labels)
+            self.inc("buildpilot_stage_overhead_seconds_total", labels, summary["overhead_seconds"])
+            if not summary["llm_calls"]:
+                continue
+            self.inc("buildpilot_stage_llm_seconds_total", labels, summary["llm_seconds"])
+            self.inc("buildpilot_llm_calls_total", labels, summary["llm_calls"])
+            self.inc("buildpilot_llm_tokens_total", labels + [("kind", "prompt")], summary["prompt_tokens"])
+            self.inc("buildpilot_llm_tokens_total", labels + [("kind", "completion")], summary["completion_tokens"])
+        if data["estimated_cost_usd"] is not None:
+            self.inc("buildpilot_llm_cost_usd_total", value=data["estimated_cost_usd"])
+
+    def render(self, extra_gauges=None):
+        """Prometheus text exposition of all metrics"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, histogram["buckets"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']:g}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+
+        for name, value in sorted((extra_gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    rendered = ",".join(f'{key}="{value}"' for key, value in labels)
+    return "{" + rendered + "}"
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,87 @@
+"""LangChain callbacks for the pooled LLM clients
+
+Kept apart from ``instrumentation`` so that importing the metrics, e.g. for
+the health and metrics views, does not load LangChain.
+"""
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from instrumentation import current_run, estimate_tokens
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """LangChain callback that attributes LLM time and tokens to the active PlanRun
+
+    A single instance is attached to every pooled LLM client; the run is
+    looked up through a context variable so concurrent requests sharing a
+    client do not mix up their numbers.
+    """
+
+    run_inline = True  # Keep the caller's context, also for async LLM calls
+
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, sum(len(prompt) for prompt in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt_chars = sum(
+            len(str(message.content)) for batch in messages for message in batch
+        )
+        self._start(run_id, prompt_chars)
+
+    def _start(self, run_id, prompt_chars):
+        with self._lock:
+            self._started[run_id] = (time.perf_counter(), prompt_chars)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        run = current_run()
+        if run is None or started is None:
+            return
+
+        started_at, prompt_chars = started
+        prompt_tokens, completion_tokens = _token_usage(response)
+        if not prompt_tokens and not completion_tokens:
+            # Streamed calls often come back without usage; estimate instead
+            completion_chars = sum(
+                len(generation.text) for generations in response.generations
+                for generation in generations
+            )
+            prompt_tokens = estimate_tokens(prompt_chars)
+            completion_tokens = estimate_tokens(completion_chars)
+        run.record_llm_call(time.perf_counter() - started_at, prompt_tokens, completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._started.pop(run_id, None)
+
+
+def _token_usage(response):
+    """Prompt and completion token counts from an LLMResult"""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+    # Streaming and some chat models report usage on the message instead
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            metadata = getattr(message, "usage_metadata", None)
+            if metadata:
+                prompt_tokens += metadata.get("input_tokens", 0)
+                completion_tokens += metadata.get("output_tokens", 0)
+                continue
+            usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+            prompt_tokens += usage.get("prompt_tokens", 0)
+            completion_tokens += usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+token_usage_handler = TokenUsageHandler()
@@ -0,0 +1,150 @@
+import os
+import threading
+
+import httpx
+
+from llm_transport import AsyncResilientTransport, ResilientTransport, RetryPolicy
+
+
+class LLMClientRegistry:
+    """Process-wide, thread-safe registry of pooled LLM clients
+
+    Every ChatOpenAI handed out shares one sync and one async HTTP client,
+    so connections (and their TLS sessions) are kept alive and reused across
+    requests instead of being set up again for each plan. Non-streaming
+    clients are cached per model and temperature, and a shared
+    ``CustomAgents`` holds prebuilt agent templates.
+
+    Requests go through resilient transports sharing one ``RetryPolicy``:
+    pacing from OpenAI's rate-limit headers, jittered exponential retries
+    (``LLM_MAX_RETRIES`` within ``LLM_RETRY_TOTAL_TIMEOUT`` seconds) and,
+    with ``LLM_HEDGE=true``, hedged requests past the recent p95 latency.
+    The OpenAI SDK's own retries are turned off so failures are not retried
+    twice.
+
+    ``llm_factory`` replaces ChatOpenAI altogether (e.g. with an offline stub
+    for benchmarks); it is called as
+    ``llm_factory(model_name, temperature, streaming, callbacks)``.
+    """
+
+    def __init__(self, pool_size=None, keepalive_expiry=None, timeout=None, llm_factory=None,
+                 retry_policy=None):
+        self.pool_size = pool_size or int(os.getenv('LLM_POOL_SIZE', '20'))
+        self.keepalive_expiry = keepalive_expiry or float(os.getenv('LLM_KEEPALIVE_EXPIRY', '60'))
+        self.timeout = timeout or float(os.getenv('LLM_REQUEST_TIMEOUT', '600'))
+        self.llm_factory = llm_factory
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_retries=int(os.getenv('LLM_MAX_RETRIES', '4')),
+            base_delay=float(os.getenv('LLM_RETRY_BASE_DELAY', '0.5')),
+            max_delay=float(os.getenv('LLM_RETRY_MAX_DELAY', '30')),
+            hedge=os.getenv('LLM_HEDGE', 'False').lower() == 'true',
+            total_timeout=float(os.getenv('LLM_RETRY_TOTAL_TIMEOUT', '900')),
+        )
+        self._lock = threading.RLock()
+        self._http_client = None
+        self._http_async_client = None
+        self._llms = {}
+        self._agents = None
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def http_client(self):
+        with self._lock:
+            if self._http_client is None:
+                transport = ResilientTransport(
+                    httpx.HTTPTransport(limits=self._limits()), self.retry_policy
+                )
+                self._http_client = httpx.Client(transport=transport, timeout=self.timeout)
+            return self._http_client
+
+    def http_async_client(self):
+        with self._lock:
+            if self._http_async_client is None:
+                transport = AsyncResilientTransport(
+                    httpx.AsyncHTTPTransport(limits=self._limits()), self.retry_policy
+                )
+                self._http_async_client = httpx.AsyncClient(transport=transport, timeout=self.timeout)
+            return self._http_async_client
+
+    def get_llm(self, model_name, temperature, streaming=False, callbacks=None):
+        """Return a ChatOpenAI that reuses the pooled HTTP connections
+
+        Streaming clients carry per-request callbacks, so they are built
+        fresh each time; they still share the underlying connection pool.
+        """
+        if streaming or callbacks:
+            return self._build_llm(model_name, temperature, streaming, callbacks)
+
+        key = (model_name, temperature)
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                llm = self._llms[key] = self._build_llm(model_name, temperature)
+            return llm
+
+    def _build_llm(self, model_name, temperature, streaming=False, callbacks=None):
+        # LangChain is imported with the first client, not when this module loads
+        from llm_callbacks import token_usage_handler
+
+        # Every client reports its calls to the per-request instrumentation
+        callbacks = [token_usage_handler] + list(callbacks or [])
+        if self.llm_factory is not None:
+            return self.llm_factory(model_name, temperature, streaming, callbacks)
+
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model_name=model_name,
+            temperature=temperature,
+            streaming=streaming,
+            callbacks=callbacks,
+            max_retries=0,  # Retried by the transport instead
+            http_client=self.http_client(),
+            http_async_client=self.http_async_client(),
+        )
+
+    def get_agents(self):
+        """Return the shared CustomAgents with its cached agent templates"""
+        with self._lock:
+            if self._agents is None:
+                from agents import CustomAgents
+                self._agents = CustomAgents()
+            return self._agents
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "keepalive_expiry": self.keepalive_expiry,
+                "cached_llms": len(self._llms),
+                "transport": self.retry_policy.stats(),
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide LLM client registry, creating it on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LLMClientRegistry()
+        return _registry
+
+
+def reload(**options):
+    """Replace the registry, e.g. after the model, pool size or API key changes
+
+    Clients already handed out keep working until their requests finish;
+    new requests pick up freshly built clients and agents.
+    """
+    global _registry
+    with _registry_lock:
+        _registry = LLMClientRegistry(**options)
+        return _registry
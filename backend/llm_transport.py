@@ -0,0 +1,428 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+import httpx
+
+from instrumentation import METRICS
+
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    """Seconds in an OpenAI reset header such as ``"6m0s"`` or ``"20ms"``"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after(headers):
+    """Delay requested by ``retry-after-ms`` / ``retry-after``, in seconds"""
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # HTTP-date form; fall back to backoff
+    return None
+
+
+class _Bucket:
+    def __init__(self):
+        self.limit = None
+        self.tokens = 0.0
+        self.rate = 0.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if self.limit is not None:
+            self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost, now):
+        """Charge ``cost`` and return how long to wait before sending"""
+        if self.limit is None:
+            return 0.0
+        self.refill(now)
+        self.tokens -= cost
+        if self.tokens >= 0 or not self.rate:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RateLimitPacer:
+    """Token buckets for requests and tokens, fed by OpenAI rate-limit headers
+
+    Every response's ``x-ratelimit-{limit,remaining,reset}-{requests,tokens}``
+    headers resync the buckets with the server's view. The refill rate is
+    taken as the used capacity over the time until reset. A 429 with a
+    retry-after pauses every caller sharing the pacer, not just the one that
+    hit it, so a burst of requests does not keep tripping the limit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {"requests": _Bucket(), "tokens": _Bucket()}
+        self._blocked_until = 0.0
+
+    def reserve(self, tokens):
+        """Charge one request of ``tokens`` tokens; returns seconds to wait first"""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._blocked_until - now)
+            delay = max(delay, self._buckets["requests"].take(1, now))
+            delay = max(delay, self._buckets["tokens"].take(tokens, now))
+            return delay
+
+    def try_reserve(self, tokens):
+        """Charge one request of ``tokens`` tokens only if it can be sent right away"""
+        with self._lock:
+            now = time.monotonic()
+            if self._blocked_until > now:
+                return False
+            costs = {"requests": 1, "tokens": tokens}
+            for kind, bucket in self._buckets.items():
+                bucket.refill(now)
+                if bucket.limit is not None and bucket.tokens < costs[kind]:
+                    return False
+            for kind, bucket in self._buckets.items():
+                bucket.take(costs[kind], now)
+            return True
+
+    def update(self, response):
+        headers = response.headers
+        with self._lock:
+            now = time.monotonic()
+            for kind, bucket in self._buckets.items():
+                try:
+                    limit = int(headers[f"x-ratelimit-limit-{kind}"])
+                    remaining = int(headers[f"x-ratelimit-remaining-{kind}"])
+                except (KeyError, ValueError):
+                    continue
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if bucket.limit is None:
+                    bucket.tokens = float(remaining)
+                else:
+                    # Requests reserved here may not have reached the server
+                    # yet, so only ever lower the local count
+                    bucket.take(0, now)
+                    bucket.tokens = min(bucket.tokens, float(remaining))
+                bucket.limit = limit
+                bucket.updated = now
+                bucket.rate = (limit - remaining) / reset if reset else limit / 60.0
+
+            if response.status_code == 429:
+                pause = retry_after(headers)
+                if pause:
+                    self._blocked_until = max(self._blocked_until, now + pause)
+
+    def stats(self):
+        with self._lock:
+            return {
+                kind: {"limit": bucket.limit, "available": round(bucket.tokens, 1)}
+                for kind, bucket in self._buckets.items()
+            }
+
+
+class LatencyTracker:
+    """Recent time-to-headers of successful calls, for choosing the hedge delay"""
+
+    def __init__(self, window=200, min_samples=20, percentile=95):
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def hedge_after(self):
+        """Latency past which a call is hedged, or None until enough samples exist"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+
+class RetryPolicy:
+    """Shared settings and state for the sync and async resilient transports"""
+
+    def __init__(self, max_retries=4, base_delay=0.5, max_delay=30.0, hedge=False,
+                 hedge_budget=0.1, pacer=None, latency=None, total_timeout=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.total_timeout = total_timeout  # No retry starts later than this after the first try
+        self.hedge = hedge
+        self.hedge_budget = hedge_budget  # Max share of requests that may be duplicated
+        self.pacer = pacer or RateLimitPacer()
+        self.latency = latency or LatencyTracker()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def backoff(self, attempt, response=None):
+        """Full-jitter exponential backoff, stretched to any retry-after"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if response is not None:
+            delay = max(delay, retry_after(response.headers) or 0.0)
+        return delay
+
+    def should_retry(self, attempt, response=None, error=None, elapsed=0.0, delay=0.0):
+        """Whether to retry after ``elapsed`` seconds so far and a ``delay`` backoff"""
+        if attempt >= self.max_retries:
+            return False
+        if self.total_timeout is not None and elapsed + delay > self.total_timeout:
+            return False
+        if error is not None:
+            return isinstance(error, RETRY_EXCEPTIONS)
+        return response.status_code in RETRY_STATUSES
+
+    def hedge_after(self):
+        """Seconds to wait before hedging this request, or None to not hedge"""
+        with self._lock:
+            self.requests += 1
+            if not self.hedge or self.hedges >= self.hedge_budget * self.requests:
+                return None
+        return self.latency.hedge_after()
+
+    def record_retry(self, reason):
+        with self._lock:
+            self.retries += 1
+        METRICS.inc("buildpilot_llm_retries_total", [("reason", reason)])
+
+    def record_hedge(self, won):
+        with self._lock:
+            self.hedges += 1
+            self.hedge_wins += int(won)
+        METRICS.inc("buildpilot_llm_hedged_requests_total", [("winner", "hedge" if won else "primary")])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_after_seconds": self.latency.hedge_after(),
+                "rate_limits": self.pacer.stats(),
+            }
+
+
+def _request_tokens(request):
+    # Rough prompt size from the JSON body, ~4 bytes per token
+    return len(request.content) // 4 if request.content else 0
+
+
+def _retry_reason(response, error):
+    return type(error).__name__ if error is not None else str(response.status_code)
+
+
+def _quota_exhausted(response):
+    # A 429 for an exhausted quota will not succeed on retry
+    return response.status_code == 429 and b"insufficient_quota" in response.content
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """httpx transport adding pacing, jittered retries and optional hedging
+
+    Wraps the pooled transport that actually sends requests. Hedging starts
+    a duplicate request once the first has gone unanswered for longer than
+    the recent p95 latency and uses whichever answers first. It runs the
+    duplicate on a small thread pool.
+    """
+
+    def __init__(self, transport, policy):
+        self.transport = transport
+        self.policy = policy
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def handle_request(self, request):
+        request.read()  # Buffer the body so it can be sent more than once
+        tokens = _request_tokens(request)
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            delay = self.policy.pacer.reserve(tokens)
+            if delay:
+                time.sleep(delay)
+
+            response = error = None
+            try:
+                response = self._send(request)
+            except Exception as e:
+                error = e
+            else:
+                self.policy.pacer.update(response)
+                if response.status_code == 429:
+                    response.read()
+                    if _quota_exhausted(response):
+                        return response
+
+            delay = self.policy.backoff(attempt, response)
+            if not self.policy.should_retry(attempt, response, error, time.monotonic() - started, delay):
+                if error is not None:
+                    raise error
+                return response
+
+            self.policy.record_retry(_retry_reason(response, error))
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _timed_send(self, request):
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        if response.status_code < 400:
+            self.policy.latency.record(time.perf_counter() - started)
+        return response
+
+    def _send(self, request):
+        hedge_after = self.policy.hedge_after()
+        if hedge_after is None:
+            return self._timed_send(request)
+
+        executor = self._get_executor()
+        primary = executor.submit(self._timed_send, request)
+        try:
+            return primary.result(timeout=hedge_after)
+        except FutureTimeout:
+            pass
+        if not self.policy.pacer.try_reserve(_request_tokens(request)):
+            # Rate limited: a duplicate request would only make it worse
+            return primary.result()
+
+        hedge = executor.submit(self._timed_send, request)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        winner = hedge if hedge in done and primary not in done else primary
+        if winner.exception() is not None:
+            # The first answer was an error; give the other request its chance
+            winner = hedge if winner is primary else primary
+        loser = primary if winner is hedge else hedge
+        loser.add_done_callback(_close_future_response)
+        self.policy.record_hedge(winner is hedge)
+        return winner.result()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+            return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.transport.close()
+
+
+def _close_future_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of ``ResilientTransport``; hedges with tasks instead of threads"""
+
+    def __init__(self, transport, policy):
+        self.transport = transport
+        self.policy = policy
+
+    async def handle_async_request(self, request):
+        await request.aread()  # Buffer the body so it can be sent more than once
+        tokens = _request_tokens(request)
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            delay = self.policy.pacer.reserve(tokens)
+            if delay:
+                await asyncio.sleep(delay)
+
+            response = error = None
+            try:
+                response = await self._send(request)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            else:
+                self.policy.pacer.update(response)
+                if response.status_code == 429:
+                    await response.aread()
+                    if _quota_exhausted(response):
+                        return response
+
+            delay = self.policy.backoff(attempt, response)
+            if not self.policy.should_retry(attempt, response, error, time.monotonic() - started, delay):
+                if error is not None:
+                    raise error
+                return response
+
+            self.policy.record_retry(_retry_reason(response, error))
+            if response is not None:
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _timed_send(self, request):
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        if response.status_code < 400:
+            self.policy.latency.record(time.perf_counter() - started)
+        return response
+
+    async def _send(self, request):
+        hedge_after = self.policy.hedge_after()
+        if hedge_after is None:
+            return await self._timed_send(request)
+
+        primary = asyncio.ensure_future(self._timed_send(request))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait([primary], timeout=hedge_after)
+            if done or not self.policy.pacer.try_reserve(_request_tokens(request)):
+                return await primary
+
+            hedge = asyncio.ensure_future(self._timed_send(request))
+            done, _ = await asyncio.wait([primary, hedge], return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            for task in (primary, hedge):
+                if task is not None:
+                    task.cancel()
+            raise
+
+        winner = hedge if hedge in done and primary not in done else primary
+        if winner.exception() is not None:
+            winner = hedge if winner is primary else primary
+        loser = primary if winner is hedge else hedge
+        loser.add_done_callback(_aclose_task_response)
+        self.policy.record_hedge(winner is hedge)
+        return await winner
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def _aclose_task_response(task):
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
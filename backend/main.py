@@ -1,36 +1,46 @@
-from crewai import Crew, Process
-from agents import CustomAgents
+from batch import RateLimiter, read_jsonl, run_batch, summarize
+from llm_pool import get_registry
+from markdown_normalizer import normalize_markdown
 from tasks import CustomTasks
+import argparse
+import json
 import os
+import re
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class ProjectPlanningAssistant:
-    def __init__(self):
-        self.agents = CustomAgents()
+    def __init__(self, verbose=True):
+        self.agents = get_registry().get_agents()
         self.tasks = CustomTasks()
+        self.verbose = verbose
     
     def generate_project_plan(self, project_name, project_description):
+        # Imported here so `--help` and input prompts don't wait for crewai to load
+        from crewai import Crew, Process
+        
         # Create agents
         planner = self.agents.project_planner_agent()
         documenter = self.agents.documentation_agent()
         
         # Create tasks with project name included
         analysis_task = self.tasks.project_analysis_task(planner, project_name, project_description)
-        readme_task = self.tasks.readme_generation_task(documenter, project_name, analysis_task.expected_output)
+        readme_task = self.tasks.readme_generation_task(documenter, project_name)
         
         # Create crew
         crew = Crew(
             agents=[planner, documenter],
             tasks=[analysis_task, readme_task],
             process=Process.sequential,
-            verbose=True
+            verbose=self.verbose
         )
         
-        # Execute and extract the result content
+        # Execute and clean up the result like the API does
         crew_output = crew.kickoff()
-        return str(crew_output)
+        return normalize_markdown(crew_output)
 
 def get_user_input():
     """Get project details from user input"""
@@ -89,7 +99,57 @@ def save_output(project_name, result):
         print(f"\n❌ Error saving file: {e}")
         return None
 
+def run_batch_file(input_path, out_dir, parallelism, rate_limit):
+    """Generate plans for every project in a JSONL file without prompting
+
+    Each plan is written to ``out_dir`` and a JSON line per project is
+    printed as it finishes; the same lines are kept in ``results.jsonl``.
+    """
+    items = read_jsonl(input_path)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    
+    assistant = ProjectPlanningAssistant(verbose=False)
+    results = run_batch(
+        items,
+        assistant.generate_project_plan,
+        parallelism=parallelism,
+        rate_limiter=RateLimiter(rate_limit, burst=parallelism),
+    )
+    
+    finished = []
+    with open(out_dir / "results.jsonl", 'w', encoding='utf-8') as log:
+        for result in results:
+            plan = result.pop("plan", None)
+            if plan is not None:
+                slug = re.sub(r'[^\w-]+', '_', str(result['project_name'])).strip('_').lower()
+                filename = f"{result['index']:03d}_{slug}_plan.md"
+                (out_dir / filename).write_text(plan, encoding='utf-8')
+                result["file"] = str(out_dir / filename)
+            finished.append(result)
+            line = json.dumps(result)
+            print(line, flush=True)
+            log.write(line + "\n")
+            log.flush()
+        
+        summary = json.dumps(summarize(finished))
+        print(summary, flush=True)
+        log.write(summary + "\n")
+    
+    return all(result["status"] == "success" for result in finished)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate project plans with AI agents")
+    parser.add_argument('--batch', metavar='INPUT_JSONL',
+                        help="JSONL file of {\"project_name\", \"project_description\"} objects")
+    parser.add_argument('--out', default='plans', help="Directory for batch output")
+    parser.add_argument('--parallelism', type=int, default=4, help="Plans generated at once in batch mode")
+    parser.add_argument('--rate-limit', type=float, default=1.0,
+                        help="Plan generations started per second in batch mode (0 = no limit)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
         # Check for API key
         if not os.getenv("OPENAI_API_KEY"):
@@ -97,6 +157,11 @@ if __name__ == "__main__":
             print("   Please create a .env file with your OpenAI API key.")
             exit(1)
         
+        # Non-interactive batch mode
+        if args.batch:
+            ok = run_batch_file(args.batch, args.out, args.parallelism, args.rate_limit)
+            sys.exit(0 if ok else 1)
+        
         # Get user input
         project_name, project_description = get_user_input()
         
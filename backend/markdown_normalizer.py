@@ -0,0 +1,210 @@
+"""Single-pass markdown clean-up for generated plans, whole or streamed
+
+``MarkdownNormalizer`` takes the model's output in chunks of any size and
+returns cleaned text as soon as it is safe to, so the same rules apply to
+a finished crew result, to README tokens streamed to a client, and to the
+CLI. Each line is looked at once:
+
+* a ```` ```markdown ```` wrapper around the whole document, and a stray
+  fence left at its start or end, are removed; fences closing real code
+  blocks (such as the file tree) are kept
+* the agent's "Thought: ... Final Answer:" preamble, which streamed tokens
+  include, is dropped
+* headings get one space after the hashes and lose closing hashes, and any
+  ``# `` heading after the first becomes ``## `` so the document has one title
+* file trees in code blocks are checked for entries that skip a level,
+  siblings after a ``└──`` and misaligned ``│`` columns; problems are
+  collected in ``issues``, the tree itself is left as written
+
+Leading and trailing blank lines are dropped.
+"""
+import re
+
+_FENCE = re.compile(r'^ {0,3}(`{3,}|~{3,})\s*([^`\s]*)[^`]*$')
+_WRAPPER_INFO = ("", "markdown", "md")
+_HEADING = re.compile(r'^(#{1,6})(?:[ \t]+|(?=[A-Z]))(.*?)(?:[ \t]+#+)?[ \t]*$')
+_TREE_ENTRY = re.compile(r'^((?:│   |    )*)([├└])── (.*)$')
+_PREAMBLE = "Thought:"
+_FINAL_ANSWER = "Final Answer:"
+
+
+class MarkdownNormalizer:
+    """Incremental markdown normalizer: ``feed`` chunks, then ``finish``
+
+    ``feed`` and ``finish`` return the cleaned text that became final with
+    that call; concatenated, they form the cleaned document. A line is held
+    back only while it is incomplete, blank, or a fence that may turn out to
+    be the document's last line.
+    """
+
+    def __init__(self):
+        self.issues = []
+        self._partial = []
+        self._checking_preamble = True
+        self._preamble = ""  # Text held while deciding whether it is a preamble
+        self._started = False  # Past the leading blank lines and wrapper
+        self._fence = None  # (char, length) of the open code block
+        self._held = []  # Blank lines, and a bare fence that may end the document
+        self._held_fence = False  # Whether _held starts with such a fence
+        self._emitted = False
+        self._titled = False
+        self._line_number = 0
+        self._tree_closed = {}
+
+    def feed(self, chunk):
+        if not chunk:
+            return ""
+        if self._checking_preamble:
+            chunk = self._skip_preamble(chunk)
+            if not chunk:
+                return ""
+        if "\n" not in chunk:
+            self._partial.append(chunk)
+            return ""
+        head, _, rest = chunk.partition("\n")
+        self._partial.append(head)
+        lines = rest.split("\n")
+        tail = lines.pop()
+        out = [self._line("".join(self._partial))]
+        out.extend(self._line(line) for line in lines)
+        self._partial = [tail] if tail else []
+        return "".join(out)
+
+    def finish(self):
+        """Flush the last line; a fence still held back here was the closing wrapper or a stray one"""
+        out = ""
+        if self._checking_preamble:
+            # Never saw a final answer: this was not a preamble after all
+            self._checking_preamble = False
+            out += self.feed(self._preamble)
+        if self._partial:
+            out += self._line("".join(self._partial), final=True)
+            self._partial = []
+        if self._held_fence:
+            self._fence = None
+            self._held_fence = False
+        self._held = []
+        return out
+
+    def _skip_preamble(self, chunk):
+        """Drop an agent preamble ending in "Final Answer:" from the start of the output"""
+        text = self._preamble + chunk
+        stripped = text.lstrip()
+        if len(stripped) < len(_PREAMBLE) and _PREAMBLE.startswith(stripped):
+            self._preamble = text  # Too short to tell yet
+            return ""
+        if not stripped.startswith(_PREAMBLE):
+            self._checking_preamble, self._preamble = False, ""
+            return text
+        # Search only the new text (plus an overlap) so a long preamble stays linear
+        start = max(0, len(self._preamble) - len(_FINAL_ANSWER))
+        index = text.find(_FINAL_ANSWER, start)
+        if index < 0:
+            self._preamble = text
+            return ""
+        self._checking_preamble, self._preamble = False, ""
+        return text[index + len(_FINAL_ANSWER):]
+
+    def _line(self, line, final=False):
+        """Process one complete line and return the text it releases"""
+        self._line_number += 1
+        line = line.rstrip("\r")
+        if not self._started:
+            if not line.strip():
+                return ""
+            self._started = True
+            line = line.lstrip(" \t")  # e.g. the space after "Final Answer:"
+            fence = _FENCE.match(line)
+            if fence and fence.group(2).lower() in _WRAPPER_INFO:
+                return ""
+
+        if not line.strip():
+            if self._fence is not None and not self._held_fence:
+                return self._emit(line)
+            self._held.append(line)
+            return ""
+        # More content follows a held fence, so it opened a code block
+        self._held_fence = False
+
+        # Cheap first-character checks keep the regexes off ordinary lines
+        fence = _FENCE.match(line) if line.lstrip(" ")[:1] in "`~" else None
+        if fence:
+            char, length, info = fence.group(1)[0], len(fence.group(1)), fence.group(2)
+            if self._fence is None:
+                if not info and final:
+                    return ""  # Unmatched fence ending the document
+                self._fence = (char, length)
+                self._tree_closed = {}
+                if not info:
+                    # Maybe the wrapper's closing fence: decided by what follows
+                    self._held.append(line)
+                    self._held_fence = True
+                    return ""
+            elif char == self._fence[0] and length >= self._fence[1] and not info:
+                self._fence = None
+            return self._emit(line)
+
+        if self._fence is not None:
+            if "──" in line:
+                self._check_tree(line)
+            elif line.strip():
+                self._tree_closed = {}  # A new root, e.g. "backend/"
+        elif line[0] == "#":
+            line = self._heading(line)
+        return self._emit(line)
+
+    def _emit(self, line):
+        if not self._emitted:
+            # Blank lines after a dropped wrapper are still leading ones
+            while self._held and not self._held[0].strip():
+                self._held.pop(0)
+        if self._held:
+            line = "\n".join(self._held + [line])
+            self._held = []
+        if self._emitted:
+            return "\n" + line
+        self._emitted = True
+        return line
+
+    def _heading(self, line):
+        match = _HEADING.match(line)
+        if not match or not match.group(2):
+            return line
+        hashes = match.group(1)
+        if hashes == "#":
+            if self._titled:
+                hashes = "##"
+            self._titled = True
+        return f"{hashes} {match.group(2)}"
+
+    def _check_tree(self, line):
+        """Record structural problems in a file tree line inside a code block"""
+        line = line.replace("\u00a0", " ")  # `tree` pads with non-breaking spaces
+        entry = _TREE_ENTRY.match(line)
+        if entry is None:
+            return
+        columns, connector, name = entry.groups()
+        depth = len(columns) // 4 + 1
+        closed = self._tree_closed
+        if depth > 1 and depth - 1 not in closed:
+            self._issue(f"'{name}' is nested deeper than the entry above it")
+        else:
+            if closed.get(depth):
+                self._issue(f"'{name}' follows the last entry (└──) of its directory")
+            for level in range(1, depth):
+                expected = "    " if closed.get(level) else "│   "
+                if columns[(level - 1) * 4:level * 4] != expected:
+                    self._issue(f"'{name}' has a misaligned │ column")
+                    break
+        for level in [level for level in closed if level > depth]:
+            del closed[level]
+        closed[depth] = connector == "└"
+
+    def _issue(self, message):
+        self.issues.append(f"line {self._line_number}: {message}")
+
+
+def normalize_markdown(text):
+    """Normalized ``text`` in one pass; see ``MarkdownNormalizer``"""
+    normalizer = MarkdownNormalizer()
+    return normalizer.feed(str(text)) + normalizer.finish()
@@ -0,0 +1,319 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+from instrumentation import METRICS
+
+from .scheduler import BATCH, INTERACTIVE, LANES, FairQueue
+
+
+class AdmissionRejected(Exception):
+    """Raised when a plan generation is shed instead of admitted
+
+    ``status`` is 429 when the client is over its own limit and 503 when the
+    server as a whole is saturated; ``retry_after`` is a hint in seconds.
+    """
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, client_id, wake, lane):
+        self.client_id = client_id
+        self.wake = wake
+        self.lane = lane
+        self.admitted = False
+
+
+class AdmissionController:
+    """Bounds concurrent plan generations globally and per client
+
+    Up to ``max_concurrent`` generations run at once. Generations come in
+    two lanes: ``interactive`` requests a user is waiting on, and ``batch``
+    work (background jobs and batch items), which may use at most
+    ``batch_slots`` slots so bulk work never takes every slot.
+
+    In the interactive lane each client may hold at most ``max_per_client``
+    slots, counting the ones it is waiting for, and requests beyond the
+    global limit wait in a queue of at most ``max_queue`` entries for up to
+    ``queue_timeout`` seconds. Everything else is rejected straight away,
+    so an overload turns into fast 429/503 responses instead of piles of
+    threads and upstream rate-limit errors. Batch work is already bounded
+    by its own pools and waits for as long as it takes.
+
+    Waiters are served by a ``FairQueue``: interactive before batch, clients
+    in weighted round-robin (``client_weights``) within a lane, and batch
+    work that has waited ``aging_seconds`` longer than the oldest
+    interactive request goes first.
+    """
+
+    # Assumed generation time until real ones have been observed
+    DEFAULT_HOLD_SECONDS = 30.0
+
+    # Queue waits kept per lane for the p95 in ``stats``
+    RECENT_WAITS = 500
+
+    def __init__(self, max_concurrent=8, max_per_client=2, max_queue=32, queue_timeout=30,
+                 batch_slots=4, aging_seconds=60.0, client_weights=None):
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.batch_slots = batch_slots
+        self._lock = threading.Lock()
+        self._active = 0
+        self._lane_active = dict.fromkeys(LANES, 0)
+        self._queue = FairQueue(weights=client_weights, aging_seconds=aging_seconds)
+        self._waits = {lane: deque(maxlen=self.RECENT_WAITS) for lane in LANES}
+        self._clients = {}  # client_id -> active + waiting interactive slots
+        self._hold_seconds = self.DEFAULT_HOLD_SECONDS
+        self.admitted = 0
+        self.rejected = {"client_limit": 0, "queue_full": 0, "queue_timeout": 0}
+
+    def _reject(self, reason):
+        # Caller holds the lock
+        self.rejected[reason] += 1
+        METRICS.inc("buildpilot_admission_rejections_total", [("reason", reason)])
+        if reason == "client_limit":
+            return AdmissionRejected(
+                "Too many concurrent plan generations for this client",
+                429, self._retry_after(1),
+            )
+        message = ("Server is busy, try again later" if reason == "queue_full"
+                   else "Timed out waiting for a free generation slot")
+        return AdmissionRejected(message, 503, self._retry_after(self._queue.waiting(INTERACTIVE) + 1))
+
+    def _retry_after(self, queue_position):
+        # Time for ``queue_position`` slots to free up at the observed pace
+        seconds = self._hold_seconds * queue_position / max(1, self.max_concurrent)
+        return max(1, min(600, math.ceil(seconds)))
+
+    def _lane_open(self, lane):
+        return lane != BATCH or self._lane_active[BATCH] < self.batch_slots
+
+    def _start(self, lane, waited):
+        # Caller holds the lock
+        self._active += 1
+        self._lane_active[lane] += 1
+        self.admitted += 1
+        self._waits[lane].append(waited)
+        METRICS.observe("buildpilot_queue_wait_seconds", waited, [("lane", lane)])
+
+    def _enter(self, client_id, wake, lane):
+        """Admit, enqueue (returning the waiter) or raise; caller holds the lock"""
+        interactive = lane == INTERACTIVE
+        if interactive and self._clients.get(client_id, 0) >= self.max_per_client:
+            raise self._reject("client_limit")
+        if self._active < self.max_concurrent and self._lane_open(lane) and not self._queue.waiting(lane):
+            if interactive:
+                self._clients[client_id] = self._clients.get(client_id, 0) + 1
+            self._start(lane, 0.0)
+            return None
+        if interactive and self._queue.waiting(INTERACTIVE) >= self.max_queue:
+            raise self._reject("queue_full")
+        if interactive:
+            self._clients[client_id] = self._clients.get(client_id, 0) + 1
+        waiter = _Waiter(client_id, wake, lane)
+        self._queue.push(waiter, client_id, lane)
+        return waiter
+
+    def _abandon(self, waiter):
+        """Handle a waiter that stopped waiting; True if it was admitted meanwhile"""
+        if waiter.admitted:
+            return True
+        self._queue.remove(waiter, waiter.client_id, waiter.lane)
+        if waiter.lane == INTERACTIVE:
+            self._forget(waiter.client_id)
+        return False
+
+    def _forget(self, client_id):
+        remaining = self._clients.get(client_id, 0) - 1
+        if remaining > 0:
+            self._clients[client_id] = remaining
+        else:
+            self._clients.pop(client_id, None)
+
+    def _timeout(self, lane):
+        return self.queue_timeout if lane == INTERACTIVE else None
+
+    def acquire(self, client_id, lane=INTERACTIVE):
+        """Block until a slot is free; raises AdmissionRejected when shedding"""
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enter(client_id, event.set, lane)
+        if waiter is None:
+            return
+
+        event.wait(self._timeout(lane))
+        with self._lock:
+            if not self._abandon(waiter):
+                raise self._reject("queue_timeout")
+
+    async def aacquire(self, client_id, lane=INTERACTIVE):
+        """Like ``acquire`` but waits on the event loop instead of a thread"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        with self._lock:
+            waiter = self._enter(client_id, wake, lane)
+        if waiter is None:
+            return
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self._timeout(lane))
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not self._abandon(waiter):
+                    raise self._reject("queue_timeout")
+        except asyncio.CancelledError:
+            # The client went away; hand back a slot granted in the meantime
+            with self._lock:
+                admitted = self._abandon(waiter)
+            if admitted:
+                self.release(client_id, lane=lane)
+            raise
+
+    def release(self, client_id, held_seconds=None, lane=INTERACTIVE):
+        with self._lock:
+            self._active -= 1
+            self._lane_active[lane] -= 1
+            if lane == INTERACTIVE:
+                self._forget(client_id)
+            if held_seconds is not None:
+                # Moving average of generation time, used for Retry-After
+                self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held_seconds
+                METRICS.observe("buildpilot_execution_seconds", held_seconds, [("lane", lane)])
+            while self._active < self.max_concurrent:
+                entry = self._queue.pop(self._lane_open)
+                if entry is None:
+                    break
+                waiter, waiter_lane, waited = entry
+                waiter.admitted = True
+                self._start(waiter_lane, waited)
+                waiter.wake()
+
+    @contextmanager
+    def admit(self, client_id, lane=INTERACTIVE):
+        self.acquire(client_id, lane)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(client_id, time.monotonic() - started, lane)
+
+    @asynccontextmanager
+    async def aadmit(self, client_id, lane=INTERACTIVE):
+        await self.aacquire(client_id, lane)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(client_id, time.monotonic() - started, lane)
+
+    def hold_until_closed(self, iterable, client_id, lane=INTERACTIVE):
+        """Wrap a streaming response body so the slot is released when it ends
+
+        Django closes the body even if the client disconnects before it is
+        iterated, which a generator's ``finally`` would miss.
+        """
+        return _HeldStream(self, iterable, client_id, lane)
+
+    def stats(self):
+        with self._lock:
+            lanes = {}
+            for lane in LANES:
+                waits = sorted(self._waits[lane])
+                lanes[lane] = {
+                    "active": self._lane_active[lane],
+                    "waiting": self._queue.waiting(lane),
+                    "queue_wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                }
+            return {
+                "active": self._active,
+                "waiting": len(self._queue),
+                "clients": len(self._clients),
+                "max_concurrent": self.max_concurrent,
+                "max_per_client": self.max_per_client,
+                "max_queue": self.max_queue,
+                "batch_slots": self.batch_slots,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "lanes": lanes,
+            }
+
+
+class _HeldStream:
+    def __init__(self, controller, iterable, client_id, lane):
+        self.controller = controller
+        self.iterable = iterable
+        self.iterator = iter(iterable)
+        self.client_id = client_id
+        self.lane = lane
+        self.started = time.monotonic()
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if self.released:
+            return
+        self.released = True
+        try:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+        finally:
+            self.controller.release(self.client_id, time.monotonic() - self.started, self.lane)
+
+
+def client_id(request):
+    """Identify the caller for per-client limits
+
+    Uses the first X-Forwarded-For address when the app is configured to
+    trust its proxy, otherwise the socket peer address.
+    """
+    if settings.PLAN_ADMISSION['TRUST_X_FORWARDED_FOR']:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', 'unknown')
+
+
+_admission_controller = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Return the process-wide admission controller, creating it on first use"""
+    global _admission_controller
+    with _admission_controller_lock:
+        if _admission_controller is None:
+            config = settings.PLAN_ADMISSION
+            _admission_controller = AdmissionController(
+                max_concurrent=config['MAX_CONCURRENT'],
+                max_per_client=config['MAX_PER_CLIENT'],
+                max_queue=config['MAX_QUEUE'],
+                queue_timeout=config['QUEUE_TIMEOUT'],
+                batch_slots=config['BATCH_SLOTS'],
+                aging_seconds=config['AGING_SECONDS'],
+                client_weights=config['CLIENT_WEIGHTS'],
+            )
+        return _admission_controller
@@ -1,78 +1,688 @@
-import os
-import sys
 import re
-from pathlib import Path
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-from crewai import Crew, Process
 
-# Add the backend directory to Python path
-backend_dir = Path(__file__).resolve().parent.parent
-sys.path.append(str(backend_dir))
+# crewai and LangChain take seconds to import, so they are loaded with the
+# first generation (or by ``preload``), not with this module
+from agents import CustomAgents, DOCUMENTATION_SPECIALIST, PROJECT_PLANNER
+from incremental import (
+    affected_units, diff_requirements, has_sections, heading_topic, rewrite_share, select_units,
+    splice_units, split_units,
+)
+from instrumentation import PlanRun
+from llm_pool import get_registry
+from markdown_normalizer import MarkdownNormalizer
+from tasks import CustomTasks, PROJECT_ANALYSIS_OUTPUT, README_GENERATION_OUTPUT, README_SECTION_OUTPUT
+from .cache import get_plan_cache, make_cache_key
+from .pipeline_runs import PipelineRunStore, PipelineRunUnavailable, get_pipeline_run_store
+from .plan_store import get_plan_store
+from .singleflight import get_single_flight
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineCancelled(Exception):
+    """Base for errors that stop a pipeline because its client gave up on it"""
+
+
+class PipelineError(Exception):
+    """A failed generation, carrying the ID of the run that can be resumed"""
+
+    def __init__(self, message, run_id):
+        super().__init__(message)
+        self.run_id = run_id
+
+
+class PipelineRunCancelled(PipelineError, PipelineCancelled):
+    """A generation stopped by its own client, carrying the ID of the run that can be resumed"""
+
+
+class StreamCancelled(PipelineCancelled):
+    """Raised inside the crew thread once the streaming client has gone away"""
+
+
+def preload(crew=True):
+    """Import the crew and LLM libraries and build the shared agents now
+
+    Generation otherwise pays for these on first use. Called from
+    ``ProjectApiConfig.ready`` when ``PLAN_PRELOAD`` is on, so a worker is
+    warm before its first request; a failure is logged, not raised, and the
+    first generation will retry it. ``crew=False`` stops short of crewai,
+    which starts native threads on import (through chromadb/onnxruntime)
+    and so must not be loaded in a process that forks afterwards.
+    """
+    try:
+        import langchain_core.messages  # noqa: F401
+        from . import streaming  # noqa: F401
+
+        agents = get_registry().get_agents()
+        if crew:
+            import crewai  # noqa: F401
+            agents.project_planner_agent()
+            agents.documentation_agent()
+    except Exception:
+        logger.exception("Preloading the plan generation libraries failed")
 
-from agents import CustomAgents
-from tasks import CustomTasks
 
 class ProjectPlanningService:
+    STREAM_HEARTBEAT_SECONDS = 15
+    _STREAM_END = object()
+
     def __init__(self):
-        self.agents = CustomAgents()
+        # Shared across requests: pooled LLM client and prebuilt agent templates
+        self.agents = get_registry().get_agents()
         self.tasks = CustomTasks()
+        self._pipeline_run_id = None
+        self._pipeline_key = None
+        # Sections rewritten by the last incremental regeneration, None after a full one
+        self.regenerated_sections = None
+        # Stored plan that the last regeneration returned as is, because nothing changed
+        self.unchanged_plan_id = None
+    
+    @property
+    def pipeline_run_id(self):
+        """ID of the pipeline run behind the last plan this service returned
+
+        Cached plans and coalesced requests are traced back to the newest
+        finished run for the same inputs.
+        """
+        if self._pipeline_run_id is None and self._pipeline_key is not None:
+            record = get_pipeline_run_store().latest_succeeded(self._pipeline_key)
+            self._pipeline_run_id = record["id"] if record else None
+        return self._pipeline_run_id
     
     def clean_markdown_response(self, content):
-        """Clean up the AI response by removing markdown code block wrappers"""
-        content = str(content).strip()
-        
-        # Remove markdown code block wrapper if present
-        markdown_pattern = r'^```(?:markdown)?\s*\n(.*?)\n```$'
-        match = re.match(markdown_pattern, content, re.DOTALL)
-        if match:
-            content = match.group(1).strip()
-        
-        # Also handle cases where there might be extra backticks at start/end
-        content = re.sub(r'^`{3,}(?:markdown)?\s*\n?', '', content)
-        content = re.sub(r'\n?`{3,}$', '', content)
-        
-        return content.strip()
-    
-    def generate_project_plan(self, project_name, project_description):
-        """Generate project plan using AI agents"""
+        """Clean up the AI response: code fence wrappers, headings, file tree checks"""
+        normalizer = MarkdownNormalizer()
+        content = normalizer.feed(str(content)) + normalizer.finish()
+        for issue in normalizer.issues:
+            logger.warning("Generated markdown, %s", issue)
+        return content
+    
+    def merge_readme_sections(self, project_name, sections):
+        """Join separately written README sections under one title, in the given order
+
+        Each section is cleaned like a whole README and put under its
+        ``## `` heading, replacing the title and heading the model opened it
+        with, so the document has one title and consistent section headings.
+        """
+        parts = [f"# {project_name}"]
+        for heading, content in sections:
+            body = self.clean_markdown_response(content)
+            body = re.sub(r'^#\s[^\n]*\n*', '', body)
+            body = re.sub(r'^##\s[^\n]*', '', body).strip()
+            parts.append(f"## {heading}\n\n{body}" if body else f"## {heading}")
+        return "\n\n".join(parts)
+    
+    def cache_key(self, project_name, project_description):
+        """Key identifying this request's plan for the current model and prompts"""
+        return make_cache_key(
+            project_name,
+            project_description,
+            f"{self.agents.MODEL_NAME}@{self.agents.TEMPERATURE}",
+            self.tasks.prompt_fingerprint(),
+        )
+    
+    def similar_plan(self, project_name, project_description):
+        """A plan generated for a near-duplicate description, retitled for this project, or None"""
+        if not settings.PLAN_SIMILARITY_CACHE['ENABLED']:
+            return None
+        # NumPy is only loaded when the similarity cache is on
+        from .similarity import adapt_plan, get_similarity_index
+        match = get_similarity_index().lookup(project_description, self._similarity_namespace())
+        if match is None:
+            return None
+        logger.info("Reusing the plan for %r as %r (similarity %.2f)",
+                    match.project_name, project_name, match.score)
+        return adapt_plan(match.plan, match.project_name, project_name)
+    
+    def remember_plan(self, project_name, project_description, plan):
+        """Make ``plan`` available to later near-duplicate descriptions"""
+        if not settings.PLAN_SIMILARITY_CACHE['ENABLED']:
+            return
+        from .similarity import get_similarity_index
+        get_similarity_index().add(project_description, project_name, plan, self._similarity_namespace())
+    
+    def _similarity_namespace(self):
+        # Plans only stand in for each other when made by the same model and prompts
+        return f"{self.agents.MODEL_NAME}@{self.agents.TEMPERATURE}:{self.tasks.prompt_fingerprint()}"
+    
+    def new_run(self):
+        """Fresh timing/token record for one generation"""
+        return PlanRun(model_name=self.agents.MODEL_NAME)
+    
+    def generate_project_plan(self, project_name, project_description,
+                              progress_callback=None, use_cache=True, timings=None):
+        """Generate project plan using AI agents
+
+        ``progress_callback`` is called with a stage name ("analysis",
+        "readme", "completed") as the crew moves through its tasks.
+        Pass ``use_cache=False`` to skip the plan cache and similarity lookups, and a
+        ``PlanRun`` as ``timings`` to receive per-stage timings and tokens.
+
+        A recent failed or cancelled run for the same inputs is resumed
+        from its stored analysis unless ``use_cache`` is False.
+        """
+        run = timings if timings is not None else self.new_run()
+        self._pipeline_key = None
+
+        def report(stage):
+            if progress_callback:
+                progress_callback(stage)
+
+        run.stage("cache_lookup")
+        cache = get_plan_cache()
+        key = self.cache_key(project_name, project_description)
+        if cache and use_cache:
+            cached_plan = cache.get(key)
+            if cached_plan is not None:
+                self._pipeline_key = key
+                run.finish("cached")
+                report("completed")
+                return cached_plan
+        if use_cache:
+            similar_plan = self.similar_plan(project_name, project_description)
+            if similar_plan is not None:
+                run.finish("similar")
+                report("completed")
+                return similar_plan
+
+        def generate():
+            pipeline = self._start_pipeline(key, project_name, project_description, resume=use_cache)
+            plan = self._run_pipeline(pipeline, report, run)
+            if cache:
+                cache.set(key, plan)
+            self.remember_plan(project_name, project_description, plan)
+            return plan
+
+        # Identical requests already in flight share one crew run; followers
+        # spend their time in the "coalesced_wait" stage
+        run.stage("coalesced_wait")
         try:
-            # Create agents
+            with run.activate():
+                # A leader's cancellation is its own: followers take over the run
+                plan = get_single_flight().do(key, generate, unshared=(PipelineCancelled,))
+        except Exception:
+            run.finish("error")
+            raise
+        self._pipeline_key = key
+        run.finish("success")
+        report("completed")
+        return plan
+    
+    def resume_pipeline(self, run_id, progress_callback=None, timings=None):
+        """Finish a failed or cancelled run from its last completed stage"""
+        store = get_pipeline_run_store()
+        pipeline = store.get(run_id)
+        if pipeline is None:
+            raise PipelineRunUnavailable("Pipeline run not found", 404)
+        if pipeline["status"] == PipelineRunStore.SUCCEEDED:
+            raise PipelineRunUnavailable(
+                "Pipeline run already finished; regenerate its README instead", 409
+            )
+        return self._continue_pipeline(pipeline, progress_callback, timings)
+    
+    def regenerate_readme(self, run_id, progress_callback=None, timings=None):
+        """Run only the README stage again, reusing the run's stored analysis"""
+        pipeline = get_pipeline_run_store().get(run_id)
+        if pipeline is None:
+            raise PipelineRunUnavailable("Pipeline run not found", 404)
+        if pipeline["analysis"] is None:
+            raise PipelineRunUnavailable("Pipeline run has no stored analysis to reuse", 409)
+        return self._continue_pipeline(pipeline, progress_callback, timings)
+    
+    def _continue_pipeline(self, pipeline, progress_callback, timings):
+        run = timings if timings is not None else self.new_run()
+
+        def report(stage):
+            if progress_callback:
+                progress_callback(stage)
+
+        if not get_pipeline_run_store().claim(pipeline["id"]):
+            raise PipelineRunUnavailable("Pipeline run is already in progress", 409)
+        try:
+            with run.activate():
+                plan = self._run_pipeline(pipeline, report, run)
+        except Exception:
+            run.finish("error")
+            raise
+        # Later requests for the same inputs get the new plan
+        cache = get_plan_cache()
+        if cache:
+            cache.set(pipeline["cache_key"], plan)
+        self.remember_plan(pipeline["project_name"], pipeline["project_description"], plan)
+        run.finish("success")
+        report("completed")
+        return plan
+    
+    def regenerate_plan(self, plan_id, project_description, project_name=None,
+                        progress_callback=None, timings=None):
+        """Regenerate a stored plan for an edited description, rewriting only what changed
+
+        The old and new descriptions are diffed requirement by requirement,
+        and only the analysis and README sections the changes affect are
+        regenerated; the rest are spliced back in unchanged. Falls back to a
+        full generation when the plan's pipeline run has expired, the name
+        changed, the old plan has no "## " sections to splice, more than
+        ``PLAN_INCREMENTAL_MAX_CHANGE`` of the requirements or of the
+        analysis would change, or the sections to rewrite are over the
+        analysis token budget.
+        """
+        record = get_plan_store().get(plan_id)
+        if record is None:
+            raise PipelineRunUnavailable("Plan not found", 404)
+        project_name = project_name or record["project_name"]
+        previous = get_pipeline_run_store().get(record["run_id"]) if record["run_id"] else None
+        run = timings if timings is not None else self.new_run()
+
+        def report(stage):
+            if progress_callback:
+                progress_callback(stage)
+
+        incremental = (
+            previous is not None and previous["readme"] is not None
+            and project_name == previous["project_name"]
+            and has_sections(previous["analysis"]) and has_sections(previous["readme"])
+        )
+        if incremental:
+            diff = diff_requirements(previous["project_description"], project_description)
+            if not diff.changed:
+                self._pipeline_run_id = previous["id"]
+                self.regenerated_sections = {"analysis": [], "readme": []}
+                self.unchanged_plan_id = plan_id
+                run.finish("cached")
+                report("completed")
+                return previous["readme"]
+            analysis_units = split_units(previous["analysis"])
+            targets = affected_units(analysis_units, diff.text)
+            # The README follows the analysis: its matching sections are rewritten
+            # from the updated analysis text
+            readme_units = split_units(previous["readme"])
+            topics = {heading_topic(section) for section, _ in targets}
+            readme_targets = affected_units(readme_units, diff.text, topics=topics)
+            max_change = settings.PLAN_INCREMENTAL_MAX_CHANGE
+            incremental = (diff.change_ratio <= max_change
+                           and rewrite_share(analysis_units, targets) <= max_change
+                           and self.tasks.fits_analysis_budget(select_units(analysis_units, targets))
+                           and self.tasks.fits_analysis_budget(select_units(readme_units, readme_targets)))
+
+        if not incremental:
+            return self.generate_project_plan(
+                project_name, project_description, progress_callback=progress_callback, timings=run
+            )
+
+        key = self.cache_key(project_name, project_description)
+        pipeline = get_pipeline_run_store().create(key, project_name, project_description)
+        try:
+            with run.activate():
+                plan = self._run_incremental(pipeline, previous, diff, targets, readme_targets, report, run)
+        except Exception:
+            run.finish("error")
+            raise
+        cache = get_plan_cache()
+        if cache:
+            cache.set(key, plan)
+        self.remember_plan(project_name, project_description, plan)
+        run.finish("success")
+        report("completed")
+        return plan
+    
+    def _run_incremental(self, pipeline, previous, diff, targets, readme_targets, report, run):
+        """Rewrite the analysis ``targets`` and README ``readme_targets``, splicing them into the previous run's output"""
+        store = get_pipeline_run_store()
+        run_id = self._pipeline_run_id = pipeline["id"]
+        project_name = pipeline["project_name"]
+        try:
+            run.stage("setup")
             planner = self.agents.project_planner_agent()
             documenter = self.agents.documentation_agent()
             
-            # Create tasks
-            analysis_task = self.tasks.project_analysis_task(
-                planner, project_name, project_description
-            )
-            readme_task = self.tasks.readme_generation_task(
-                documenter, project_name, analysis_task.expected_output
+            run.stage("analysis")
+            report("analysis")
+            analysis_units = split_units(previous["analysis"])
+            update_task = self.tasks.analysis_update_task(
+                planner, project_name, diff, select_units(analysis_units, targets)
             )
+            updated_analysis = self.clean_markdown_response(self._kickoff(planner, update_task))
+            analysis, analysis_changed = splice_units(analysis_units, updated_analysis, targets)
+            store.checkpoint(run_id, "analysis", analysis)
             
-            # Create crew
-            crew = Crew(
-                agents=[planner, documenter],
-                tasks=[analysis_task, readme_task],
-                process=Process.sequential,
-                verbose=False  # Set to False for API usage
+            run.stage("readme")
+            report("readme")
+            readme_units = split_units(previous["readme"])
+            update_task = self.tasks.readme_update_task(
+                documenter, project_name, diff, updated_analysis,
+                select_units(readme_units, readme_targets),
             )
+            updated_readme = self.clean_markdown_response(self._kickoff(documenter, update_task))
+            readme, readme_changed = splice_units(readme_units, updated_readme, readme_targets)
             
-            # Execute and clean the result
-            crew_output = crew.kickoff()
-            cleaned_output = self.clean_markdown_response(crew_output)
-            return cleaned_output
+            run.stage("postprocess")
+            store.checkpoint(run_id, "readme", readme)
+            store.set_status(run_id, PipelineRunStore.SUCCEEDED)
+            self.regenerated_sections = {"analysis": analysis_changed, "readme": readme_changed}
+            return readme
             
+        except PipelineCancelled as e:
+            store.set_status(run_id, PipelineRunStore.CANCELLED, str(e))
+            raise PipelineRunCancelled(f"Project plan regeneration was cancelled: {str(e)}", run_id)
         except Exception as e:
-            raise Exception(f"Error generating project plan: {str(e)}")
+            store.set_status(run_id, PipelineRunStore.FAILED, str(e))
+            raise PipelineError(f"Error regenerating project plan: {str(e)}", run_id)
+    
+    def stream_project_plan(self, project_name, project_description, use_cache=True):
+        """Generate a plan, yielding ``(event, data)`` pairs as it is produced
+
+        Yields stage markers ("analysis_started", "analysis_done"), README
+        tokens as they arrive from the LLM, and a final "done" event carrying
+        the ``plan_id`` the plan was stored under. Yields ``(None, None)`` as a
+        heartbeat while the analysis stage is quiet.
+        """
+        cache = get_plan_cache()
+        key = self.cache_key(project_name, project_description)
+        reused, done = None, {"cached": True}
+        if cache and use_cache:
+            reused = cache.get(key)
+            if reused is not None:
+                self._pipeline_key = key
+        if reused is None and use_cache:
+            reused = self.similar_plan(project_name, project_description)
+            done["similar"] = True
+        if reused is not None:
+            yield "token", {"text": reused}
+            try:
+                record = self.save_plan(project_name, project_description, reused)
+            except Exception as e:
+                yield "error", {"error": str(e), "run_id": None}
+                return
+            yield "done", dict(done, plan_id=record["id"])
+            return
+
+        from .streaming import TokenQueueHandler
+
+        events = queue.Queue()
+        handler = TokenQueueHandler(events)
+        streaming_agents = CustomAgents(streaming=True, callbacks=[handler])
+        run = self.new_run()
+
+        def report(stage):
+            if stage == "analysis":
+                events.put(("stage", {"stage": "analysis_started"}))
+            elif stage == "readme":
+                handler.stage = "readme"
+                events.put(("stage", {"stage": "analysis_done"}))
+
+        def generate():
+            try:
+                pipeline = self._start_pipeline(key, project_name, project_description, resume=use_cache)
+                with run.activate():
+                    # Sections written in parallel would interleave their tokens
+                    plan = self._run_pipeline(pipeline, report, run, agents=streaming_agents, fanout=False)
+                if cache:
+                    cache.set(key, plan)
+                self.remember_plan(project_name, project_description, plan)
+                record = self.save_plan(project_name, project_description, plan)
+                run.finish("success")
+                handler.finish()
+                events.put(("done", {"cached": False, "run_id": pipeline["id"], "plan_id": record["id"]}))
+            except Exception as e:
+                run.finish("error")
+                if not handler.cancelled.is_set():
+                    events.put(("error", {"error": str(e), "run_id": getattr(e, "run_id", None)}))
+            finally:
+                events.put(self._STREAM_END)
+
+        threading.Thread(target=generate, name="plan-stream", daemon=True).start()
+
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=self.STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield None, None
+                    continue
+                if item is self._STREAM_END:
+                    return
+                yield item
+        finally:
+            # Client disconnected or stream finished: stop the crew at the next token
+            handler.cancelled.set()
     
-    # def save_plan_to_file(self, project_name, plan_content):
-    #     """Save the generated plan to a markdown file"""
-    #     try:
-    #         filename = f"{project_name.replace(' ', '_').lower()}_plan.md"
-    #         file_path = settings.GENERATED_PLANS_DIR / filename
+    def _start_pipeline(self, key, project_name, project_description, resume=True):
+        """Pick up an unfinished run for these inputs, or start a new one"""
+        store = get_pipeline_run_store()
+        if resume:
+            pipeline = store.resumable(key)
+            if pipeline is not None and store.claim(pipeline["id"]):
+                return pipeline
+        return store.create(key, project_name, project_description)
+    
+    def _run_pipeline(self, pipeline, report, run, agents=None, fanout=True):
+        """Run the stages a pipeline run has not finished and return the cleaned plan
+
+        Each stage runs as its own single-task crew and its output is
+        checkpointed as soon as it finishes, so a run that fails in the
+        README stage keeps its analysis. With README fan-out enabled and
+        ``fanout`` True, the README sections are written concurrently.
+        """
+        agents = agents or self.agents
+        store = get_pipeline_run_store()
+        run_id = self._pipeline_run_id = pipeline["id"]
+        project_name = pipeline["project_name"]
+        try:
+            # Create agents
+            run.stage("setup")
+            planner = agents.project_planner_agent()
+            
+            analysis = pipeline["analysis"]
+            if analysis is None:
+                run.stage("analysis")
+                report("analysis")
+                analysis_task = self.tasks.project_analysis_task(
+                    planner, project_name, pipeline["project_description"]
+                )
+                analysis = self._kickoff(planner, analysis_task)
+                store.checkpoint(run_id, "analysis", analysis)
+            
+            run.stage("readme")
+            report("readme")
+            if fanout and self.tasks.readme_fanout:
+                readme = self._kickoff_sections(agents, project_name, analysis)
+            else:
+                documenter = agents.documentation_agent()
+                readme_task = self.tasks.readme_generation_task(documenter, project_name, analysis)
+                readme = self._kickoff(documenter, readme_task)
             
-    #         with open(file_path, 'w', encoding='utf-8') as f:
-    #             f.write(plan_content)
+            run.stage("postprocess")
+            cleaned_output = self.clean_markdown_response(readme)
+            store.checkpoint(run_id, "readme", cleaned_output)
+            store.set_status(run_id, PipelineRunStore.SUCCEEDED)
+            return cleaned_output
             
-    #         return str(file_path)
-    #     except Exception as e:
-    #         raise Exception(f"Error saving plan to file: {str(e)}")
\ No newline at end of file
+        except PipelineCancelled as e:
+            store.set_status(run_id, PipelineRunStore.CANCELLED, str(e))
+            raise PipelineRunCancelled(f"Project plan generation was cancelled: {str(e)}", run_id)
+        except Exception as e:
+            store.set_status(run_id, PipelineRunStore.FAILED, str(e))
+            raise PipelineError(f"Error generating project plan: {str(e)}", run_id)
+    
+    def _kickoff(self, agent, task):
+        from crewai import Crew, Process
+
+        crew = Crew(
+            agents=[agent],
+            tasks=[task],
+            process=Process.sequential,
+            verbose=False,  # Set to False for API usage
+        )
+        return str(crew.kickoff()).strip()
+    
+    def _kickoff_sections(self, agents, project_name, analysis):
+        """Write each README section in its own crew, all at once, and merge them"""
+        section_tasks = self.tasks.readme_section_tasks(agents.documentation_agent, project_name, analysis)
+        with ThreadPoolExecutor(max_workers=len(section_tasks), thread_name_prefix="readme-section") as pool:
+            # Each call gets a copy of this context so its LLM calls count towards the active PlanRun
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._kickoff, task.agent, task)
+                for _, task in section_tasks
+            ]
+            sections = [(heading, future.result()) for (heading, _), future in zip(section_tasks, futures)]
+        return self.merge_readme_sections(project_name, sections)
+    
+    def save_plan(self, project_name, project_description, plan):
+        """Keep the generated plan in the plan store and return its record"""
+        try:
+            return get_plan_store().save(
+                project_name, project_description, plan, run_id=self.pipeline_run_id
+            )
+        except Exception as e:
+            raise Exception(f"Error saving plan: {str(e)}")
+
+
+class AsyncProjectPlanningService(ProjectPlanningService):
+    """Plan generation for async views that awaits the LLM instead of blocking a thread
+
+    The two stages run as direct chat completions built from the same agent
+    personas and task prompts the crew uses, so a single event loop can hold
+    many long-running generations at once.
+    """
+
+    # In-flight generations per event loop, keyed by cache key. A task can only
+    # be awaited on its own loop, and under WSGI each request runs on a new one.
+    _in_flight = weakref.WeakKeyDictionary()
+    _in_flight_lock = threading.Lock()
+
+    @classmethod
+    def _loop_in_flight(cls):
+        loop = asyncio.get_running_loop()
+        with cls._in_flight_lock:
+            return cls._in_flight.setdefault(loop, {})
+
+    async def generate_project_plan(self, project_name, project_description,
+                                    progress_callback=None, use_cache=True, timings=None):
+        """Generate project plan using async LLM calls"""
+        run = timings if timings is not None else self.new_run()
+        self._pipeline_key = None
+
+        def report(stage):
+            if progress_callback:
+                progress_callback(stage)
+
+        run.stage("cache_lookup")
+        cache = get_plan_cache()
+        key = self.cache_key(project_name, project_description)
+        # The file cache and the similarity index do blocking I/O, so they run
+        # on a thread like the checkpoints
+        if cache and use_cache:
+            cached_plan = await asyncio.to_thread(cache.get, key)
+            if cached_plan is not None:
+                self._pipeline_key = key
+                run.finish("cached")
+                report("completed")
+                return cached_plan
+        if use_cache:
+            similar_plan = await asyncio.to_thread(
+                self.similar_plan, project_name, project_description
+            )
+            if similar_plan is not None:
+                run.finish("similar")
+                report("completed")
+                return similar_plan
+
+        # Identical requests already in flight share one generation
+        run.stage("coalesced_wait")
+        in_flight = self._loop_in_flight()
+        task = in_flight.get(key)
+        if task is None:
+            with run.activate():
+                task = asyncio.ensure_future(
+                    self._run_stages(project_name, project_description, key, use_cache, report, run)
+                )
+            in_flight[key] = task
+            task.add_done_callback(lambda _: in_flight.pop(key, None))
+
+        try:
+            plan = await asyncio.shield(task)
+        except Exception:
+            run.finish("error")
+            raise
+        if cache:
+            await asyncio.to_thread(cache.set, key, plan)
+        await asyncio.to_thread(self.remember_plan, project_name, project_description, plan)
+        self._pipeline_key = key
+        run.finish("success")
+        report("completed")
+        return plan
+
+    async def _run_stages(self, project_name, project_description, key, use_cache, report, run):
+        # Checkpoints go through a thread so SQLite never blocks the event loop
+        store = get_pipeline_run_store()
+        pipeline = await asyncio.to_thread(
+            self._start_pipeline, key, project_name, project_description, use_cache
+        )
+        run_id = self._pipeline_run_id = pipeline["id"]
+        try:
+            analysis = pipeline["analysis"]
+            if analysis is None:
+                run.stage("analysis")
+                report("analysis")
+                analysis = await self._ainvoke(
+                    PROJECT_PLANNER,
+                    self.tasks.analysis_prompt(project_name, project_description),
+                    PROJECT_ANALYSIS_OUTPUT,
+                )
+                await asyncio.to_thread(store.checkpoint, run_id, "analysis", analysis)
+
+            run.stage("readme")
+            report("readme")
+            if self.tasks.readme_fanout:
+                prompts = self.tasks.readme_section_prompts(project_name, analysis)
+                sections = await asyncio.gather(*(
+                    self._ainvoke(DOCUMENTATION_SPECIALIST, prompt, README_SECTION_OUTPUT)
+                    for _, prompt in prompts
+                ))
+                readme = self.merge_readme_sections(
+                    project_name, zip((heading for heading, _ in prompts), sections)
+                )
+            else:
+                readme = await self._ainvoke(
+                    DOCUMENTATION_SPECIALIST,
+                    self.tasks.readme_prompt(project_name, analysis),
+                    README_GENERATION_OUTPUT,
+                )
+            run.stage("postprocess")
+            cleaned_output = self.clean_markdown_response(readme)
+            await asyncio.to_thread(store.checkpoint, run_id, "readme", cleaned_output)
+            await asyncio.to_thread(store.set_status, run_id, PipelineRunStore.SUCCEEDED)
+            return cleaned_output
+
+        except (PipelineCancelled, asyncio.CancelledError) as e:
+            await asyncio.to_thread(store.set_status, run_id, PipelineRunStore.CANCELLED, str(e))
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise PipelineRunCancelled(f"Project plan generation was cancelled: {str(e)}", run_id)
+        except Exception as e:
+            await asyncio.to_thread(store.set_status, run_id, PipelineRunStore.FAILED, str(e))
+            raise PipelineError(f"Error generating project plan: {str(e)}", run_id)
+
+    async def _ainvoke(self, persona, description, expected_output):
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        messages = [
+            SystemMessage(content=(
+                f"You are {persona['role']}. {persona['backstory']}\n"
+                f"Your personal goal is: {persona['goal']}"
+            )),
+            HumanMessage(content=(
+                f"{description}\n\n"
+                f"This is the expected criteria for your final answer: {expected_output}"
+            )),
+        ]
+        response = await self.agents.OpenAIGPT.ainvoke(messages)
+        return response.content
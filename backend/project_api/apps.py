@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class ProjectApiConfig(AppConfig):
+    name = 'project_api'
+
+    def ready(self):
+        # Load the crew and LLM libraries as the worker starts rather than
+        # during its first generation
+        if settings.PLAN_PRELOAD:
+            from .ai_service import preload
+            preload()
@@ -0,0 +1,115 @@
+import json
+import os
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from .admission import AdmissionRejected, client_id, get_admission_controller
+from .ai_service import AsyncProjectPlanningService
+from .cache import get_plan_cache
+from .jobs import JobQueueFull, get_job_manager
+from .responses import markdown_plan_response, wants_markdown
+
+# Native async views, used when the app is served through ASGI (they take over
+# the main endpoints when ASYNC_VIEWS is on). Plain Django views are used here
+# because DRF's @api_view does not support coroutines.
+
+@require_GET
+async def health_check(request):
+    """Health check endpoint"""
+    cache = get_plan_cache()
+    return JsonResponse({
+        "status": "healthy",
+        "message": "BuildPilot AI backend is running",
+        "plan_cache": cache.stats() if cache else None,
+        "admission": get_admission_controller().stats()
+    })
+
+@csrf_exempt
+@require_POST
+async def generate_plan(request):
+    """Generate project plan endpoint without holding a thread per request"""
+    try:
+        # Validate request data
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({
+                "error": "Request body must be valid JSON"
+            }, status=400)
+
+        project_name = data.get('project_name')
+        project_description = data.get('project_description')
+        use_cache = data.get('use_cache', True) is not False
+        include_timings = data.get('include_timings') is True
+
+        if not project_name or not project_description:
+            return JsonResponse({
+                "error": "Both project_name and project_description are required"
+            }, status=400)
+
+        # Check for OpenAI API key
+        if not os.getenv("OPENAI_API_KEY"):
+            return JsonResponse({
+                "error": "OpenAI API key not configured"
+            }, status=500)
+
+        # In async mode hand the work to the job pool and return immediately
+        if data.get('mode') == 'async':
+            try:
+                job = await sync_to_async(get_job_manager().submit)(
+                    project_name, project_description, use_cache=use_cache,
+                    client_id=client_id(request)
+                )
+            except JobQueueFull as e:
+                return JsonResponse({
+                    "error": str(e)
+                }, status=503)
+
+            return JsonResponse({
+                "message": "accepted",
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/api/jobs/{job.id}/"
+            }, status=202)
+
+        # Generate project plan once a generation slot is free
+        service = AsyncProjectPlanningService()
+        timings = service.new_run()
+        async with get_admission_controller().aadmit(client_id(request)):
+            plan = await service.generate_project_plan(
+                project_name, project_description, use_cache=use_cache, timings=timings
+            )
+
+        # Keep the plan so it can be listed and downloaded later
+        record = await sync_to_async(service.save_plan)(project_name, project_description, plan)
+        run_id = await sync_to_async(lambda: service.pipeline_run_id)()
+        if wants_markdown(data):
+            return markdown_plan_response(plan, record["id"], run_id, timings if include_timings else None)
+
+        data = {
+            "message": "success",
+            "plan": plan,
+            "plan_id": record["id"],
+            "download_url": f"/api/plans/{record['id']}/download/",
+            "run_id": run_id
+        }
+        if include_timings:
+            data["timings"] = timings.to_dict()
+        return JsonResponse(data)
+
+    except AdmissionRejected as e:
+        response = JsonResponse({
+            "error": str(e)
+        }, status=e.status)
+        response["Retry-After"] = str(e.retry_after)
+        return response
+    except Exception as e:
+        data = {
+            "error": f"An error occurred: {str(e)}"
+        }
+        run_id = getattr(e, 'run_id', None)
+        if run_id:
+            data["run_id"] = run_id
+            data["resume_url"] = f"/api/runs/{run_id}/resume/"
+        return JsonResponse(data, status=500)
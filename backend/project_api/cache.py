@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+
+
+def normalize_text(value):
+    """Collapse whitespace so trivially different inputs share a cache entry"""
+    return re.sub(r'\s+', ' ', str(value)).strip()
+
+
+def make_cache_key(project_name, project_description, model_name, prompt_fingerprint):
+    """Content-addressed key for a generated plan
+
+    The model name and prompt fingerprint are part of the key, so changing
+    either one naturally invalidates every previously cached plan.
+    """
+    payload = json.dumps([
+        normalize_text(project_name),
+        normalize_text(project_description),
+        model_name,
+        prompt_fingerprint,
+    ])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """Base class for plan caches with TTL, LRU eviction and hit/miss counters"""
+
+    def __init__(self, ttl=86400, max_entries=500):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached plan for ``key``, or None"""
+        with self._lock:
+            value = self._get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend_name,
+                "entries": self._size(),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _expired(self, created_at):
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+
+class LocalMemoryPlanCache(PlanCache):
+    """Per-process in-memory cache"""
+
+    backend_name = "memory"
+
+    def __init__(self, ttl=86400, max_entries=500):
+        super().__init__(ttl, max_entries)
+        self._entries = OrderedDict()
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        created_at, value = entry
+        if self._expired(created_at):
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self._entries[key] = (time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _clear(self):
+        self._entries.clear()
+
+    def _size(self):
+        return len(self._entries)
+
+
+class FileSystemPlanCache(PlanCache):
+    """On-disk cache shared by every worker process on the host
+
+    Each entry is a JSON file; the file's mtime tracks last access for LRU.
+    """
+
+    backend_name = "file"
+
+    def __init__(self, location, ttl=86400, max_entries=500):
+        super().__init__(ttl, max_entries)
+        self.location = Path(location)
+        self.location.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.location / f"{key}.json"
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self._expired(entry["created_at"]):
+            self._delete(path)
+            return None
+
+        # Touch the file so eviction sees it as recently used
+        self._touch(path)
+        return entry["plan"]
+
+    def _set(self, key, value):
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"created_at": time.time(), "plan": value}, f)
+        self._touch(tmp_path)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _touch(self, path):
+        # Explicit nanosecond times; filesystem clocks can be too coarse for LRU
+        now = time.time_ns()
+        try:
+            os.utime(path, ns=(now, now))
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = self._entries()
+        overflow = len(entries) - self.max_entries
+        if overflow <= 0:
+            return
+
+        entries.sort(key=lambda item: item[1])
+        for path, _ in entries[:overflow]:
+            self._delete(path)
+            self.evictions += 1
+
+    def _entries(self):
+        entries = []
+        for path in self.location.glob("*.json"):
+            try:
+                entries.append((path, path.stat().st_mtime))
+            except OSError:
+                continue
+        return entries
+
+    def _delete(self, path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def _clear(self):
+        for path, _ in self._entries():
+            self._delete(path)
+
+    def _size(self):
+        return len(self._entries())
+
+
+_plan_cache = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache():
+    """Return the configured process-wide plan cache, or None if disabled"""
+    global _plan_cache
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            config = settings.PLAN_CACHE
+            backend = config.get('BACKEND', 'memory')
+            ttl = config.get('TTL', 86400)
+            max_entries = config.get('MAX_ENTRIES', 500)
+
+            if backend == 'memory':
+                _plan_cache = LocalMemoryPlanCache(ttl=ttl, max_entries=max_entries)
+            elif backend == 'file':
+                _plan_cache = FileSystemPlanCache(
+                    config['LOCATION'], ttl=ttl, max_entries=max_entries
+                )
+            elif backend != 'none':
+                raise ValueError(f"Unknown plan cache backend: {backend}")
+        return _plan_cache
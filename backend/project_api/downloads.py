@@ -0,0 +1,115 @@
+import gzip
+import re
+
+from django.http import FileResponse, HttpResponse
+
+from .middleware import accepted_encodings
+from .responses import served_over_asgi, streaming_response
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def accepts_gzip(request):
+    """Whether Accept-Encoding allows gzip, honouring q-values (``gzip;q=0`` refuses it)"""
+    encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    return encodings.get('gzip', encodings.get('*', 0)) > 0
+
+
+def _etag_matches(header, etag):
+    """Weak comparison against an If-None-Match header"""
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+def parse_range(header, size):
+    """``(start, end)`` for a single byte range, None to ignore it, or False if unsatisfiable"""
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None  # Missing, malformed or multi-range: send the whole plan
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final ``last`` bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length, compressed):
+    opener = open if compressed else gzip.open
+    with opener(path, 'rb') as f:
+        f.seek(start)  # gzip files seek by decompressing forward
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def plan_download_response(request, path, record, filename):
+    """Serve a stored plan with ETag, Range and gzip pass-through support
+
+    Clients that accept gzip get the stored file as-is, sent with
+    ``Content-Encoding: gzip`` through ``FileResponse`` so the server can
+    use ``sendfile`` (under ASGI, which has no ``sendfile``, as a stream of
+    the file). Other clients get it decompressed as a stream. Either
+    way the plan is never loaded into memory in full, and ranges apply to the
+    bytes of the representation being sent.
+    """
+    compressed = accepts_gzip(request)
+    etag = f'"{record["content_hash"]}-gzip"' if compressed else f'"{record["content_hash"]}"'
+    size = record['compressed_size'] if compressed else record['size']
+    headers = {
+        'ETag': etag,
+        'Vary': 'Accept-Encoding',
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=31536000, immutable',  # Stored plans never change
+    }
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return HttpResponse(status=304, headers=headers)
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range.strip() == etag:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is False:
+        headers['Content-Range'] = f'bytes */{size}'
+        return HttpResponse(status=416, headers=headers)
+
+    headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if compressed:
+        headers['Content-Encoding'] = 'gzip'
+    content_type = 'text/markdown; charset=utf-8'
+
+    if byte_range is not None:
+        start, end = byte_range
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(end - start + 1)
+        return streaming_response(
+            request, _read_range(path, start, end - start + 1, compressed),
+            status=206, content_type=content_type, headers=headers,
+        )
+
+    if compressed and not served_over_asgi(request):
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    headers['Content-Length'] = str(size)
+    return streaming_response(
+        request, _read_range(path, 0, size, compressed),
+        content_type=content_type, headers=headers,
+    )
@@ -0,0 +1,239 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .admission import get_admission_controller
+from .ai_service import PipelineCancelled, ProjectPlanningService
+from .scheduler import BATCH, FairQueue
+
+
+class JobQueueFull(Exception):
+    """Raised when too many plan generation jobs are already waiting"""
+
+
+class JobCancelled(PipelineCancelled):
+    """Raised inside a running job once a client has cancelled it"""
+
+
+class PlanJob:
+    """A single background plan generation request"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+    def __init__(self, project_name, project_description, use_cache=True, client_id="unknown"):
+        self.id = uuid.uuid4().hex
+        self.project_name = project_name
+        self.project_description = project_description
+        self.use_cache = use_cache
+        self.client_id = client_id
+        self.status = self.PENDING
+        self.stage = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self.timings = None
+        self.plan_id = None
+        self.run_id = None
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED_STATES
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "project_name": self.project_name,
+            "status": self.status,
+            "stage": self.stage,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.run_id is not None:
+            data["run_id"] = self.run_id
+        if self.status == self.SUCCEEDED:
+            data["plan"] = self.result
+            data["plan_id"] = self.plan_id
+        if self.status == self.FAILED:
+            data["error"] = self.error
+        if self.finished and self.timings is not None:
+            data["timings"] = self.timings.to_dict()
+        return data
+
+
+class PlanJobManager:
+    """Runs plan generations on a bounded pool of background threads
+
+    Web workers only enqueue a job and return its ID; clients then poll
+    the job for status, progress and the final plan. Pending jobs wait in a
+    ``FairQueue``, so clients take turns instead of one client's hundred
+    jobs running before anyone else's, and each job runs in the admission
+    controller's batch lane.
+    """
+
+    def __init__(self, max_workers=4, max_pending=100, result_ttl=3600, client_weights=None):
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="plan-job"
+        )
+        self._queue = FairQueue(lanes=(BATCH,), weights=client_weights)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, project_name, project_description, use_cache=True, client_id="unknown"):
+        """Queue a new plan generation and return its job"""
+        with self._lock:
+            if self._closed:
+                raise JobQueueFull("The server is shutting down")
+            self._prune()
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                raise JobQueueFull("Too many plan generation jobs are queued")
+
+            job = PlanJob(project_name, project_description, use_cache=use_cache, client_id=client_id)
+            self._jobs[job.id] = job
+            self._queue.push(job, client_id, BATCH)
+
+        # Each worker call runs whichever job is next in turn, not necessarily this one
+        self._executor.submit(self._run_next)
+        return job
+
+    def stats(self):
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status == PlanJob.PENDING)
+            running = sum(1 for job in self._jobs.values() if job.status == PlanJob.RUNNING)
+            return {"pending": pending, "running": running, "tracked": len(self._jobs)}
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job; running crews stop at their next stage boundary"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+
+            job.cancel_requested = True
+            if self._queue.remove(job, job.client_id, BATCH):
+                self._finish(job, PlanJob.CANCELLED)
+            return job
+
+    def shutdown(self, wait=True):
+        """Stop taking jobs and cancel queued ones; with ``wait``, let running ones finish"""
+        with self._lock:
+            self._closed = True
+            while True:
+                entry = self._queue.pop()
+                if entry is None:
+                    break
+                self._finish(entry[0], PlanJob.CANCELLED)
+        self._executor.shutdown(wait=wait)
+
+    def _run_next(self):
+        with self._lock:
+            entry = self._queue.pop()
+        if entry is not None:
+            self._run(entry[0])
+
+    def _run(self, job):
+        with self._lock:
+            if job.cancel_requested:
+                self._finish(job, PlanJob.CANCELLED)
+                return
+            job.status = PlanJob.RUNNING
+            job.started_at = time.time()
+
+        def on_progress(stage):
+            if job.cancel_requested:
+                raise JobCancelled(job.id)
+            job.stage = stage
+
+        try:
+            service = ProjectPlanningService()
+            job.timings = service.new_run()
+            with get_admission_controller().admit(job.client_id, lane=BATCH):
+                plan = service.generate_project_plan(
+                    job.project_name,
+                    job.project_description,
+                    progress_callback=on_progress,
+                    use_cache=job.use_cache,
+                    timings=job.timings,
+                )
+            job.run_id = service.pipeline_run_id
+            record = service.save_plan(job.project_name, job.project_description, plan)
+        except Exception as e:
+            with self._lock:
+                # Failed and cancelled runs can be resumed from their checkpoint
+                job.run_id = getattr(e, 'run_id', job.run_id)
+                if job.cancel_requested:
+                    self._finish(job, PlanJob.CANCELLED)
+                else:
+                    job.error = str(e)
+                    self._finish(job, PlanJob.FAILED)
+            return
+
+        with self._lock:
+            if job.cancel_requested:
+                self._finish(job, PlanJob.CANCELLED)
+            else:
+                job.result = plan
+                job.plan_id = record["id"]
+                self._finish(job, PlanJob.SUCCEEDED)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        if status == PlanJob.CANCELLED:
+            job.stage = "cancelled"
+
+    def _prune(self):
+        """Forget finished jobs whose results have expired"""
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-wide job manager, creating it on first use"""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = PlanJobManager(
+                max_workers=settings.PLAN_JOB_WORKERS,
+                max_pending=settings.PLAN_JOB_MAX_PENDING,
+                result_ttl=settings.PLAN_JOB_RESULT_TTL,
+                client_weights=settings.PLAN_ADMISSION['CLIENT_WEIGHTS'],
+            )
+        return _job_manager
+
+
+def shutdown_job_manager(wait=True):
+    """Drain this process's job manager, if it started one"""
+    with _job_manager_lock:
+        manager = _job_manager
+    if manager is not None:
+        manager.shutdown(wait=wait)
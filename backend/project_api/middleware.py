@@ -0,0 +1,120 @@
+import asyncio
+import gzip
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+# Text the plans and API responses are made of; images and archives are already compressed
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml")
+
+# Bodies above this take milliseconds to compress, too long to block the event loop for
+OFFLOAD_SIZE = 64 * 1024
+
+_ACCEPT_ENCODING = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*')
+
+
+def accepted_encodings(header):
+    """Content codings from an Accept-Encoding header, mapped to their q-values"""
+    encodings = {}
+    for item in header.lower().split(","):
+        match = _ACCEPT_ENCODING.fullmatch(item)
+        if match is None or not match.group(1):
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        encodings[match.group(1)] = quality
+    return encodings
+
+
+def choose_encoding(header):
+    """"br" or "gzip", whichever the client prefers (brotli on a tie), or None"""
+    encodings = accepted_encodings(header)
+    wildcard = encodings.get("*", 0)
+    candidates = [("gzip", 1)]
+    if brotli is not None:
+        candidates.append(("br", 2))
+    best = max(
+        ((encodings.get(name, wildcard), rank, name) for name, rank in candidates),
+        default=(0, 0, None),
+    )
+    return best[2] if best[0] > 0 else None
+
+
+class CompressionMiddleware:
+    """Compress API responses with brotli or gzip, as negotiated by Accept-Encoding
+
+    Streaming responses (Server-Sent Events, NDJSON batches, plan downloads)
+    are left alone so every event reaches the client as soon as it is
+    written; downloads do their own gzip pass-through. So are responses that
+    already have a Content-Encoding, are smaller than ``MIN_SIZE`` bytes, or
+    are not text. Works in both the WSGI and the ASGI stack without a
+    thread hop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = settings.RESPONSE_COMPRESSION
+        if not config.get('ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.min_size = config.get('MIN_SIZE', 1024)
+        self.gzip_level = config.get('GZIP_LEVEL', 5)
+        self.brotli_quality = config.get('BROTLI_QUALITY', 5)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        return self.process(request, self.get_response(request))
+
+    async def _acall(self, request):
+        response = await self.get_response(request)
+        if not response.streaming and len(response.content) > OFFLOAD_SIZE:
+            return await asyncio.to_thread(self.process, request, response)
+        return self.process(request, response)
+
+    def process(self, request, response):
+        if not self._compressible(response):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        content = self.compress(response.content, encoding)
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response.headers["Content-Length"] = str(len(content))
+        response.headers["Content-Encoding"] = encoding
+        etag = response.headers.get("ETag")
+        if etag and etag.startswith('"'):
+            # The compressed bytes differ from the ones the strong ETag named
+            response.headers["ETag"] = "W/" + etag
+        return response
+
+    def compress(self, content, encoding):
+        if encoding == "br":
+            return brotli.compress(content, quality=self.brotli_quality)
+        return gzip.compress(content, compresslevel=self.gzip_level, mtime=0)
+
+    def _compressible(self, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return False
+        if len(response.content) < self.min_size:
+            return False
+        content_type = response.get("Content-Type", "").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
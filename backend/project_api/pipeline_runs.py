@@ -0,0 +1,181 @@
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+
+class PipelineRunUnavailable(Exception):
+    """Raised when a pipeline run cannot be resumed or regenerated
+
+    ``status`` is 404 for an unknown run and 409 when the run is in a state
+    that does not allow the operation.
+    """
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class PipelineRunStore:
+    """Checkpoints of the two-stage plan pipeline, kept in SQLite
+
+    Every generation gets a run that records the output of each stage as
+    soon as it finishes. A failed or cancelled run keeps its analysis, so it
+    can be resumed from the README stage, and a finished run's analysis can
+    be reused to regenerate only the README. Runs expire after ``ttl``
+    seconds; a "running" run not updated for ``stale_after`` seconds is
+    assumed to belong to a worker that died.
+    """
+
+    STAGES = ("analysis", "readme")
+
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pipeline_runs (
+            id TEXT PRIMARY KEY,
+            cache_key TEXT NOT NULL,
+            project_name TEXT NOT NULL,
+            project_description TEXT NOT NULL,
+            status TEXT NOT NULL,
+            analysis TEXT,
+            readme TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS pipeline_runs_cache_key ON pipeline_runs (cache_key, updated_at);
+        CREATE INDEX IF NOT EXISTS pipeline_runs_updated_at ON pipeline_runs (updated_at);
+    """
+
+    def __init__(self, location, ttl=7 * 24 * 3600, stale_after=900):
+        self.location = Path(location)
+        self.location.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.location / "pipeline_runs.sqlite3"
+        self.ttl = ttl
+        self.stale_after = stale_after
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, cache_key, project_name, project_description):
+        """Start a new run in the "running" state and return its record"""
+        now = time.time()
+        record = {
+            "id": uuid.uuid4().hex,
+            "cache_key": cache_key,
+            "project_name": str(project_name),
+            "project_description": str(project_description),
+            "status": self.RUNNING,
+            "analysis": None,
+            "readme": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._connect() as conn:
+            # Expired runs are dropped as new ones come in
+            conn.execute("DELETE FROM pipeline_runs WHERE updated_at < ?", (now - self.ttl,))
+            conn.execute(
+                f"INSERT INTO pipeline_runs ({', '.join(record)}) VALUES ({', '.join('?' * len(record))})",
+                tuple(record.values()),
+            )
+        return record
+
+    def get(self, run_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM pipeline_runs WHERE id = ? AND updated_at >= ?",
+                (run_id, time.time() - self.ttl),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def checkpoint(self, run_id, stage, output):
+        """Record the output of a finished stage"""
+        if stage not in self.STAGES:
+            raise ValueError(f"Unknown pipeline stage: {stage}")
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE pipeline_runs SET {stage} = ?, updated_at = ? WHERE id = ?",
+                (output, time.time(), run_id),
+            )
+
+    def set_status(self, run_id, status, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE pipeline_runs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), run_id),
+            )
+
+    def claim(self, run_id):
+        """Mark a run as running again; False if another worker is running it"""
+        now = time.time()
+        with self._connect() as conn:
+            claimed = conn.execute(
+                "UPDATE pipeline_runs SET status = ?, error = NULL, updated_at = ? "
+                "WHERE id = ? AND (status != ? OR updated_at < ?)",
+                (self.RUNNING, now, run_id, self.RUNNING, now - self.stale_after),
+            ).rowcount
+        return claimed == 1
+
+    def resumable(self, cache_key):
+        """Newest unfinished run for these inputs that has a stored analysis"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM pipeline_runs WHERE cache_key = ? AND analysis IS NOT NULL "
+                "AND readme IS NULL AND updated_at >= ? "
+                "AND (status IN (?, ?) OR (status = ? AND updated_at < ?)) "
+                "ORDER BY updated_at DESC LIMIT 1",
+                (cache_key, now - self.ttl, self.FAILED, self.CANCELLED,
+                 self.RUNNING, now - self.stale_after),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def latest_succeeded(self, cache_key):
+        """Newest finished run for these inputs, e.g. the one behind a cached plan"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM pipeline_runs WHERE cache_key = ? AND status = ? AND updated_at >= ? "
+                "ORDER BY updated_at DESC LIMIT 1",
+                (cache_key, self.SUCCEEDED, time.time() - self.ttl),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def completed_stages(self, record):
+        return [stage for stage in self.STAGES if record[stage] is not None]
+
+
+_pipeline_run_store = None
+_pipeline_run_store_lock = threading.Lock()
+
+
+def get_pipeline_run_store():
+    """Return the process-wide pipeline run store, creating it on first use"""
+    global _pipeline_run_store
+    with _pipeline_run_store_lock:
+        if _pipeline_run_store is None:
+            config = settings.PIPELINE_RUNS
+            _pipeline_run_store = PipelineRunStore(
+                config['LOCATION'],
+                ttl=config['TTL'],
+                stale_after=config['STALE_AFTER'],
+            )
+        return _pipeline_run_store
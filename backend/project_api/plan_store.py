@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import normalize_text
+
+
+def make_input_hash(project_name, project_description):
+    """Hash of the normalized inputs, shared by every plan generated from them"""
+    payload = json.dumps([normalize_text(project_name), normalize_text(project_description)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PlanStore:
+    """Generated plans kept as gzip files with a SQLite index
+
+    Each plan is written once to ``<location>/plans/<id>.md.gz`` and never
+    modified, so its content hash doubles as an ETag. The index is looked up
+    by plan ID, project name or input hash. SQLite runs in WAL mode, so
+    several worker processes can share one store. Plans older than
+    ``max_age`` seconds, and the oldest beyond ``max_plans``, are removed
+    whenever a new one is saved; 0 disables either limit.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS plans (
+            id TEXT PRIMARY KEY,
+            project_name TEXT NOT NULL,
+            input_hash TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            compressed_size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            run_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS plans_project_name ON plans (project_name, created_at);
+        CREATE INDEX IF NOT EXISTS plans_input_hash ON plans (input_hash, created_at);
+        CREATE INDEX IF NOT EXISTS plans_created_at ON plans (created_at);
+    """
+
+    COLUMNS = ("id", "project_name", "input_hash", "content_hash", "size", "compressed_size", "created_at",
+               "run_id")
+
+    def __init__(self, location, max_age=0, max_plans=0):
+        self.location = Path(location)
+        self.max_age = max_age
+        self.max_plans = max_plans
+        self.plans_dir = self.location / "plans"
+        self.plans_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.location / "index.sqlite3"
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            # Indexes created before plans were linked to their pipeline run
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(plans)")}
+            if "run_id" not in columns:
+                conn.execute("ALTER TABLE plans ADD COLUMN run_id TEXT")
+
+    @contextmanager
+    def _connect(self):
+        # A connection per operation keeps the store safe to use from any thread
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:  # Commits, or rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def path(self, plan_id):
+        return self.plans_dir / f"{plan_id}.md.gz"
+
+    def save(self, project_name, project_description, plan, run_id=None):
+        """Store ``plan`` and return its record
+
+        Saving the same plan for the same inputs again (e.g. a cache hit)
+        returns the existing record instead of writing a duplicate.
+        ``run_id`` links the plan to the pipeline run that produced it.
+        """
+        data = plan.encode('utf-8')
+        input_hash = make_input_hash(project_name, project_description)
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM plans WHERE input_hash = ? AND content_hash = ? LIMIT 1",
+                (input_hash, content_hash),
+            ).fetchone()
+        if row is not None:
+            return dict(row)
+
+        plan_id = uuid.uuid4().hex
+        # mtime=0 keeps the compressed bytes deterministic for identical plans
+        compressed = gzip.compress(data, compresslevel=6, mtime=0)
+        fd, tmp_path = tempfile.mkstemp(dir=self.plans_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, self.path(plan_id))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        record = {
+            "id": plan_id,
+            "project_name": str(project_name),
+            "input_hash": input_hash,
+            "content_hash": content_hash,
+            "size": len(data),
+            "compressed_size": len(compressed),
+            "created_at": time.time(),
+            "run_id": run_id,
+        }
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO plans ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                tuple(record[column] for column in self.COLUMNS),
+            )
+        self._prune()
+        return record
+
+    def _prune(self):
+        """Remove expired plans and the oldest beyond ``max_plans``, index rows first"""
+        expired = set()
+        with self._connect() as conn:
+            if self.max_age:
+                rows = conn.execute("SELECT id FROM plans WHERE created_at < ?", (time.time() - self.max_age,))
+                expired.update(row["id"] for row in rows)
+            if self.max_plans:
+                rows = conn.execute(
+                    "SELECT id FROM plans ORDER BY created_at DESC, id LIMIT -1 OFFSET ?", (self.max_plans,)
+                )
+                expired.update(row["id"] for row in rows)
+            conn.executemany("DELETE FROM plans WHERE id = ?", [(plan_id,) for plan_id in expired])
+        for plan_id in expired:
+            try:
+                self.path(plan_id).unlink()
+            except FileNotFoundError:
+                pass
+
+    def get(self, plan_id):
+        """Record for ``plan_id``, or None if it is unknown or its file is gone"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM plans WHERE id = ?", (plan_id,)).fetchone()
+        if row is None or not self.path(plan_id).exists():
+            return None
+        return dict(row)
+
+    def read(self, plan_id):
+        """Full plan text; prefer streaming ``path(plan_id)`` for downloads"""
+        with gzip.open(self.path(plan_id), 'rt', encoding='utf-8') as f:
+            return f.read()
+
+    def list(self, project_name=None, input_hash=None, limit=20, offset=0):
+        """Records newest first, with the total number of matches"""
+        clauses, params = [], []
+        if project_name:
+            clauses.append("project_name = ?")
+            params.append(project_name)
+        if input_hash:
+            clauses.append("input_hash = ?")
+            params.append(input_hash)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM plans {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM plans {where} ORDER BY created_at DESC, id LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+
+_plan_store = None
+_plan_store_lock = threading.Lock()
+
+
+def get_plan_store():
+    """Return the process-wide plan store, creating it on first use"""
+    global _plan_store
+    with _plan_store_lock:
+        if _plan_store is None:
+            _plan_store = PlanStore(
+                settings.GENERATED_PLANS_DIR,
+                max_age=settings.PLANS_MAX_AGE,
+                max_plans=settings.PLANS_MAX_COUNT,
+            )
+        return _plan_store
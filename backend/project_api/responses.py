@@ -0,0 +1,91 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+_END = object()
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Renders a response as a single JSON line, for clients that accept only JSON Lines"""
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return (json.dumps(data) + "\n").encode('utf-8')
+
+
+# Streamed JSON Lines endpoints: their errors are JSON, their bodies JSON Lines
+JSON_LINES_RENDERERS = [JSONRenderer, NDJSONRenderer]
+
+
+def wants_markdown(data):
+    """Whether a generation request asked for the raw plan instead of a JSON envelope"""
+    return data.get('format') == 'markdown'
+
+
+def server_timing(timings):
+    """``Server-Timing`` header value with the duration of each stage of a run"""
+    data = timings.to_dict()
+    metrics = [
+        f"{stage};dur={summary['seconds'] * 1000:.1f}"
+        for stage, summary in data["stages"].items()
+    ]
+    metrics.append(f"total;dur={data['total_seconds'] * 1000:.1f}")
+    return ", ".join(metrics)
+
+
+def markdown_plan_response(plan, plan_id, run_id, timings=None):
+    """A generated plan as ``text/markdown``, its IDs in headers
+
+    The plan is encoded once, as it is, instead of being escaped into a JSON
+    string; clients can show or save the body directly.
+    """
+    response = HttpResponse(plan, content_type='text/markdown; charset=utf-8')
+    response['X-Plan-Id'] = plan_id
+    if run_id:
+        response['X-Run-Id'] = run_id
+    response['Link'] = f'</api/plans/{plan_id}/download/>; rel="alternate"; type="text/markdown"'
+    if timings is not None:
+        response['Server-Timing'] = server_timing(timings)
+    return response
+
+
+def served_over_asgi(request):
+    """Whether a Django or DRF request came in through the ASGI handler"""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def streaming_response(request, chunks, **kwargs):
+    """``StreamingHttpResponse`` that sends each chunk as soon as it is produced
+
+    Under ASGI Django reads a synchronous iterator to the end before sending
+    anything, so there ``chunks`` is handed over as an async iterator that
+    produces each chunk on a worker thread. Closing the response, including
+    on a client disconnect, still closes ``chunks``.
+    """
+    if served_over_asgi(request):
+        chunks = _iterate_in_thread(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+async def _iterate_in_thread(iterable):
+    loop = asyncio.get_running_loop()
+    # One thread per stream, so a close after a disconnect waits for the
+    # chunk being produced instead of closing a running generator
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream")
+    iterator = iter(iterable)
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, iterator, _END)
+            if chunk is _END:
+                return
+            yield chunk
+    finally:
+        if hasattr(iterable, 'close'):
+            executor.submit(iterable.close)
+        executor.shutdown(wait=False)
@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict, deque
+
+# Priority lanes, most urgent first: requests a user is waiting on, then
+# background jobs and batches
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+
+class FairQueue:
+    """Waiting work in priority lanes, shared fairly between clients
+
+    ``pop`` serves the most urgent lane that has work, so interactive
+    requests go before batch work. Within a lane each client has its own
+    FIFO queue and clients take turns in weighted round-robin: a client of
+    weight ``w`` (``weights``, default 1) gets up to ``w`` items per turn, so
+    one client with a hundred queued items delays another client's first
+    item by at most one turn per client. Waiting also raises a lane's
+    urgency by one lane per ``aging_seconds``, so batch work that has waited
+    that much longer than the oldest interactive request goes first and a
+    steady interactive load cannot starve it.
+
+    Not thread-safe: callers hold their own lock.
+    """
+
+    def __init__(self, lanes=LANES, weights=None, aging_seconds=60.0):
+        self.lanes = tuple(lanes)
+        self.weights = dict(weights or {})
+        self.aging_seconds = aging_seconds
+        # lane -> client_id -> deque of (enqueued_at, item); client order is the turn order
+        self._queues = {lane: OrderedDict() for lane in self.lanes}
+        self._credits = {lane: {} for lane in self.lanes}
+        self._sizes = dict.fromkeys(self.lanes, 0)
+
+    def __len__(self):
+        return sum(self._sizes.values())
+
+    def waiting(self, lane):
+        return self._sizes[lane]
+
+    def push(self, item, client_id, lane=INTERACTIVE, now=None):
+        clients = self._queues[lane]
+        if client_id not in clients:
+            clients[client_id] = deque()
+        clients[client_id].append((time.monotonic() if now is None else now, item))
+        self._sizes[lane] += 1
+
+    def remove(self, item, client_id, lane=INTERACTIVE):
+        """Take ``item`` out of the queue; False if it is not waiting any more"""
+        queue = self._queues[lane].get(client_id)
+        if not queue:
+            return False
+        for entry in queue:
+            if entry[1] is item:
+                queue.remove(entry)
+                self._sizes[lane] -= 1
+                if not queue:
+                    self._drop_client(lane, client_id)
+                return True
+        return False
+
+    def pop(self, is_open=None, now=None):
+        """``(item, lane, seconds waited)`` for the next item to serve, or None
+
+        ``is_open(lane)`` may close lanes that cannot take more work now.
+        """
+        now = time.monotonic() if now is None else now
+        lane = self._next_lane(is_open, now)
+        if lane is None:
+            return None
+        clients = self._queues[lane]
+        client_id, queue = next(iter(clients.items()))
+        enqueued_at, item = queue.popleft()
+        self._sizes[lane] -= 1
+
+        credits = self._credits[lane]
+        credits[client_id] = credits.get(client_id, self._weight(client_id)) - 1
+        if not queue:
+            self._drop_client(lane, client_id)
+        elif credits[client_id] <= 0:
+            # Turn over: to the back of the line with fresh credits
+            clients.move_to_end(client_id)
+            credits[client_id] = self._weight(client_id)
+        return item, lane, now - enqueued_at
+
+    def _next_lane(self, is_open, now):
+        best, best_urgency = None, None
+        for rank, lane in enumerate(self.lanes):
+            clients = self._queues[lane]
+            if not clients or (is_open is not None and not is_open(lane)):
+                continue
+            urgency = rank
+            if self.aging_seconds:
+                oldest = min(queue[0][0] for queue in clients.values())
+                urgency -= (now - oldest) / self.aging_seconds
+            if best_urgency is None or urgency < best_urgency:
+                best, best_urgency = lane, urgency
+        return best
+
+    def _weight(self, client_id):
+        return max(1, int(self.weights.get(client_id, 1)))
+
+    def _drop_client(self, lane, client_id):
+        del self._queues[lane][client_id]
+        self._credits[lane].pop(client_id, None)
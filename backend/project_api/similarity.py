@@ -0,0 +1,236 @@
+"""Near-duplicate lookup of generated plans by project description
+
+Descriptions are turned into hashed TF-IDF vectors: words are lowercased,
+stop words and filler such as "app" or "with" dropped, a plural "s"
+removed, and each remaining word counted in one of ``dimensions`` buckets
+picked by a CRC32 hash. Each vector is weighted by the square root of the
+IDF, so a word no indexed description contains counts, but cannot outweigh
+several shared ones.
+
+The vectors of up to ``max_entries`` plans sit in one preallocated NumPy
+matrix. A lookup reads only the columns of the query's words, plus a pass
+over the matrix to refresh the row norms after plans were added, so its
+cost is bounded by ``max_entries x dimensions`` whatever the traffic. When
+the index is full the least recently used plan is replaced.
+
+A stored plan only answers requests whose every kept word appears in its
+description, so "todo app with React and Django" gets the plan for "a
+React + Django todo list app" (score about 0.86), but the reverse misses
+on "list", and "... and PostgreSQL" misses a plan made without it.
+Descriptions sharing only the stack or only the kind of app score around
+0.6 or less.
+"""
+import re
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+
+from .cache import normalize_text
+
+STOP_WORDS = frozenset("""
+    a allow an and api app application are as at backend based be build built
+    by can create data database db for from frontend in into is it its let like
+    make need of on or plus project should simple stored that the this to use
+    using want we web website will with
+""".split())
+
+_WORD = re.compile(r'[a-z0-9][a-z0-9+#]*')
+_HEADING = re.compile(r'^#{1,6}\s')
+_FENCE = re.compile(r'^\s*(```|~~~)')
+
+SimilarPlan = namedtuple("SimilarPlan", "plan project_name score")
+
+
+def description_terms(text):
+    """Words of ``text`` that describe the project, lightly normalized"""
+    terms = []
+    for word in _WORD.findall(str(text).lower()):
+        if word in STOP_WORDS:
+            continue  # Before the plural "s" comes off words like "plus"
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        if word not in STOP_WORDS:
+            terms.append(word)
+    return terms
+
+
+def description_vector(text, dimensions):
+    """Hashed, sublinear term frequencies of ``text`` as a float32 vector"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for term in description_terms(text):
+        vector[zlib.crc32(term.encode("utf-8")) % dimensions] += 1
+    nonzero = vector > 0
+    vector[nonzero] = 1 + np.log(vector[nonzero])
+    return vector
+
+
+def adapt_plan(plan, from_name, to_name):
+    """``plan`` written for ``from_name``, retitled for ``to_name``
+
+    Only whole-word mentions in heading lines outside code blocks are
+    renamed, so a short name never rewrites commands, paths or other words.
+    """
+    if not from_name or from_name == to_name:
+        return plan
+    name = re.compile(rf'(?<![\w-]){re.escape(from_name)}(?![\w-])')
+    lines = plan.split("\n")
+    in_fence = False
+    for i, line in enumerate(lines):
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        elif not in_fence and _HEADING.match(line):
+            lines[i] = name.sub(lambda match: to_name, line)
+    return "\n".join(lines)
+
+
+class SimilarPlanIndex:
+    """Bounded in-memory index of plans, searched by description similarity
+
+    Only plans added under the same ``namespace`` (the model and prompt
+    fingerprint) are candidates, and entries older than ``ttl`` seconds are
+    ignored and reused first.
+    """
+
+    def __init__(self, threshold=0.8, max_entries=1000, dimensions=2048, ttl=86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self._document_frequency = np.zeros(dimensions, dtype=np.float32)
+        self._created_at = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._namespace_ids = {}
+        self._namespaces = np.full(max_entries, -1)
+        self._entries = [None] * max_entries  # (project_name, plan)
+        self._keys = [None] * max_entries
+        self._rows = {}  # (namespace, normalized description) -> row
+        self._size = 0
+        self._weights = self._row_norms = None  # IDF and norms, refreshed after an add
+
+    def lookup(self, description, namespace=""):
+        """The most similar stored plan if it meets ``threshold``, else None"""
+        query = description_vector(description, self.dimensions)
+        with self._lock:
+            row, score = self._best_match(query, namespace)
+            if row is None or score < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_used[row] = time.time()
+            project_name, plan = self._entries[row]
+            return SimilarPlan(plan, project_name, score)
+
+    def add(self, description, project_name, plan, namespace=""):
+        vector = description_vector(description, self.dimensions)
+        if not vector.any():
+            return  # Nothing to match on
+        key = (namespace, normalize_text(description).lower())
+        now = time.time()
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = self._free_row(now)
+                self._rows[key] = row
+                self._keys[row] = key
+            else:
+                self._document_frequency -= self._vectors[row] > 0
+            self._vectors[row] = vector
+            self._document_frequency += vector > 0
+            self._created_at[row] = self._last_used[row] = now
+            self._namespaces[row] = self._namespace_ids.setdefault(namespace, len(self._namespace_ids))
+            self._entries[row] = (project_name, plan)
+            self._weights = self._row_norms = None
+
+    def clear(self):
+        with self._lock:
+            self._vectors[:] = 0
+            self._document_frequency[:] = 0
+            self._created_at[:] = 0
+            self._last_used[:] = 0
+            self._namespace_ids.clear()
+            self._namespaces[:] = -1
+            self._entries = [None] * self.max_entries
+            self._keys = [None] * self.max_entries
+            self._rows.clear()
+            self._size = 0
+            self._weights = self._row_norms = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _best_match(self, query, namespace):
+        """``(row, cosine similarity)`` of the closest live entry in ``namespace``"""
+        namespace_id = self._namespace_ids.get(namespace)
+        if namespace_id is None or not query.any():
+            return None, 0.0
+        vectors = self._vectors[:self._size]
+        if self._weights is None:
+            self._weights = np.log((1 + self._size) / (1 + self._document_frequency)) + 1
+            self._row_norms = np.sqrt((vectors * vectors) @ self._weights)
+        columns = np.flatnonzero(query)
+        weighted_query = query[columns] * self._weights[columns]
+        query_norm = float(np.sqrt(query[columns] @ weighted_query))
+        scores = (vectors[:, columns] @ weighted_query) / np.maximum(self._row_norms * query_norm, 1e-12)
+        live = self._namespaces[:self._size] == namespace_id
+        if self.ttl is not None:
+            live &= self._created_at[:self._size] > time.time() - self.ttl
+        # The stored plan must cover every word of the request, so an added
+        # technology or feature is never answered with a plan that lacks it
+        live &= (vectors[:, columns] > 0).all(axis=1)
+        if not live.any():
+            return None, 0.0
+        scores[~live] = -1.0
+        row = int(np.argmax(scores))
+        return row, float(scores[row])
+
+    def _free_row(self, now):
+        """An unused row, or the row of an expired or least recently used entry"""
+        if self._size < self.max_entries:
+            self._size += 1
+            return self._size - 1
+        if self.ttl is not None and (self._created_at < now - self.ttl).any():
+            row = int(np.argmin(self._created_at))
+        else:
+            row = int(np.argmin(self._last_used))
+            self.evictions += 1
+        self._document_frequency -= self._vectors[row] > 0
+        del self._rows[self._keys[row]]
+        return row
+
+
+_similarity_index = None
+_similarity_index_lock = threading.Lock()
+
+
+def get_similarity_index():
+    """Return the process-wide similarity index, or None if it is disabled"""
+    global _similarity_index
+    with _similarity_index_lock:
+        if _similarity_index is None:
+            config = settings.PLAN_SIMILARITY_CACHE
+            if not config.get('ENABLED'):
+                return None
+            _similarity_index = SimilarPlanIndex(
+                threshold=config.get('THRESHOLD', 0.8),
+                max_entries=config.get('MAX_ENTRIES', 1000),
+                dimensions=config.get('DIMENSIONS', 2048),
+                ttl=config.get('TTL', 86400),
+            )
+        return _similarity_index
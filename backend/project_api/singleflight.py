@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process coalescing only
+    fcntl = None
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when waiting on another caller's in-flight result takes too long"""
+
+
+class SingleFlightError(Exception):
+    """Raised in a follower when the leader in another process failed"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key
+
+    The first caller for a key (the leader) runs the function; identical
+    callers that arrive while it is running wait for and share its result
+    or exception, except exceptions of the ``unshared`` types passed to
+    ``do``: those belong to the leader alone (its client cancelled), and
+    the followers try again, one of them becoming the new leader. With
+    ``lock_dir`` set, leaders in different worker
+    processes on the same host also coordinate through a per-key file lock
+    and hand their result over through a small result file.
+    """
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, lock_dir=None, timeout=600, result_ttl=60):
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.lock_dir = Path(lock_dir) if lock_dir and fcntl else None
+        if self.lock_dir:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key, fn, timeout=None, unshared=()):
+        """Return ``fn()``, sharing one execution between identical callers"""
+        timeout = self.timeout if timeout is None else timeout
+
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+            if leader:
+                break
+
+            if not call.done.wait(timeout):
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight call {key}")
+            if call.error is None:
+                return call.result
+            if not isinstance(call.error, unshared):
+                raise call.error
+
+        try:
+            if self.lock_dir:
+                call.result = self._do_locked(key, fn, timeout, unshared)
+            else:
+                call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _do_locked(self, key, fn, timeout, unshared):
+        started_at = time.time()
+        lock_path = self.lock_dir / f"{key}.lock"
+        result_path = self.lock_dir / f"{key}.result"
+
+        deadline = time.monotonic() + timeout
+        while True:
+            lock_file = open(lock_path, 'a')
+            try:
+                self._acquire(lock_file, key, deadline)
+            except BaseException:
+                lock_file.close()
+                raise
+            if self._still_linked(lock_file, lock_path):
+                break
+            # Pruned while we waited for it: lock the file now at this path instead
+            lock_file.close()
+
+        with lock_file:
+            try:
+                # Another process finished this key while we were waiting
+                shared = self._read_result(result_path, started_at)
+                if shared is not None:
+                    if shared["ok"]:
+                        return shared["value"]
+                    raise SingleFlightError(shared["error"])
+
+                try:
+                    value = fn()
+                except unshared:
+                    # No result to hand over: the next process to get the lock runs fn itself
+                    raise
+                except Exception as e:
+                    self._write_result(result_path, {"ok": False, "error": str(e)})
+                    raise
+                self._write_result(result_path, {"ok": True, "value": value})
+                return value
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._prune()
+
+    def _acquire(self, lock_file, key, deadline):
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise SingleFlightTimeout(f"Timed out waiting for in-flight call {key}")
+                time.sleep(self.POLL_INTERVAL)
+
+    def _read_result(self, path, not_before):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["finished_at"] < not_before:
+            return None
+        return entry
+
+    def _write_result(self, path, entry):
+        entry["finished_at"] = time.time()
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _still_linked(self, lock_file, path):
+        try:
+            return os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino
+        except OSError:
+            return False
+
+    def _prune(self):
+        """Remove handed-over results once no waiter can still need them, and idle lock files"""
+        cutoff = time.time() - self.result_ttl
+        for path in self.lock_dir.glob("*.result"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                continue
+        for path in self.lock_dir.glob("*.lock"):
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+                with open(path, 'a') as lock_file:
+                    # Only a lock nobody holds; a process that opened it meanwhile sees
+                    # it was unlinked once it gets the lock, and opens a new one
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if self._still_linked(lock_file, path):
+                        path.unlink()
+            except (BlockingIOError, OSError):
+                continue
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Return the process-wide single-flight coordinator"""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            config = settings.PLAN_SINGLE_FLIGHT
+            _single_flight = SingleFlight(
+                lock_dir=config.get('LOCK_DIR'),
+                timeout=config.get('TIMEOUT', 600),
+                result_ttl=config.get('RESULT_TTL', 60),
+            )
+        return _single_flight
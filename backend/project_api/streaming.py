@@ -0,0 +1,37 @@
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from markdown_normalizer import MarkdownNormalizer
+from .ai_service import StreamCancelled
+
+
+class TokenQueueHandler(BaseCallbackHandler):
+    """LangChain callback that forwards streamed LLM tokens to a queue
+
+    README tokens pass through a ``MarkdownNormalizer`` on the way, so the
+    client receives the same cleaned markdown the finished plan contains.
+    """
+
+    raise_error = True  # Let StreamCancelled abort the crew
+
+    def __init__(self, events):
+        self.events = events
+        self.stage = "analysis"
+        self.cancelled = threading.Event()
+        self.normalizer = MarkdownNormalizer()
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.cancelled.is_set():
+            raise StreamCancelled()
+        # Only README tokens are user-facing; analysis runs behind a stage marker
+        if self.stage == "readme" and token:
+            self._put(self.normalizer.feed(token))
+
+    def finish(self):
+        """Send the README text the normalizer still holds back"""
+        self._put(self.normalizer.finish())
+
+    def _put(self, text):
+        if text:
+            self.events.put(("token", {"text": text}))
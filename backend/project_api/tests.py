@@ -0,0 +1,1466 @@
+import asyncio
+import contextlib
+import fcntl
+import gzip
+import io
+import json
+import zlib
+import os
+import runpy
+import signal
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import httpx
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from agents import PROJECT_PLANNER
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.stub_llm import install_stub_llm
+from buildpilot_api import settings as settings_module
+from budget import TRIM_MARKER, fit_to_budget
+from instrumentation import METRICS, MetricsRegistry, PlanRun
+from incremental import affected_units, diff_requirements, splice_units, split_units
+from markdown_normalizer import MarkdownNormalizer, normalize_markdown
+from llm_pool import LLMClientRegistry
+from llm_transport import LatencyTracker, RateLimitPacer, ResilientTransport, RetryPolicy
+import run_server
+from tasks import README_SECTIONS, CustomTasks
+from .ai_service import (
+    AsyncProjectPlanningService, PipelineError, PipelineRunCancelled, ProjectPlanningService, StreamCancelled,
+)
+from .admission import AdmissionController, AdmissionRejected
+from .cache import FileSystemPlanCache, LocalMemoryPlanCache, get_plan_cache, make_cache_key
+from .downloads import accepts_gzip, plan_download_response
+from .middleware import CompressionMiddleware, choose_encoding
+from .jobs import JobQueueFull, PlanJob, PlanJobManager
+from .pipeline_runs import PipelineRunStore, get_pipeline_run_store
+from .plan_store import PlanStore, get_plan_store
+from .scheduler import BATCH, INTERACTIVE, FairQueue
+from .similarity import SimilarPlanIndex, adapt_plan
+from .singleflight import SingleFlight
+
+
+def isolate_storage(test):
+    """Point stored plans, pipeline runs and coalescing locks at a temporary directory"""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    overrides = override_settings(
+        GENERATED_PLANS_DIR=directory.name,
+        PIPELINE_RUNS=dict(settings.PIPELINE_RUNS, LOCATION=directory.name),
+        PLAN_SINGLE_FLIGHT=dict(settings.PLAN_SINGLE_FLIGHT, LOCK_DIR=os.path.join(directory.name, "locks")),
+    )
+    overrides.enable()
+    test.addCleanup(overrides.disable)
+    # Drop the process-wide instances so they are rebuilt from the overrides
+    for singleton in ("plan_store._plan_store", "pipeline_runs._pipeline_run_store",
+                      "singleflight._single_flight"):
+        patcher = mock.patch(f"project_api.{singleton}", None)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+class Cancelled(Exception):
+    pass
+
+
+def fail(error):
+    def fn():
+        raise error
+    return fn
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_concurrently(self, flight, fn, callers=4, unshared=()):
+        """Call ``flight.do`` from ``callers`` threads, the first one leading"""
+        results = [None] * callers
+        leading = threading.Event()
+
+        def leader_fn():
+            leading.set()
+            return fn()
+
+        def call(index, target):
+            try:
+                results[index] = flight.do("key", target, timeout=5, unshared=unshared)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=call, args=(0, leader_fn))]
+        threads[0].start()
+        leading.wait(5)
+        for index in range(1, callers):
+            threads.append(threading.Thread(target=call, args=(index, fn)))
+            threads[-1].start()
+        time.sleep(0.2)  # Let the followers join the flight
+        return threads, results
+
+    def test_identical_calls_share_one_execution(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            return "plan"
+
+        threads, results = self.run_concurrently(flight, fn)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["plan"] * 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_followers_share_the_leaders_error(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        error = ValueError("upstream failed")
+
+        def fn():
+            release.wait(5)
+            raise error
+
+        threads, results = self.run_concurrently(flight, fn)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(result is error for result in results))
+
+    def test_unshared_error_only_reaches_the_leader(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait(5)
+                raise Cancelled("the leader's client went away")
+            time.sleep(0.3)
+            return "plan"
+
+        threads, results = self.run_concurrently(flight, fn, unshared=(Cancelled,))
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertIsInstance(results[0], Cancelled)
+        self.assertEqual(results[1:], ["plan"] * 3)
+        # One follower took over; the others shared its result
+        self.assertEqual(len(calls), 2)
+
+    def test_unshared_error_is_not_handed_to_other_processes(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            flight = SingleFlight(lock_dir=lock_dir)
+            with self.assertRaises(Cancelled):
+                flight.do("key", fail(Cancelled()), unshared=(Cancelled,))
+            self.assertEqual(list(flight.lock_dir.glob("*.result")), [])
+
+            with self.assertRaises(ValueError):
+                flight.do("key", fail(ValueError("failed")))
+            self.assertEqual(len(list(flight.lock_dir.glob("*.result"))), 1)
+
+    def test_idle_lock_files_are_pruned(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            flight = SingleFlight(lock_dir=lock_dir, result_ttl=60)
+            for key in ("a", "b"):
+                flight.do(key, lambda: "plan")
+            self.assertEqual(len(list(flight.lock_dir.glob("*.lock"))), 2)
+            old = time.time() - 120
+            for path in flight.lock_dir.iterdir():
+                os.utime(path, (old, old))
+            self.assertEqual(flight.do("c", lambda: "plan"), "plan")
+            self.assertEqual(sorted(path.name for path in flight.lock_dir.iterdir()), ["c.lock", "c.result"])
+
+    def test_a_lock_pruned_while_waiting_is_reopened(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            flight = SingleFlight(lock_dir=lock_dir)
+            path = flight.lock_dir / "key.lock"
+            holder = open(path, "a")  # Another process's leader
+            self.addCleanup(holder.close)
+            fcntl.flock(holder, fcntl.LOCK_EX)
+            results = []
+            thread = threading.Thread(target=lambda: results.append(flight.do("key", lambda: "plan")))
+            thread.start()
+            time.sleep(0.2)  # Waiting on the held lock
+            path.unlink()  # Pruned as the holder finishes
+            fcntl.flock(holder, fcntl.LOCK_UN)
+            thread.join(5)
+            self.assertEqual(results, ["plan"])
+            self.assertTrue(path.exists())
+            self.assertNotEqual(os.stat(path).st_ino, os.fstat(holder.fileno()).st_ino)
+
+
+class ResilientTransportTests(SimpleTestCase):
+    def start_server(self, **options):
+        server = FakeOpenAIServer(response_tokens=20, **options).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def http_client(self, server, policy):
+        client = httpx.Client(
+            base_url=server.base_url, transport=ResilientTransport(httpx.HTTPTransport(), policy)
+        )
+        self.addCleanup(client.close)
+        return client
+
+    def complete(self, client):
+        return client.post("/chat/completions", json={"messages": [{"role": "user", "content": "Plan"}]})
+
+    def test_retries_a_429_after_its_retry_after(self):
+        server = self.start_server(requests_per_minute=300, burst=1)
+        httpx.post(f"{server.base_url}/chat/completions", json={})  # Empty the server's bucket
+        policy = RetryPolicy(base_delay=0.01)
+        started = time.monotonic()
+        response = self.complete(self.http_client(server, policy))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.throttled, 1)
+        self.assertEqual(policy.stats()["retries"], 1)
+        # retry-after-ms asked for about 0.2s, far more than the backoff
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    def test_paces_requests_from_rate_limit_headers(self):
+        server = self.start_server(requests_per_minute=600, burst=1)
+        policy = RetryPolicy(base_delay=0.01)
+        client = self.http_client(server, policy)
+        for _ in range(4):
+            self.assertEqual(self.complete(client).status_code, 200)
+        self.assertEqual(server.throttled, 0)
+        self.assertEqual(policy.stats()["retries"], 0)
+        self.assertEqual(policy.stats()["rate_limits"]["requests"]["limit"], 1)
+
+    def test_hedges_a_stalled_request(self):
+        server = self.start_server(stall_every=2, stall_seconds=3)
+        policy = RetryPolicy(hedge=True, hedge_budget=1.0, latency=LatencyTracker(min_samples=1))
+        client = self.http_client(server, policy)
+        self.assertEqual(self.complete(client).status_code, 200)  # A latency sample to hedge against
+        started = time.monotonic()
+        self.assertEqual(self.complete(client).status_code, 200)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(policy.stats()["hedge_wins"], 1)
+
+
+    def mock_client(self, policy, handler):
+        client = httpx.Client(
+            base_url="http://llm.test", transport=ResilientTransport(httpx.MockTransport(handler), policy)
+        )
+        self.addCleanup(client.close)
+        return client
+
+    def test_a_hedge_that_is_not_sent_costs_no_pacing_token(self):
+        pacer = RateLimitPacer()
+        pacer.update(httpx.Response(200, headers={
+            "x-ratelimit-limit-requests": "10", "x-ratelimit-remaining-requests": "1",
+            "x-ratelimit-reset-requests": "1m",
+        }))
+        latency = LatencyTracker(min_samples=1)
+        latency.record(0.01)
+        policy = RetryPolicy(hedge=True, hedge_budget=1.0, pacer=pacer, latency=latency)
+
+        def stall(request):
+            time.sleep(0.1)
+            return httpx.Response(200, json={})
+
+        self.assertEqual(self.complete(self.mock_client(policy, stall)).status_code, 200)
+        self.assertEqual(policy.stats()["hedges"], 0)
+        # Only the primary request was charged
+        self.assertGreater(pacer.stats()["requests"]["available"], -0.5)
+        self.assertFalse(pacer.try_reserve(0))
+
+    def test_retries_stop_at_the_total_timeout(self):
+        policy = RetryPolicy(max_retries=50, base_delay=0.01, max_delay=0.01, total_timeout=0.2)
+
+        def unavailable(request):
+            time.sleep(0.05)
+            return httpx.Response(503)
+
+        started = time.monotonic()
+        self.assertEqual(self.complete(self.mock_client(policy, unavailable)).status_code, 503)
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertLess(policy.stats()["retries"], 5)
+
+
+class LLMClientRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = mock.Mock(side_effect=lambda *args: mock.Mock())
+        self.registry = LLMClientRegistry(llm_factory=self.factory)
+
+    def test_clients_are_shared_per_model_and_temperature(self):
+        llm = self.registry.get_llm("gpt-4o-mini", 0.3)
+        self.assertIs(self.registry.get_llm("gpt-4o-mini", 0.3), llm)
+        self.assertIsNot(self.registry.get_llm("gpt-4o-mini", 0.7), llm)
+        self.assertEqual(self.registry.stats()["cached_llms"], 2)
+
+    def test_streaming_clients_are_built_per_request_with_usage_tracking(self):
+        from llm_callbacks import token_usage_handler
+        callback = mock.Mock()
+        first = self.registry.get_llm("gpt-4o-mini", 0.3, streaming=True, callbacks=[callback])
+        self.assertIsNot(self.registry.get_llm("gpt-4o-mini", 0.3, streaming=True), first)
+        self.assertEqual(self.factory.call_args_list[0].args,
+                         ("gpt-4o-mini", 0.3, True, [token_usage_handler, callback]))
+        self.assertEqual(self.registry.stats()["cached_llms"], 0)
+
+    def test_agent_templates_are_built_once_and_copied(self):
+        with mock.patch("llm_pool._registry", self.registry):
+            agents = self.registry.get_agents()
+            self.assertIs(self.registry.get_agents(), agents)
+        build = mock.Mock(return_value=mock.Mock(**{"copy.side_effect": mock.Mock}))
+        first = agents._from_template("planner", build)
+        self.assertIsNot(agents._from_template("planner", build), first)
+        build.assert_called_once_with()
+
+
+class ReadmeFanoutTests(SimpleTestCase):
+    ANALYSIS = (
+        "## Technology Stack\n\nDjango.\n\n## Project Structure\n\nbackend/\n\n"
+        "## API Endpoints\n\nGET /tasks"
+    )
+
+    def setUp(self):
+        environ = mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.service = ProjectPlanningService()
+        self.headings = [heading for heading, _, _ in README_SECTIONS]
+
+    def test_section_prompts_follow_the_readme_and_carry_their_analysis(self):
+        prompts = CustomTasks(analysis_budget=0).readme_section_prompts("Todo", self.ANALYSIS)
+        self.assertEqual([heading for heading, _ in prompts], self.headings)
+        self.assertIn("Django.", prompts[0][1])
+        self.assertNotIn("GET /tasks", prompts[0][1])
+        self.assertIn("GET /tasks", prompts[2][1])
+
+    def test_sections_are_merged_in_readme_order_whatever_finishes_first(self):
+        tasks = [(heading, mock.Mock(name=heading)) for heading in self.headings]
+        self.service.tasks = mock.Mock(**{"readme_section_tasks.return_value": tasks})
+
+        def kickoff(agent, task):
+            index = [t for _, t in tasks].index(task)
+            time.sleep(0.05 * (len(tasks) - index))  # The last section finishes first
+            return f"# Todo\n\n## {self.headings[index]}\n\nPart {index}"
+
+        self.service._kickoff = kickoff
+        readme = self.service._kickoff_sections(mock.Mock(), "Todo", self.ANALYSIS)
+        self.assertEqual(readme, "\n\n".join(
+            ["# Todo"] + [f"## {heading}\n\nPart {i}" for i, heading in enumerate(self.headings)]
+        ))
+
+    def test_async_sections_are_merged_in_readme_order(self):
+        service = AsyncProjectPlanningService()
+        service.tasks = CustomTasks(analysis_budget=0, readme_fanout=True)
+        delays = iter([0.1, 0.05, 0.0])
+
+        async def ainvoke(persona, prompt, expected_output):
+            if persona is PROJECT_PLANNER:
+                return self.ANALYSIS
+            await asyncio.sleep(next(delays))
+            heading = next(h for h in self.headings if f'"## {h}"' in prompt)
+            return f"## {heading}\n\n{heading} text"
+
+        service._ainvoke = ainvoke
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with mock.patch("project_api.ai_service.get_pipeline_run_store",
+                        return_value=PipelineRunStore(directory.name)):
+            readme = asyncio.run(service._run_stages(
+                "Todo", "A todo app", "key", True, lambda stage: None, service.new_run()
+            ))
+        self.assertEqual(
+            [line for line in readme.splitlines() if line.startswith("#")],
+            ["# Todo"] + [f"## {heading}" for heading in self.headings],
+        )
+
+
+class ProdServerConfigTests(SimpleTestCase):
+    def config(self, *argv, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return run_server.prod_config(run_server.parse_args(["--prod", *argv]))
+
+    def test_wsgi_and_asgi_workers(self):
+        app_uri, options = self.config("--workers", "3", "--threads", "4", SERVER_MAX_REQUESTS="1000")
+        self.assertEqual(app_uri, "buildpilot_api.wsgi:application")
+        self.assertEqual((options["workers"], options["worker_class"], options["threads"]), (3, "gthread", 4))
+        self.assertEqual((options["max_requests"], options["max_requests_jitter"]), (1000, 100))
+        self.assertTrue(options["preload_app"])
+
+        app_uri, options = self.config("--asgi")
+        self.assertEqual(app_uri, "buildpilot_api.asgi:application")
+        self.assertEqual(options["worker_class"].CONFIG_KWARGS["lifespan"], "off")
+        self.assertNotIn("threads", options)
+
+    def test_post_fork_watches_memory_unless_disabled(self):
+        worker = mock.Mock()
+        _, options = self.config(SERVER_MAX_WORKER_MEMORY_MB="450", SERVER_MEMORY_CHECK_INTERVAL="2")
+        with mock.patch("run_server.threading.Thread") as thread:
+            options["post_fork"](mock.Mock(), worker)
+        self.assertEqual(thread.call_args.kwargs["args"], (worker, 450, 2.0))
+        thread.return_value.start.assert_called_once_with()
+
+        _, options = self.config(SERVER_MAX_WORKER_MEMORY_MB="0")
+        with mock.patch("run_server.threading.Thread") as thread:
+            options["post_fork"](mock.Mock(), worker)
+        thread.assert_not_called()
+
+    def test_memory_watcher_recycles_a_large_worker(self):
+        worker = mock.Mock(alive=True, pid=1234)
+        with mock.patch("run_server.current_rss_mb", side_effect=[100, 500]), \
+                mock.patch("run_server.os.kill") as kill:
+            run_server.watch_memory(worker, 450, 0)
+        kill.assert_called_once_with(1234, signal.SIGTERM)
+
+    def test_workers_load_the_crew_after_forking_and_drain_jobs_on_exit(self):
+        _, options = self.config()
+        with mock.patch("project_api.ai_service.preload") as preload:
+            options["post_worker_init"](mock.Mock())
+        preload.assert_called_once_with()
+        with mock.patch("project_api.jobs.shutdown_job_manager") as shutdown:
+            options["worker_exit"](mock.Mock(), mock.Mock())
+        shutdown.assert_called_once_with(wait=True)
+
+
+class AsyncPipelineStatusTests(SimpleTestCase):
+    def setUp(self):
+        environ = mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = PipelineRunStore(directory.name)
+        patcher = mock.patch("project_api.ai_service.get_pipeline_run_store", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = AsyncProjectPlanningService()
+
+    def run_stages(self, ainvoke):
+        self.service._ainvoke = ainvoke
+        return self.service._run_stages("Todo", "A todo app", "key", True, lambda stage: None, self.service.new_run())
+
+    def status(self):
+        return self.store.get(self.service.pipeline_run_id)["status"]
+
+    async def test_cancelled_stage_marks_the_run_cancelled(self):
+        async def ainvoke(*args):
+            raise StreamCancelled("client went away")
+
+        with self.assertRaises(PipelineRunCancelled):
+            await self.run_stages(ainvoke)
+        self.assertEqual(self.status(), PipelineRunStore.CANCELLED)
+
+    async def test_cancelled_task_marks_the_run_cancelled(self):
+        started = asyncio.Event()
+
+        async def ainvoke(*args):
+            started.set()
+            await asyncio.sleep(60)
+
+        task = asyncio.ensure_future(self.run_stages(ainvoke))
+        await started.wait()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(self.status(), PipelineRunStore.CANCELLED)
+
+    async def test_failed_stage_marks_the_run_failed(self):
+        async def ainvoke(*args):
+            raise RuntimeError("upstream failed")
+
+        with self.assertRaises(PipelineError):
+            await self.run_stages(ainvoke)
+        self.assertEqual(self.status(), PipelineRunStore.FAILED)
+
+
+class AsyncGenerationTests(SimpleTestCase):
+    def setUp(self):
+        environ = mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.service = AsyncProjectPlanningService()
+        self.stages = mock.AsyncMock(return_value="# Plan")
+        self.service._run_stages = self.stages
+
+    async def test_cache_lookups_run_off_the_event_loop(self):
+        cache = LocalMemoryPlanCache(max_entries=10, ttl=60)
+        threads = []
+        cache.get = mock.Mock(side_effect=lambda key: threads.append(threading.get_ident()))
+        with mock.patch("project_api.ai_service.get_plan_cache", return_value=cache):
+            await self.service.generate_project_plan("Todo", "A todo app")
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    async def test_identical_requests_share_a_generation(self):
+        release = asyncio.Event()
+
+        async def run_stages(*args):
+            await release.wait()
+            return "# Plan"
+
+        self.stages.side_effect = run_stages
+        with mock.patch("project_api.ai_service.get_plan_cache", return_value=None):
+            first = asyncio.ensure_future(self.service.generate_project_plan("Todo", "A todo app"))
+            second = asyncio.ensure_future(
+                AsyncProjectPlanningService().generate_project_plan("Todo", "A todo app")
+            )
+            await asyncio.sleep(0.01)
+            release.set()
+            self.assertEqual(await asyncio.gather(first, second), ["# Plan", "# Plan"])
+        self.assertEqual(self.stages.await_count, 1)
+        self.assertEqual(AsyncProjectPlanningService._loop_in_flight(), {})
+
+    def test_each_event_loop_has_its_own_generations(self):
+        async def in_flight():
+            return AsyncProjectPlanningService._loop_in_flight()
+
+        first, second = asyncio.run(in_flight()), asyncio.run(in_flight())
+        self.assertIsNot(first, second)
+
+
+class AsyncViewRoutingTests(SimpleTestCase):
+    def reload_urls(self):
+        from importlib import reload
+        from django.urls import clear_url_caches
+        from buildpilot_api import urls as root_urls
+        from . import urls
+        reload(urls)
+        reload(root_urls)
+        clear_url_caches()
+
+    def test_asgi_serves_the_main_endpoints_with_async_views(self):
+        from django.urls import resolve
+        from . import async_views, views
+        self.addCleanup(self.reload_urls)
+        with override_settings(ASYNC_VIEWS=True):
+            self.reload_urls()
+            self.assertIs(resolve("/api/generate-plan/").func, async_views.generate_plan)
+            self.assertIs(resolve("/api/health/").func, async_views.health_check)
+        self.reload_urls()
+        self.assertIs(resolve("/api/generate-plan/").func.cls, views.generate_plan.cls)
+
+    def test_asgi_application_turns_async_views_on(self):
+        source = open(os.path.join(settings.BASE_DIR, "buildpilot_api", "asgi.py")).read()
+        self.assertIn("os.environ.setdefault('DJANGO_ASYNC_VIEWS', 'True')", source)
+        with mock.patch.dict(os.environ, {"DJANGO_ASYNC_VIEWS": "True"}):
+            self.assertTrue(runpy.run_path(settings_module.__file__)["ASYNC_VIEWS"])
+        self.assertFalse(runpy.run_path(settings_module.__file__)["ASYNC_VIEWS"])
+
+    def test_async_view_submits_jobs(self):
+        manager = mock.Mock()
+        manager.submit.return_value = mock.Mock(id="job-1", status="pending")
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}), \
+                mock.patch("project_api.async_views.get_job_manager", return_value=manager):
+            response = self.client.post(
+                "/api/async/generate-plan/",
+                {"project_name": "Todo", "project_description": "A todo app", "mode": "async"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status_url"], "/api/jobs/job-1/")
+        self.assertEqual(manager.submit.call_args.args, ("Todo", "A todo app"))
+
+        manager.submit.side_effect = JobQueueFull("Too many pending jobs")
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}), \
+                mock.patch("project_api.async_views.get_job_manager", return_value=manager):
+            response = self.client.post(
+                "/api/async/generate-plan/",
+                {"project_name": "Todo", "project_description": "A todo app", "mode": "async"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 503)
+
+
+class SimilarPlanIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SimilarPlanIndex(max_entries=10, dimensions=256)
+        for description in ("a React + Django todo list app", "blog with Flask and Vue"):
+            self.index.add(description, description, f"# {description}")
+
+    def test_a_rewording_reuses_the_plan(self):
+        match = self.index.lookup("todo app with React and Django")
+        self.assertEqual(match.project_name, "a React + Django todo list app")
+        self.assertAlmostEqual(match.score, 0.86, places=1)
+
+    def test_a_word_the_stored_plan_lacks_is_a_miss(self):
+        self.assertIsNone(self.index.lookup("todo list app with React and Django and PostgreSQL"))
+        self.assertIsNone(self.index.lookup("todo list app with Vue and Django"))
+        self.assertEqual(self.index.stats()["misses"], 2)
+
+    def test_expired_plans_are_not_reused(self):
+        with mock.patch("project_api.similarity.time.time", return_value=time.time() + 86401):
+            self.assertIsNone(self.index.lookup("todo app with React and Django"))
+
+    def test_clear_forgets_entries_and_their_timestamps(self):
+        self.index.clear()
+        self.assertEqual(self.index.stats()["entries"], 0)
+        self.assertFalse(self.index._created_at.any())
+        self.assertFalse(self.index._last_used.any())
+        self.assertIsNone(self.index.lookup("todo app with React and Django"))
+        self.index.add("blog with Flask and Vue", "Blog", "# Blog")
+        self.assertEqual(self.index.lookup("Flask and Vue blog").plan, "# Blog")
+
+    def test_adapted_plans_are_renamed_in_headings_only(self):
+        plan = (
+            "# Todo\n\nTodo is a Todoist-like app.\n\n## Todo Setup\n\n"
+            "```bash\n# Todo\ncd todo-api\n```\n### About Todos and Todo-lists"
+        )
+        self.assertEqual(adapt_plan(plan, "Todo", "Tasks"), (
+            "# Tasks\n\nTodo is a Todoist-like app.\n\n## Tasks Setup\n\n"
+            "```bash\n# Todo\ncd todo-api\n```\n### About Todos and Todo-lists"
+        ))
+        self.assertEqual(adapt_plan("# C++ App", "C++ App", r"New \1 App"), r"# New \1 App")
+
+    def test_ttl_has_its_own_setting(self):
+        environ = {"PLAN_SIMILARITY_TTL": "600", "PLAN_CACHE_TTL": "60"}
+        with mock.patch.dict(os.environ, environ):
+            config = runpy.run_path(settings_module.__file__)["PLAN_SIMILARITY_CACHE"]
+        self.assertEqual(config["TTL"], 600)
+
+
+class PlanCacheTests(SimpleTestCase):
+    def test_key_ignores_whitespace_but_not_model_or_prompts(self):
+        key = make_cache_key("Todo", "A todo app", "gpt-4o", "prompts-1")
+        self.assertEqual(key, make_cache_key(" Todo ", "A  todo\napp", "gpt-4o", "prompts-1"))
+        self.assertNotEqual(key, make_cache_key("Todo", "A todo app.", "gpt-4o", "prompts-1"))
+        self.assertNotEqual(key, make_cache_key("Todo", "A todo app", "gpt-4o-mini", "prompts-1"))
+        self.assertNotEqual(key, make_cache_key("Todo", "A todo app", "gpt-4o", "prompts-2"))
+
+    def caches(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return [LocalMemoryPlanCache(ttl=60, max_entries=2),
+                FileSystemPlanCache(directory.name, ttl=60, max_entries=2)]
+
+    def test_entries_expire_after_the_ttl(self):
+        for cache in self.caches():
+            cache.set("key", "# Plan")
+            self.assertEqual(cache.get("key"), "# Plan")
+            with mock.patch("project_api.cache.time.time", return_value=time.time() + 61):
+                self.assertIsNone(cache.get("key"), cache.backend_name)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for cache in self.caches():
+            cache.set("a", "A")
+            cache.set("b", "B")
+            cache.get("a")
+            cache.set("c", "C")
+            self.assertIsNone(cache.get("b"), cache.backend_name)
+            self.assertEqual(cache.get("a"), "A")
+            self.assertEqual(cache.stats()["evictions"], 1)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def test_a_client_over_its_limit_gets_a_429(self):
+        controller = AdmissionController(max_concurrent=4, max_per_client=1)
+        controller.acquire("a")
+        with self.assertRaises(AdmissionRejected) as rejected:
+            controller.acquire("a")
+        self.assertEqual(rejected.exception.status, 429)
+        self.assertGreaterEqual(rejected.exception.retry_after, 1)
+        controller.acquire("b")  # Other clients still get in
+        self.assertEqual(controller.stats()["rejected"]["client_limit"], 1)
+
+    def test_a_full_queue_is_a_503_with_retry_after(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=0)
+        controller.acquire("a")
+        patcher = mock.patch("project_api.views.get_admission_controller", return_value=controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}):
+            response = self.client.post(
+                "/api/generate-plan/", {"project_name": "Todo", "project_description": "A todo app"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        self.assertEqual(controller.stats()["rejected"]["queue_full"], 1)
+
+    def test_waiting_past_the_queue_timeout_is_a_503(self):
+        controller = AdmissionController(max_concurrent=1, queue_timeout=0.05)
+        controller.acquire("a")
+        with self.assertRaises(AdmissionRejected) as rejected:
+            controller.acquire("b")
+        self.assertEqual(rejected.exception.status, 503)
+        stats = controller.stats()
+        self.assertEqual((stats["waiting"], stats["clients"]), (0, 1))
+
+    def test_a_queued_request_gets_the_released_slot(self):
+        controller = AdmissionController(max_concurrent=1)
+        controller.acquire("a")
+        admitted = threading.Event()
+        thread = threading.Thread(target=lambda: (controller.acquire("b"), admitted.set()))
+        thread.start()
+        time.sleep(0.05)
+        self.assertFalse(admitted.is_set())
+        controller.release("a")
+        thread.join(5)
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(controller.stats()["active"], 1)
+
+    def test_closing_a_stream_releases_its_slot(self):
+        controller = AdmissionController(max_concurrent=1)
+        closed = []
+
+        def chunks():
+            try:
+                yield "a"
+                yield "b"
+            finally:
+                closed.append(True)
+
+        controller.acquire("a")
+        stream = controller.hold_until_closed(chunks(), "a")
+        self.assertEqual(next(stream), "a")
+        stream.close()  # The client went away mid-stream
+        stream.close()
+        self.assertEqual(closed, [True])
+        self.assertEqual(controller.stats()["active"], 0)
+
+        controller.acquire("a")
+        self.assertEqual(list(controller.hold_until_closed(iter(["x"]), "a")), ["x"])
+        self.assertEqual(controller.stats()["active"], 0)
+
+    async def test_cancelling_a_queued_async_request_leaves_the_queue(self):
+        controller = AdmissionController(max_concurrent=1)
+        controller.acquire("a")
+        waiter = asyncio.ensure_future(controller.aacquire("b"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(controller.stats()["waiting"], 1)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(controller.stats()["waiting"], 0)
+        controller.release("a")
+        stats = controller.stats()
+        self.assertEqual((stats["active"], stats["clients"]), (0, 0))
+
+
+class FairQueueTests(SimpleTestCase):
+    def drain(self, queue, now=0.0):
+        order = []
+        while (entry := queue.pop(now=now)) is not None:
+            order.append(entry[0])
+        return order
+
+    def test_clients_take_turns_within_a_lane(self):
+        queue = FairQueue()
+        for i in range(3):
+            queue.push(f"a{i}", "a", now=0.0)
+        queue.push("b0", "b", now=1.0)
+        queue.push("c0", "c", now=2.0)
+        self.assertEqual(self.drain(queue), ["a0", "b0", "c0", "a1", "a2"])
+
+    def test_weights_give_clients_more_items_per_turn(self):
+        queue = FairQueue(weights={"a": 2})
+        for i in range(4):
+            queue.push(f"a{i}", "a", now=0.0)
+            queue.push(f"b{i}", "b", now=0.0)
+        self.assertEqual(self.drain(queue), ["a0", "a1", "b0", "a2", "a3", "b1", "b2", "b3"])
+
+    def test_interactive_goes_before_batch_until_batch_has_aged(self):
+        queue = FairQueue(aging_seconds=60.0)
+        queue.push("job", "a", BATCH, now=0.0)
+        queue.push("request", "b", INTERACTIVE, now=10.0)
+        self.assertEqual(queue.pop(now=30.0)[:2], ("request", INTERACTIVE))
+
+        # The job has now waited a minute longer than the new request
+        queue.push("request", "b", INTERACTIVE, now=70.0)
+        item, lane, waited = queue.pop(now=71.0)
+        self.assertEqual((item, lane, waited), ("job", BATCH, 71.0))
+
+    def test_closed_lanes_are_skipped(self):
+        queue = FairQueue()
+        queue.push("job", "a", BATCH, now=0.0)
+        queue.push("request", "b", INTERACTIVE, now=0.0)
+        self.assertEqual(queue.pop(lambda lane: lane == BATCH, now=0.0)[0], "job")
+        self.assertIsNone(queue.pop(lambda lane: lane == BATCH, now=0.0))
+
+    def test_removed_items_are_not_served(self):
+        queue = FairQueue()
+        first, second = object(), object()
+        queue.push(first, "a", now=0.0)
+        queue.push(second, "a", now=0.0)
+        self.assertTrue(queue.remove(first, "a"))
+        self.assertFalse(queue.remove(first, "a"))
+        self.assertEqual(len(queue), 1)
+        self.assertIs(queue.pop(now=0.0)[0], second)
+        self.assertEqual(queue.waiting(INTERACTIVE), 0)
+
+
+class FakePlanningService:
+    """Stands in for the crew: reports each stage, pausing on ``gates`` first"""
+
+    gates = {}
+    pipeline_run_id = "run-1"
+
+    def new_run(self):
+        return mock.Mock(**{"to_dict.return_value": {}})
+
+    def generate_project_plan(self, project_name, project_description, progress_callback=None, **kwargs):
+        for stage in ("analysis", "readme"):
+            if stage in self.gates:
+                self.gates[stage].wait(5)
+            progress_callback(stage)
+        return f"# {project_name}"
+
+    def save_plan(self, project_name, project_description, plan):
+        return {"id": "plan-1"}
+
+
+class RegeneratePlanViewTests(SimpleTestCase):
+    ANALYSIS = "## Features\n\nTasks.\n\n## Stack\n\nDjango."
+    README = "# Todo\n\n## Features\n\nAdd tasks.\n\n## Stack\n\nDjango."
+
+    def setUp(self):
+        isolate_storage(self)
+        environ = mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def regenerate(self, plan_id, **data):
+        return self.client.post(
+            f"/api/plans/{plan_id}/regenerate/", {"project_description": "A todo app. Uses Django.", **data},
+            content_type="application/json",
+        )
+
+    def test_an_unchanged_description_returns_the_stored_plan(self):
+        runs = get_pipeline_run_store()
+        run = runs.create("key", "Todo", "A todo app.  Uses Django.")
+        runs.checkpoint(run["id"], "analysis", self.ANALYSIS)
+        runs.checkpoint(run["id"], "readme", self.README)
+        record = get_plan_store().save("Todo", "A todo app.  Uses Django.", self.README, run_id=run["id"])
+
+        response = self.regenerate(record["id"])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["plan_id"], record["id"])
+        self.assertEqual(data["regenerated_sections"], {"analysis": [], "readme": []})
+        self.assertEqual(get_plan_store().list()[1], 1)
+
+    def test_a_plan_pruned_during_regeneration_is_not_found(self):
+        service = mock.Mock(unchanged_plan_id=None, regenerated_sections=None)
+        service.regenerate_plan.return_value = "# Todo"
+        with mock.patch("project_api.views.ProjectPlanningService", return_value=service):
+            response = self.regenerate("gone")
+        self.assertEqual(response.status_code, 404)
+        service.save_plan.assert_not_called()
+
+
+class PlanJobTests(SimpleTestCase):
+    def setUp(self):
+        FakePlanningService.gates = {}
+        patcher = mock.patch("project_api.jobs.ProjectPlanningService", FakePlanningService)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        environ = mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def manager(self, **options):
+        manager = PlanJobManager(**options)
+        self.addCleanup(manager.shutdown, wait=False)
+        patcher = mock.patch("project_api.views.get_job_manager", return_value=manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return manager
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def block(self, stage):
+        gate = FakePlanningService.gates[stage] = threading.Event()
+        self.addCleanup(gate.set)
+        return gate
+
+    def test_submitted_job_is_polled_to_its_plan(self):
+        self.manager()
+        response = self.client.post(
+            "/api/generate-plan/", {"project_name": "Todo", "project_description": "A todo app", "mode": "async"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()["status_url"]
+        self.wait_for(lambda: self.client.get(status_url).json()["status"] == PlanJob.SUCCEEDED)
+        data = self.client.get(status_url).json()
+        self.assertEqual((data["plan"], data["plan_id"], data["stage"]), ("# Todo", "plan-1", "readme"))
+        self.assertEqual(self.client.get("/api/jobs/unknown/").status_code, 404)
+
+    def test_queued_job_is_cancelled_straight_away(self):
+        manager = self.manager(max_workers=1)
+        self.block("analysis")
+        running = manager.submit("Running", "A todo app", client_id="127.0.0.1")
+        queued = manager.submit("Queued", "A todo app", client_id="127.0.0.1")
+        self.wait_for(lambda: running.status == PlanJob.RUNNING)
+        response = self.client.delete(f"/api/jobs/{queued.id}/")
+        self.assertEqual(response.json()["status"], PlanJob.CANCELLED)
+        self.assertEqual(queued.stage, "cancelled")
+        self.assertEqual(running.status, PlanJob.RUNNING)
+
+    def test_running_job_stops_at_the_next_stage(self):
+        manager = self.manager()
+        gate = self.block("readme")
+        job = manager.submit("Todo", "A todo app", client_id="127.0.0.1")
+        self.wait_for(lambda: job.stage == "analysis")
+        self.client.delete(f"/api/jobs/{job.id}/")
+        self.assertEqual(job.status, PlanJob.RUNNING)
+        gate.set()
+        self.wait_for(lambda: job.finished)
+        self.assertEqual(job.status, PlanJob.CANCELLED)
+        self.assertIsNone(job.result)
+
+    def test_only_the_submitting_client_can_cancel(self):
+        manager = self.manager()
+        self.block("analysis")
+        job = manager.submit("Todo", "A todo app", client_id="10.0.0.9")
+        self.assertEqual(self.client.delete(f"/api/jobs/{job.id}/").status_code, 404)
+        self.assertFalse(job.cancel_requested)
+        self.assertEqual(self.client.get(f"/api/jobs/{job.id}/").status_code, 200)
+
+    def test_a_full_queue_is_a_503(self):
+        manager = self.manager(max_workers=1, max_pending=1)
+        self.block("analysis")
+        manager.submit("Todo", "A todo app")
+        with self.assertRaises(JobQueueFull):
+            manager.submit("Todo", "A todo app")
+        response = self.client.post(
+            "/api/generate-plan/", {"project_name": "Todo", "project_description": "A todo app", "mode": "async"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 503)
+
+    def test_finished_jobs_are_forgotten_after_the_result_ttl(self):
+        manager = self.manager(result_ttl=60)
+        job = manager.submit("Todo", "A todo app")
+        self.wait_for(lambda: job.finished)
+        job.finished_at -= 61
+        manager.submit("Other", "A todo app")
+        self.assertIsNone(manager.get(job.id))
+
+
+fake_brotli = mock.Mock(**{"compress.side_effect": lambda content, quality: b"br:" + zlib.compress(content)})
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    BODY = "A plan line.\n" * 200
+
+    def process(self, response, accept_encoding="gzip"):
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_negotiation_prefers_brotli_and_honours_q_values(self):
+        with mock.patch("project_api.middleware.brotli", fake_brotli):
+            self.assertEqual(choose_encoding("gzip, deflate, br"), "br")
+            self.assertEqual(choose_encoding("br;q=0.5, gzip"), "gzip")
+            self.assertEqual(choose_encoding("br;q=0, gzip;q=0"), None)
+            self.assertEqual(choose_encoding("*"), "br")
+            self.assertEqual(choose_encoding("identity"), None)
+        with mock.patch("project_api.middleware.brotli", None):
+            self.assertEqual(choose_encoding("br"), None)
+            self.assertEqual(choose_encoding("br, gzip"), "gzip")
+            self.assertEqual(choose_encoding("gzip;q=0, *"), None)
+
+    def test_brotli_and_gzip_bodies(self):
+        with mock.patch("project_api.middleware.brotli", fake_brotli):
+            response = self.process(HttpResponse(self.BODY, content_type="text/plain"), "br")
+            self.assertEqual(response["Content-Encoding"], "br")
+            self.assertEqual(zlib.decompress(response.content[3:]).decode(), self.BODY)
+
+            response = self.process(HttpResponse(self.BODY, content_type="text/plain"), "br;q=0, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content).decode(), self.BODY)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_small_encoded_and_binary_bodies_are_left_alone(self):
+        small = self.process(HttpResponse("{}", content_type="application/json"))
+        self.assertFalse(small.has_header("Content-Encoding"))
+
+        encoded = HttpResponse(gzip.compress(self.BODY.encode()), content_type="text/markdown")
+        encoded["Content-Encoding"] = "gzip"
+        content = encoded.content
+        self.assertEqual(self.process(encoded).content, content)
+
+        image = self.process(HttpResponse(self.BODY, content_type="image/png"))
+        self.assertFalse(image.has_header("Content-Encoding"))
+
+    def test_strong_etags_become_weak(self):
+        response = HttpResponse(self.BODY, content_type="text/plain")
+        response["ETag"] = '"abc"'
+        self.assertEqual(self.process(response)["ETag"], 'W/"abc"')
+
+        response = HttpResponse(self.BODY, content_type="text/plain")
+        response["ETag"] = 'W/"abc"'
+        self.assertEqual(self.process(response)["ETag"], 'W/"abc"')
+
+    def test_streaming_responses_pass_through(self):
+        response = self.process(StreamingHttpResponse(iter([self.BODY]), content_type="text/event-stream"))
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(response.streaming_content).decode(), self.BODY)
+
+    def test_markdown_plans_are_compressed(self):
+        isolate_storage(self)
+        cache = get_plan_cache()
+        cache.set(ProjectPlanningService().cache_key("Todo", "A todo app"), self.BODY)
+        self.addCleanup(cache.clear)
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}):
+            response = self.client.post(
+                "/api/generate-plan/",
+                {"project_name": "Todo", "project_description": "A todo app", "format": "markdown"},
+                content_type="application/json", HTTP_ACCEPT_ENCODING="gzip",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/markdown"))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content).decode(), self.BODY)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_prometheus_exposition(self):
+        metrics = MetricsRegistry()
+        metrics.inc("jobs_total", [("outcome", "success")])
+        metrics.inc("jobs_total", [("outcome", "success")], 2)
+        for seconds in (0.05, 0.7, 700):
+            metrics.observe("wait_seconds", seconds, [("lane", "batch")])
+        lines = metrics.render({"active": 3}).splitlines()
+        self.assertEqual(lines[:2], ["# TYPE jobs_total counter", 'jobs_total{outcome="success"} 3'])
+        self.assertIn("# TYPE wait_seconds histogram", lines)
+        self.assertIn('wait_seconds_bucket{lane="batch",le="0.1"} 1', lines)
+        self.assertIn('wait_seconds_bucket{lane="batch",le="1"} 2', lines)
+        self.assertIn('wait_seconds_bucket{lane="batch",le="600"} 2', lines)
+        self.assertIn('wait_seconds_bucket{lane="batch",le="+Inf"} 3', lines)
+        self.assertIn('wait_seconds_sum{lane="batch"} 700.75', lines)
+        self.assertIn('wait_seconds_count{lane="batch"} 3', lines)
+        self.assertEqual(lines[-2:], ["# TYPE active gauge", "active 3"])
+
+    def test_finished_run_feeds_stage_token_and_cost_metrics(self):
+        metrics = MetricsRegistry()
+        run = PlanRun("gpt-4o-mini")
+        run.stage("analysis")
+        run.record_llm_call(0.5, 1000, 2000)
+        run.stage("readme")
+        run.record_llm_call(0.25, 3000, 4000)
+        with mock.patch("instrumentation.METRICS", metrics):
+            run.finish()
+        data = run.to_dict()
+        self.assertEqual((data["prompt_tokens"], data["completion_tokens"]), (4000, 6000))
+        self.assertAlmostEqual(data["estimated_cost_usd"], (4000 * 0.15 + 6000 * 0.60) / 1e6)
+        self.assertEqual(data["stages"]["analysis"]["llm_calls"], 1)
+        output = metrics.render()
+        self.assertIn('buildpilot_plan_generations_total{outcome="success"} 1', output)
+        self.assertIn('buildpilot_stage_duration_seconds_count{stage="readme"} 1', output)
+        self.assertIn('buildpilot_llm_tokens_total{stage="analysis",kind="prompt"} 1000', output)
+        self.assertIn('buildpilot_llm_tokens_total{stage="readme",kind="completion"} 4000', output)
+        self.assertIn("buildpilot_llm_cost_usd_total 0.0042", output)
+
+    def test_instrumented_generation(self):
+        isolate_storage(self)
+        patcher = mock.patch("llm_pool._registry", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        install_stub_llm(response_tokens=30)
+        before = METRICS.render()
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}), \
+                contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.post(
+                "/api/generate-plan/",
+                {"project_name": "Metrics", "project_description": "A metered app",
+                 "use_cache": False, "include_timings": True},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        timings = response.json()["timings"]
+        for stage in ("analysis", "readme"):
+            self.assertGreaterEqual(timings["stages"][stage]["llm_calls"], 1)
+        self.assertGreater(timings["prompt_tokens"], 0)
+        self.assertGreater(timings["completion_tokens"], 0)
+        self.assertIsNotNone(timings["estimated_cost_usd"])
+
+        output = self.client.get("/api/metrics/").content.decode()
+        self.assertNotEqual(output, before)
+        self.assertIn('buildpilot_stage_duration_seconds_count{stage="analysis"}', output)
+        self.assertIn('buildpilot_llm_tokens_total{stage="readme",kind="completion"}', output)
+        self.assertIn("buildpilot_llm_cost_usd_total", output)
+
+
+class PlanStreamViewTests(SimpleTestCase):
+    def setUp(self):
+        isolate_storage(self)
+        environ = mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        # A cached plan streams without calling the LLM
+        self.cache = get_plan_cache()
+        self.cache.set(ProjectPlanningService().cache_key("Todo", "A todo app"), "# Todo\n\nPlan")
+        self.addCleanup(self.cache.clear)
+
+    def stream(self, **params):
+        response = self.client.get(
+            "/api/generate-plan/stream/",
+            dict({"project_name": "Todo", "project_description": "A todo app"}, **params),
+            HTTP_ACCEPT="text/event-stream",
+        )
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content).decode()
+
+    def done(self, body):
+        event = body[body.index("event: done\n"):]
+        return json.loads(event.split("data: ", 1)[1].split("\n", 1)[0])
+
+    def test_event_source_clients_get_events(self):
+        response, body = self.stream()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertIn("event: token\ndata: ", body)
+        self.assertIn("event: done\ndata: ", body)
+
+    def test_streamed_plans_are_stored(self):
+        patcher = mock.patch("llm_pool._registry", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        install_stub_llm(response_tokens=30)
+        with contextlib.redirect_stdout(io.StringIO()):  # The crew's verbose output
+            _, body = self.stream(use_cache="false")
+        done = self.done(body)
+        self.assertFalse(done["cached"])
+        record = get_plan_store().get(done["plan_id"])
+        self.assertEqual(record["run_id"], done["run_id"])
+
+        _, body = self.stream()  # Now cached, and stored again for this request
+        self.assertIsNotNone(get_plan_store().get(self.done(body)["plan_id"]))
+
+    async def test_asgi_requests_stream_as_they_go(self):
+        # Under ASGI a sync iterator would be read to the end before sending
+        response = await self.async_client.get(
+            "/api/generate-plan/stream/",
+            {"project_name": "Todo", "project_description": "A todo app"},
+            headers={"accept": "text/event-stream"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn("event: done\ndata: ", body)
+
+    def test_missing_fields_are_a_json_error(self):
+        response = self.client.get(
+            "/api/generate-plan/stream/", {"project_name": "Todo"}, HTTP_ACCEPT="text/event-stream"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+
+
+class PlanBatchViewTests(SimpleTestCase):
+    def setUp(self):
+        isolate_storage(self)
+        environ = mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.cache = get_plan_cache()
+        self.cache.set(ProjectPlanningService().cache_key("Todo", "A todo app"), "# Todo\n\nPlan")
+        self.addCleanup(self.cache.clear)
+
+    def post(self, items, **data):
+        return self.client.post(
+            "/api/generate-plans/batch/", {"items": items, **data},
+            content_type="application/json", HTTP_ACCEPT="application/x-ndjson",
+        )
+
+    def test_json_lines_clients_get_results(self):
+        response = self.post([{"project_name": "Todo", "project_description": "A todo app"}])
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(lines[0]["plan"], "# Todo\n\nPlan")
+        self.assertEqual(get_plan_store().get(lines[0]["plan_id"])["project_name"], "Todo")
+        self.assertEqual(len(lines), 2)  # The result and the summary
+
+    def test_parallelism_must_be_a_number(self):
+        items = [{"project_name": "Todo", "project_description": "A todo app"}]
+        for parallelism in (True, 0, "2"):
+            self.assertEqual(self.post(items, parallelism=parallelism).status_code, 400)
+
+    def test_json_lines_clients_get_json_errors(self):
+        response = self.post([])
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response["Content-Type"].startswith("application/x-ndjson"))
+        self.assertIn("error", json.loads(response.content))
+
+
+README = """# Todo
+
+## Technology Stack
+Django and React.
+
+## API Endpoints
+
+### Tasks
+GET /tasks lists the tasks.
+
+### Accounts
+POST /login signs a user in.
+
+## Project Structure
+A backend and a frontend.
+"""
+
+
+class IncrementalUnitTests(SimpleTestCase):
+    def setUp(self):
+        self.units = split_units(README)
+
+    def test_a_feature_name_picks_its_subsection(self):
+        self.assertEqual(affected_units(self.units, "Tasks can be archived."), [("API Endpoints", "Tasks")])
+
+    def test_a_topic_match_picks_the_whole_section(self):
+        self.assertEqual(
+            affected_units(self.units, "Add rate-limiting."),
+            [("API Endpoints", None), ("API Endpoints", "Tasks"), ("API Endpoints", "Accounts")],
+        )
+        self.assertEqual(
+            affected_units(self.units, "Nothing relevant.", topics={"api"}),
+            [("API Endpoints", None), ("API Endpoints", "Tasks"), ("API Endpoints", "Accounts")],
+        )
+
+    def test_an_unmatched_change_falls_back_to_whole_default_sections(self):
+        targets = affected_units(self.units, "Something unheard of.")
+        self.assertIn(("API Endpoints", "Accounts"), targets)
+        self.assertIn(("Project Structure", None), targets)
+        self.assertNotIn(("Technology Stack", None), targets)
+
+    def test_splice_replaces_subsections_by_heading(self):
+        replacement = (
+            "## API Endpoints\n\n### Tasks\nGET /tasks lists tasks, archived ones too.\n\n"
+            "### accounts\nPOST /login and POST /logout.\n\n### Archive\nPOST /tasks/1/archive."
+        )
+        document, changed = splice_units(self.units, replacement, [("API Endpoints", "Tasks")])
+        self.assertEqual(document.count("### Accounts"), 1)
+        self.assertNotIn("### accounts", document)
+        self.assertIn("POST /logout", document)
+        self.assertIn("archived ones too", document)
+        self.assertEqual(changed, ["API Endpoints / Tasks", "API Endpoints / Accounts", "API Endpoints / Archive"])
+        # The new subsection closes its section
+        self.assertLess(document.index("### Archive"), document.index("## Project Structure"))
+        self.assertEqual(document.count("## API Endpoints"), 1)
+
+    def test_splice_adds_a_new_heading_once_and_keeps_missing_targets(self):
+        replacement = "## API Endpoints\n\n### Archive\nPOST /archive.\n\n### Archive\nPOST /archive again."
+        targets = [("API Endpoints", "Tasks")]
+        document, changed = splice_units(self.units, replacement, targets)
+        self.assertEqual(document.count("### Archive"), 1)
+        self.assertNotIn("again", document)
+        self.assertIn("GET /tasks lists the tasks.", document)
+        self.assertEqual(changed, ["API Endpoints / Archive"])
+
+    def test_splice_leaves_other_sections_alone(self):
+        replacement = "## Technology Stack\nFlask and Vue."
+        document, changed = splice_units(self.units, replacement, [("API Endpoints", "Tasks")])
+        self.assertEqual(document, "\n\n".join(text for _, _, text in self.units))
+        self.assertEqual(changed, [])
+
+
+RAW_PLAN = """Thought: I now can give a great answer
+Final Answer: ```markdown
+
+#Todo
+
+# Setup ##
+Install it.
+
+```
+project/
+├── backend/
+│   └── app.py
+├── frontend/
+        └── index.js
+```
+```
+"""
+
+
+class MarkdownNormalizerTests(SimpleTestCase):
+    def normalize_in_chunks(self, text, size):
+        normalizer = MarkdownNormalizer()
+        out = "".join(normalizer.feed(text[i:i + size]) for i in range(0, len(text), size))
+        return out + normalizer.finish(), normalizer.issues
+
+    def test_whole_document(self):
+        normalizer = MarkdownNormalizer()
+        plan = normalizer.feed(RAW_PLAN) + normalizer.finish()
+        self.assertTrue(plan.startswith("# Todo\n\n## Setup\nInstall it.\n\n```\nproject/"))
+        self.assertTrue(plan.endswith("└── index.js\n```"))
+        self.assertNotIn("Final Answer", plan)
+        self.assertNotIn("```markdown", plan)
+        self.assertEqual(len(normalizer.issues), 1)
+        self.assertEqual(plan, normalize_markdown(RAW_PLAN))
+
+    def test_any_chunking_gives_the_same_result(self):
+        expected = self.normalize_in_chunks(RAW_PLAN, len(RAW_PLAN))
+        for size in range(1, 40):
+            self.assertEqual(self.normalize_in_chunks(RAW_PLAN, size), expected, size)
+
+    def test_output_without_a_final_answer_is_kept(self):
+        self.assertEqual(normalize_markdown("Thought: a plain plan"), "Thought: a plain plan")
+        self.assertEqual(self.normalize_in_chunks("Thought: a plain plan", 3)[0], "Thought: a plain plan")
+
+
+ANALYSIS = """## Project Structure
+
+```
+project/
+├── backend/
+│   ├── app.py
+│   └── models.py
+```
+
+## API Endpoints
+
+- `GET /tasks`: lists tasks. Requires auth.
+- `POST /tasks`: creates a task. Requires auth.
+"""
+
+
+class PromptBudgetTests(SimpleTestCase):
+    def test_text_within_the_budget_is_unchanged(self):
+        self.assertEqual(fit_to_budget(ANALYSIS, 1000), ANALYSIS)
+        self.assertEqual(fit_to_budget(ANALYSIS, 0), ANALYSIS)
+
+    def test_trimming_keeps_whole_lines(self):
+        text = "\n".join(f"- Requirement {i}. Requires auth." for i in range(200))
+        with self.assertLogs("budget", "INFO"):
+            trimmed = fit_to_budget(text, 300)
+        lines = trimmed.split("\n")
+        self.assertIn(TRIM_MARKER, lines)
+        self.assertEqual(lines[0], "- Requirement 0. Requires auth.")
+        self.assertEqual(lines[-1], "- Requirement 199. Requires auth.")
+        self.assertTrue(all(line in text.split("\n") for line in lines if line != TRIM_MARKER))
+
+    def test_trimming_keeps_indentation(self):
+        text = ANALYSIS * 20
+        trimmed = fit_to_budget(text, 200)
+        self.assertIn("│   ├── app.py", trimmed)
+        self.assertTrue(trimmed.startswith(ANALYSIS[:80]))
+
+    def test_an_overlong_line_is_cut(self):
+        trimmed = fit_to_budget("word " * 2000, 100)
+        self.assertIn(TRIM_MARKER, trimmed)
+        self.assertLess(len(trimmed), 1000)
+
+
+class UpdatePromptBudgetTests(SimpleTestCase):
+    def setUp(self):
+        self.tasks = CustomTasks(description_budget=1000, analysis_budget=200)
+        self.diff = diff_requirements("Users can sign in.", "Users can sign in with Google.")
+        self.analysis = "\n\n".join(f"### Part {i}\nDetail sentence number {i} about the design." for i in range(200))
+
+    def test_readme_update_fits_the_updated_analysis_to_the_analysis_budget(self):
+        with self.assertLogs("tasks", "INFO") as logs:
+            prompt = self.tasks.readme_update_prompt("App", self.diff, self.analysis, "## Auth\nSign in.")
+        self.assertIn(TRIM_MARKER, prompt)
+        self.assertIn("### Part 0", prompt)
+        self.assertNotIn("### Part 100\n", prompt)
+        self.assertIn("readme update prompt", logs.output[-1])
+        self.assertIn("input budget 200 tokens", logs.output[-1])
+
+    def test_analysis_update_logs_against_the_analysis_budget(self):
+        with self.assertLogs("tasks", "INFO") as logs:
+            self.tasks.analysis_update_prompt("App", self.diff, "## Auth\nSign in.")
+        self.assertIn("input budget 200 tokens", logs.output[-1])
+
+    def test_sections_to_rewrite_are_checked_not_trimmed(self):
+        self.assertTrue(self.tasks.fits_analysis_budget("## Auth\nSign in."))
+        self.assertFalse(self.tasks.fits_analysis_budget(self.analysis))
+        self.assertTrue(CustomTasks(analysis_budget=0).fits_analysis_budget(self.analysis))
+
+
+class PlanDownloadTests(SimpleTestCase):
+    PLAN = "# Todo\n\n" + "A plan line.\n" * 200
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = PlanStore(directory.name)
+        self.record = self.store.save("Todo", "A todo app", self.PLAN)
+
+    def download(self, **headers):
+        request = RequestFactory().get("/download/", headers=headers)
+        response = plan_download_response(request, self.store.path(self.record["id"]), self.record, "todo.md")
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_plain_download_with_etag(self):
+        response, body = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body.decode(), self.PLAN)
+        self.assertEqual(response["ETag"], f'"{self.record["content_hash"]}"')
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+        response, _ = self.download(if_none_match=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_gzip_pass_through(self):
+        response, body = self.download(accept_encoding="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["ETag"], f'"{self.record["content_hash"]}-gzip"')
+        self.assertEqual(gzip.decompress(body).decode(), self.PLAN)
+
+    def test_gzip_refused_by_q_value(self):
+        for header in ("gzip;q=0", "identity, gzip;q=0", "*;q=0", "br"):
+            request = RequestFactory().get("/download/", headers={"accept-encoding": header})
+            self.assertFalse(accepts_gzip(request), header)
+        request = RequestFactory().get("/download/", headers={"accept-encoding": "br, *;q=0.5"})
+        self.assertTrue(accepts_gzip(request))
+
+        response, body = self.download(accept_encoding="identity, gzip;q=0")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(body.decode(), self.PLAN)
+
+    def test_byte_ranges(self):
+        response, body = self.download(range="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.PLAN.encode()[2:6])
+        self.assertEqual(response["Content-Range"], f"bytes 2-5/{len(self.PLAN)}")
+
+        response, body = self.download(range="bytes=-4")
+        self.assertEqual(body, self.PLAN.encode()[-4:])
+
+        response, _ = self.download(range=f"bytes={len(self.PLAN)}-")
+        self.assertEqual(response.status_code, 416)
+
+        # A stale If-Range gets the whole plan
+        response, body = self.download(range="bytes=2-5", if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body.decode(), self.PLAN)
+
+
+class PlanStoreRetentionTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+
+    def save_at(self, store, when, name):
+        with mock.patch("project_api.plan_store.time.time", return_value=when):
+            return store.save(name, f"{name} description", f"# {name}")
+
+    def test_oldest_plans_beyond_the_cap_are_removed(self):
+        store = PlanStore(self.location, max_plans=2)
+        records = [self.save_at(store, 1000 + i, f"Plan {i}") for i in range(4)]
+        self.assertEqual([store.get(record["id"]) is not None for record in records], [False, False, True, True])
+        self.assertFalse(store.path(records[0]["id"]).exists())
+        self.assertEqual(store.list()[1], 2)
+
+    def test_expired_plans_are_removed(self):
+        store = PlanStore(self.location, max_age=60)
+        old = self.save_at(store, time.time() - 120, "Old")
+        new = store.save("New", "New description", "# New")
+        self.assertIsNone(store.get(old["id"]))
+        self.assertIsNotNone(store.get(new["id"]))
+
+    def test_no_limits_keep_everything(self):
+        store = PlanStore(self.location)
+        records = [self.save_at(store, 1000 + i, f"Plan {i}") for i in range(3)]
+        self.assertTrue(all(store.get(record["id"]) for record in records))
@@ -1,8 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under ASGI the main endpoints are served by the native async views, so the
+# frontend gets them without changing URLs
+main_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('health/', views.health_check, name='health_check'),
-    path('generate-plan/', views.generate_plan, name='generate_plan'),
-    # path('download-plan/<str:filename>/', views.download_plan, name='download_plan'),
+    path('health/', main_views.health_check, name='health_check'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('generate-plan/', main_views.generate_plan, name='generate_plan'),
+    path('generate-plan/stream/', views.generate_plan_stream, name='generate_plan_stream'),
+    path('generate-plans/batch/', views.generate_plans_batch, name='generate_plans_batch'),
+    path('jobs/<str:job_id>/', views.job_detail, name='job_detail'),
+    path('runs/<str:run_id>/', views.run_detail, name='run_detail'),
+    path('runs/<str:run_id>/resume/', views.resume_run, name='resume_run'),
+    path('runs/<str:run_id>/regenerate-readme/', views.regenerate_readme, name='regenerate_readme'),
+    path('async/health/', async_views.health_check, name='async_health_check'),
+    path('async/generate-plan/', async_views.generate_plan, name='async_generate_plan'),
+    path('plans/', views.list_plans, name='list_plans'),
+    path('plans/<str:plan_id>/', views.plan_detail, name='plan_detail'),
+    path('plans/<str:plan_id>/download/', views.download_plan, name='download_plan'),
+    path('plans/<str:plan_id>/regenerate/', views.regenerate_plan, name='regenerate_plan'),
 ]
\ No newline at end of file
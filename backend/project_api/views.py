@@ -1,19 +1,86 @@
 import os
-from rest_framework.decorators import api_view
+import re
+import json
+from datetime import datetime, timezone
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
 from rest_framework import status
 from django.http import JsonResponse, HttpResponse, Http404
 from django.conf import settings
+from django.views.decorators.http import require_GET
+from batch import RateLimiter, run_batch, summarize
+from instrumentation import METRICS
+from .admission import AdmissionRejected, client_id, get_admission_controller
 from .ai_service import ProjectPlanningService
+from .cache import get_plan_cache
+from .downloads import plan_download_response
+from .jobs import JobQueueFull, get_job_manager
+from .pipeline_runs import PipelineRunUnavailable, get_pipeline_run_store
+from .plan_store import get_plan_store
+from .responses import JSON_LINES_RENDERERS, markdown_plan_response, streaming_response, wants_markdown
+from .scheduler import BATCH
+
+# Shared by all batch requests so concurrent batches respect one rate limit
+batch_rate_limiter = RateLimiter(settings.PLAN_BATCH['RATE_LIMIT'], settings.PLAN_BATCH['BURST'])
 
 @api_view(['GET'])
 def health_check(request):
     """Health check endpoint"""
+    cache = get_plan_cache()
     return Response({
         "status": "healthy",
-        "message": "BuildPilot AI backend is running"
+        "message": "BuildPilot AI backend is running",
+        "plan_cache": cache.stats() if cache else None,
+        "admission": get_admission_controller().stats()
     })
 
+def _admission_rejected(error):
+    """429/503 response for a shed request, with a Retry-After hint"""
+    return Response({
+        "error": str(error)
+    }, status=error.status, headers={"Retry-After": str(error.retry_after)})
+
+def _generation_failed(error):
+    """500 response for a failed generation, pointing at its resumable run"""
+    data = {
+        "error": f"An error occurred: {str(error)}"
+    }
+    run_id = getattr(error, 'run_id', None)
+    if run_id:
+        data["run_id"] = run_id
+        data["resume_url"] = f"/api/runs/{run_id}/resume/"
+    return Response(data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def _plan_generated(service, project_name, project_description, plan, timings, include_timings,
+                    markdown=False, plan_id=None):
+    """Store a freshly generated plan and build the success response
+
+    With ``markdown`` the response is the plan itself; see ``markdown_plan_response``.
+    A plan already stored as ``plan_id`` is not saved again.
+    """
+    # Keep the plan so it can be listed and downloaded later
+    if plan_id:
+        record = {"id": plan_id}
+    else:
+        record = service.save_plan(project_name, project_description, plan)
+    if markdown:
+        return markdown_plan_response(
+            plan, record["id"], service.pipeline_run_id, timings if include_timings else None
+        )
+    
+    data = {
+        "message": "success",
+        "plan": plan,
+        "plan_id": record["id"],
+        "download_url": f"/api/plans/{record['id']}/download/",
+        "run_id": service.pipeline_run_id
+    }
+    if service.regenerated_sections is not None:
+        data["regenerated_sections"] = service.regenerated_sections
+    if include_timings:
+        data["timings"] = timings.to_dict()
+    return Response(data)
+
 @api_view(['POST'])
 def generate_plan(request):
     """Generate project plan endpoint"""
@@ -21,6 +88,8 @@ def generate_plan(request):
         # Validate request data
         project_name = request.data.get('project_name')
         project_description = request.data.get('project_description')
+        use_cache = request.data.get('use_cache', True) is not False
+        include_timings = request.data.get('include_timings') is True
         
         if not project_name or not project_description:
             return Response({
@@ -33,40 +102,380 @@ def generate_plan(request):
                 "error": "OpenAI API key not configured"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        # Generate project plan
-        service = ProjectPlanningService()
-        plan = service.generate_project_plan(project_name, project_description)
+        # In async mode hand the work to the job pool and return immediately
+        if request.data.get('mode') == 'async':
+            try:
+                job = get_job_manager().submit(
+                    project_name, project_description, use_cache=use_cache,
+                    client_id=client_id(request)
+                )
+            except JobQueueFull as e:
+                return Response({
+                    "error": str(e)
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            
+            return Response({
+                "message": "accepted",
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/api/jobs/{job.id}/"
+            }, status=status.HTTP_202_ACCEPTED)
         
-        # # Save plan to file
-        # file_path = service.save_plan_to_file(project_name, plan)
+        # Generate project plan once a generation slot is free
+        service = ProjectPlanningService()
+        timings = service.new_run()
+        with get_admission_controller().admit(client_id(request)):
+            plan = service.generate_project_plan(
+                project_name, project_description, use_cache=use_cache, timings=timings
+            )
         
-        return Response({
-            "message": "success",
-            "plan": plan
-        })
+        return _plan_generated(
+            service, project_name, project_description, plan, timings, include_timings,
+            markdown=wants_markdown(request.data)
+        )
         
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
     except Exception as e:
+        return _generation_failed(e)
+
+@api_view(['GET'])
+def metrics(request):
+    """Prometheus-style metrics: stage timings, token usage and cost estimates"""
+    gauges = {}
+    cache = get_plan_cache()
+    if cache:
+        stats = cache.stats()
+        gauges["buildpilot_plan_cache_hits"] = stats["hits"]
+        gauges["buildpilot_plan_cache_misses"] = stats["misses"]
+        gauges["buildpilot_plan_cache_entries"] = stats["entries"]
+    if settings.PLAN_SIMILARITY_CACHE['ENABLED']:
+        from .similarity import get_similarity_index  # Loads NumPy
+        stats = get_similarity_index().stats()
+        gauges["buildpilot_similarity_cache_hits"] = stats["hits"]
+        gauges["buildpilot_similarity_cache_misses"] = stats["misses"]
+        gauges["buildpilot_similarity_cache_entries"] = stats["entries"]
+    jobs = get_job_manager().stats()
+    gauges["buildpilot_jobs_pending"] = jobs["pending"]
+    gauges["buildpilot_jobs_running"] = jobs["running"]
+    admission = get_admission_controller().stats()
+    gauges["buildpilot_admission_active"] = admission["active"]
+    gauges["buildpilot_admission_waiting"] = admission["waiting"]
+    for lane, lane_stats in admission["lanes"].items():
+        gauges[f"buildpilot_admission_{lane}_active"] = lane_stats["active"]
+        gauges[f"buildpilot_admission_{lane}_waiting"] = lane_stats["waiting"]
+        gauges[f"buildpilot_admission_{lane}_queue_wait_p95_seconds"] = lane_stats["queue_wait_p95"]
+    
+    return HttpResponse(
+        METRICS.render(gauges),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+def _sse_events(events):
+    """Encode ``(event, data)`` pairs as Server-Sent Events"""
+    for event, data in events:
+        if event is None:
+            yield ": keep-alive\n\n"
+        else:
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# A plain Django view: DRF's content negotiation would reject EventSource
+# clients, which always send Accept: text/event-stream
+@require_GET
+def generate_plan_stream(request):
+    """Stream plan generation progress and README tokens as Server-Sent Events"""
+    project_name = request.GET.get('project_name')
+    project_description = request.GET.get('project_description')
+    use_cache = request.GET.get('use_cache', 'true').lower() != 'false'
+    
+    if not project_name or not project_description:
+        return JsonResponse({
+            "error": "Both project_name and project_description are required"
+        }, status=400)
+    
+    if not os.getenv("OPENAI_API_KEY"):
+        return JsonResponse({
+            "error": "OpenAI API key not configured"
+        }, status=500)
+    
+    # The slot is held until the stream ends or the client disconnects
+    admission = get_admission_controller()
+    client = client_id(request)
+    try:
+        admission.acquire(client)
+    except AdmissionRejected as e:
+        return JsonResponse({
+            "error": str(e)
+        }, status=e.status, headers={"Retry-After": str(e.retry_after)})
+    
+    service = ProjectPlanningService()
+    events = service.stream_project_plan(project_name, project_description, use_cache=use_cache)
+    body = admission.hold_until_closed(_sse_events(events), client)
+    
+    response = streaming_response(request, body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx-style proxies from buffering
+    return response
+
+def _ndjson_batch(results):
+    """Encode batch results as JSON Lines, ending with a summary line"""
+    finished = []
+    for result in results:
+        finished.append(result)
+        yield json.dumps(result) + "\n"
+    yield json.dumps(summarize(finished)) + "\n"
+
+@api_view(['POST'])
+@renderer_classes(JSON_LINES_RENDERERS)
+def generate_plans_batch(request):
+    """Generate plans for many projects, streaming each result as JSON Lines"""
+    items = request.data.get('items')
+    use_cache = request.data.get('use_cache', True) is not False
+    parallelism = request.data.get('parallelism', settings.PLAN_BATCH['PARALLELISM'])
+    
+    if not isinstance(items, list) or not items:
+        return Response({
+            "error": "items must be a non-empty list of projects"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if len(items) > settings.PLAN_BATCH['MAX_ITEMS']:
         return Response({
-            "error": f"An error occurred: {str(e)}"
+            "error": f"A batch may contain at most {settings.PLAN_BATCH['MAX_ITEMS']} items"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # bool is an int subclass, but true is not a number of workers
+    if not isinstance(parallelism, int) or isinstance(parallelism, bool) or parallelism < 1:
+        return Response({
+            "error": "parallelism must be a positive integer"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not os.getenv("OPENAI_API_KEY"):
+        return Response({
+            "error": "OpenAI API key not configured"
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    admission = get_admission_controller()
+    client = client_id(request)
+    
+    def generate(project_name, project_description):
+        # One service per item: it tracks the pipeline run behind its plan
+        service = ProjectPlanningService()
+        with admission.admit(client, lane=BATCH):
+            plan = service.generate_project_plan(project_name, project_description, use_cache=use_cache)
+        record = service.save_plan(project_name, project_description, plan)
+        return {"plan": plan, "plan_id": record["id"]}
+    
+    results = run_batch(
+        items,
+        generate,
+        parallelism=min(parallelism, settings.PLAN_BATCH['PARALLELISM']),
+        rate_limiter=batch_rate_limiter,
+    )
+    response = streaming_response(request, _ndjson_batch(results), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-# @api_view(['GET'])
-# def download_plan(request, filename):
-#     """Download generated plan as markdown file"""
-#     try:
-#         file_path = settings.GENERATED_PLANS_DIR / filename
-        
-#         if not file_path.exists():
-#             raise Http404("Plan file not found")
-        
-#         with open(file_path, 'r', encoding='utf-8') as f:
-#             content = f.read()
+@api_view(['GET', 'DELETE'])
+def job_detail(request, job_id):
+    """Report the status of a plan generation job, or cancel it
+
+    Anyone with the job ID can poll it, but only the client that submitted
+    it can cancel it; other clients get a 404 as if it did not exist.
+    """
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if request.method == 'DELETE' and job is not None and job.client_id == client_id(request):
+        job = manager.cancel(job_id)
+    elif request.method == 'DELETE':
+        job = None
+    
+    if job is None:
+        return Response({
+            "error": "Job not found"
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(job.to_dict())
+
+def _run_record(record):
+    """Public view of a pipeline run, without the stage outputs"""
+    store = get_pipeline_run_store()
+    return {
+        "run_id": record["id"],
+        "project_name": record["project_name"],
+        "status": record["status"],
+        "completed_stages": store.completed_stages(record),
+        "error": record["error"],
+        "created_at": datetime.fromtimestamp(record["created_at"], tz=timezone.utc).isoformat(),
+        "updated_at": datetime.fromtimestamp(record["updated_at"], tz=timezone.utc).isoformat(),
+    }
+
+@api_view(['GET'])
+def run_detail(request, run_id):
+    """Report the status and checkpointed stages of a pipeline run"""
+    record = get_pipeline_run_store().get(run_id)
+    if record is None:
+        return Response({
+            "error": "Pipeline run not found"
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(_run_record(record))
+
+def _continue_run(request, run_id, readme_only):
+    """Resume a pipeline run, or regenerate its README from the stored analysis"""
+    if not os.getenv("OPENAI_API_KEY"):
+        return Response({
+            "error": "OpenAI API key not configured"
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    include_timings = request.data.get('include_timings') is True
+    service = ProjectPlanningService()
+    timings = service.new_run()
+    try:
+        with get_admission_controller().admit(client_id(request)):
+            if readme_only:
+                plan = service.regenerate_readme(run_id, timings=timings)
+            else:
+                plan = service.resume_pipeline(run_id, timings=timings)
         
-#         response = HttpResponse(content, content_type='text/markdown')
-#         response['Content-Disposition'] = f'attachment; filename="{filename}"'
-#         return response
+        record = get_pipeline_run_store().get(run_id)
+        return _plan_generated(
+            service, record["project_name"], record["project_description"],
+            plan, timings, include_timings, markdown=wants_markdown(request.data)
+        )
+    
+    except PipelineRunUnavailable as e:
+        return Response({
+            "error": str(e)
+        }, status=e.status)
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except Exception as e:
+        return _generation_failed(e)
+
+@api_view(['POST'])
+def resume_run(request, run_id):
+    """Finish a failed or cancelled pipeline run from its last completed stage"""
+    return _continue_run(request, run_id, readme_only=False)
+
+@api_view(['POST'])
+def regenerate_readme(request, run_id):
+    """Generate a new README for a pipeline run, reusing its stored analysis"""
+    return _continue_run(request, run_id, readme_only=True)
+
+def _plan_record(record):
+    """Public view of a plan store record"""
+    return {
+        "plan_id": record["id"],
+        "project_name": record["project_name"],
+        "input_hash": record["input_hash"],
+        "size": record["size"],
+        "created_at": datetime.fromtimestamp(record["created_at"], tz=timezone.utc).isoformat(),
+        "download_url": f"/api/plans/{record['id']}/download/",
+        "run_id": record["run_id"],
+    }
+
+def _positive_int(value, default):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return default
+    return number if number > 0 else default
+
+@api_view(['GET'])
+def list_plans(request):
+    """List stored plans, newest first, filtered by project_name or input_hash"""
+    page = _positive_int(request.query_params.get('page'), 1)
+    page_size = min(
+        _positive_int(request.query_params.get('page_size'), settings.PLANS_PAGE_SIZE),
+        settings.PLANS_MAX_PAGE_SIZE,
+    )
+    
+    records, total = get_plan_store().list(
+        project_name=request.query_params.get('project_name'),
+        input_hash=request.query_params.get('input_hash'),
+        limit=page_size,
+        offset=(page - 1) * page_size,
+    )
+    
+    return Response({
+        "count": total,
+        "page": page,
+        "page_size": page_size,
+        "next": page + 1 if page * page_size < total else None,
+        "previous": page - 1 if page > 1 else None,
+        "results": [_plan_record(record) for record in records]
+    })
+
+@api_view(['GET'])
+def plan_detail(request, plan_id):
+    """Metadata for a stored plan"""
+    record = get_plan_store().get(plan_id)
+    if record is None:
+        return Response({
+            "error": "Plan not found"
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(_plan_record(record))
+
+@api_view(['POST'])
+def regenerate_plan(request, plan_id):
+    """Regenerate a stored plan for an edited description, rewriting only the affected sections"""
+    project_description = request.data.get('project_description')
+    project_name = request.data.get('project_name')
+    include_timings = request.data.get('include_timings') is True
+    
+    if not project_description:
+        return Response({
+            "error": "project_description is required"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not os.getenv("OPENAI_API_KEY"):
+        return Response({
+            "error": "OpenAI API key not configured"
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    service = ProjectPlanningService()
+    timings = service.new_run()
+    try:
+        with get_admission_controller().admit(client_id(request)):
+            plan = service.regenerate_plan(
+                plan_id, project_description, project_name=project_name, timings=timings
+            )
         
-#     except Exception as e:
-#         return JsonResponse({
-#             "error": f"Error downloading file: {str(e)}"
-#         }, status=500)
\ No newline at end of file
+        if service.unchanged_plan_id is None and not project_name:
+            # The plan may have been pruned while it was regenerated
+            record = get_plan_store().get(plan_id)
+            if record is None:
+                return Response({
+                    "error": "Plan not found"
+                }, status=status.HTTP_404_NOT_FOUND)
+            project_name = record["project_name"]
+        return _plan_generated(
+            service, project_name, project_description, plan, timings, include_timings,
+            markdown=wants_markdown(request.data), plan_id=service.unchanged_plan_id
+        )
+    
+    except PipelineRunUnavailable as e:
+        return Response({
+            "error": str(e)
+        }, status=e.status)
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except Exception as e:
+        return _generation_failed(e)
+
+# A plain Django view: DRF's content negotiation would reject download
+# clients that only accept text/markdown
+@require_GET
+def download_plan(request, plan_id):
+    """Download a stored plan as a markdown file"""
+    store = get_plan_store()
+    record = store.get(plan_id)
+    if record is None:
+        return JsonResponse({
+            "error": "Plan not found"
+        }, status=404)
+    
+    slug = re.sub(r'[^\w-]+', '_', record['project_name']).strip('_').lower() or 'project'
+    return plan_download_response(request, store.path(plan_id), record, f"{slug}_plan.md")
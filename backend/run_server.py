@@ -1,13 +1,176 @@
 # filepath: /Users/yuanliheng/Desktop/BuildPilot/backend/run_server.py
 #!/usr/bin/env python
+import argparse
 import os
+import signal
 import sys
+import threading
+import time
 from dotenv import load_dotenv
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the BuildPilot backend")
+    parser.add_argument('--asgi', action='store_true',
+                        help="Serve the ASGI app with uvicorn instead of the dev server")
+    parser.add_argument('--prod', action='store_true',
+                        help="Serve with pre-forked gunicorn workers (threaded WSGI, or uvicorn workers with --asgi)")
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1)),
+                        help="Worker processes in --prod mode")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('SERVER_THREADS', '8')),
+                        help="Request threads per WSGI worker in --prod mode")
+    return parser.parse_args(argv)
+
+def run_asgi(args):
+    """Production ASGI server: one event loop holds many concurrent generations"""
+    try:
+        import uvicorn
+    except ImportError as exc:
+        raise ImportError(
+            "Couldn't import uvicorn. Install it with 'pip install uvicorn' "
+            "to serve the ASGI application."
+        ) from exc
+
+    uvicorn.run(
+        'buildpilot_api.asgi:application',
+        host=args.host,
+        port=args.port,
+        lifespan='off',  # Django's ASGI handler does not implement lifespan events
+        timeout_keep_alive=int(os.getenv('KEEP_ALIVE_TIMEOUT', '5')),
+    )
+
+def current_rss_mb():
+    """Resident memory of this process in MB"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # No /proc (e.g. macOS): fall back to the peak, in bytes there
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 20
+
+def watch_memory(worker, limit_mb, interval):
+    """Gracefully stop ``worker`` once it uses more than ``limit_mb``; gunicorn replaces it"""
+    while worker.alive:
+        time.sleep(interval)
+        rss = current_rss_mb()
+        if rss > limit_mb:
+            worker.log.warning("Worker %s uses %.0f MB (limit %d MB), recycling it", worker.pid, rss, limit_mb)
+            # The same signal a graceful reload sends: in-flight requests finish first
+            os.kill(worker.pid, signal.SIGTERM)
+            return
+
+def uvicorn_worker_class():
+    try:
+        from uvicorn_worker import UvicornWorker
+    except ImportError:
+        from uvicorn.workers import UvicornWorker  # Deprecated, but ships with uvicorn
+
+    class DjangoUvicornWorker(UvicornWorker):
+        # Django's ASGI handler does not implement lifespan events
+        CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "lifespan": "off"}
+
+    return DjangoUvicornWorker
+
+def run_prod(args):
+    """Pre-fork production server
+
+    The master imports the app, LangChain and the LLM clients before forking
+    ``--workers`` processes that share those pages. crewai starts native
+    threads on import, which do not survive a fork, so each worker loads it
+    and builds its agents right after forking, before taking requests.
+    WSGI workers serve ``--threads`` requests each; with ``--asgi`` each
+    worker is a uvicorn event loop. A reload (SIGHUP) or
+    shutdown (SIGTERM) lets in-flight generations and background jobs finish
+    for up to ``SERVER_GRACEFUL_TIMEOUT`` seconds, and a worker above
+    ``SERVER_MAX_WORKER_MEMORY_MB`` is replaced the same way.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+        from gunicorn.util import import_app
+    except ImportError as exc:
+        raise ImportError(
+            "Couldn't import gunicorn. Install it with 'pip install gunicorn' "
+            "to run the production server."
+        ) from exc
+
+    # Preloading is done here, split around the fork, rather than in the app's ready()
+    os.environ['PLAN_PRELOAD'] = 'false'
+    app_uri, options = prod_config(args)
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            application = import_app(app_uri)
+            from project_api.ai_service import preload
+            preload(crew=False)
+            return application
+
+    ProductionServer().run()
+
+def prod_config(args):
+    """The app to serve and the gunicorn settings, with the worker hooks, for ``run_prod``"""
+    memory_limit = int(os.getenv('SERVER_MAX_WORKER_MEMORY_MB', '1024'))
+    memory_interval = float(os.getenv('SERVER_MEMORY_CHECK_INTERVAL', '10'))
+    max_requests = int(os.getenv('SERVER_MAX_REQUESTS', '0'))
+
+    def post_fork(server, worker):
+        if memory_limit:
+            threading.Thread(
+                target=watch_memory, args=(worker, memory_limit, memory_interval),
+                name="memory-watch", daemon=True,
+            ).start()
+
+    def post_worker_init(worker):
+        from project_api.ai_service import preload
+        preload()
+
+    def worker_exit(server, worker):
+        # Queued background jobs are cancelled; running ones get to finish
+        from project_api.jobs import shutdown_job_manager
+        shutdown_job_manager(wait=True)
+
+    options = {
+        'bind': f'{args.host}:{args.port}',
+        'workers': args.workers,
+        'preload_app': True,
+        'timeout': int(os.getenv('SERVER_TIMEOUT', '120')),
+        'graceful_timeout': int(os.getenv('SERVER_GRACEFUL_TIMEOUT', '600')),
+        'keepalive': int(os.getenv('KEEP_ALIVE_TIMEOUT', '5')),
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests // 10,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+    }
+    if args.asgi:
+        app_uri = 'buildpilot_api.asgi:application'
+        options['worker_class'] = uvicorn_worker_class()
+    else:
+        app_uri = 'buildpilot_api.wsgi:application'
+        options['worker_class'] = 'gthread'
+        options['threads'] = args.threads
+    if os.path.isdir('/dev/shm'):
+        options['worker_tmp_dir'] = '/dev/shm'  # Heartbeat files off a possibly slow disk
+    return app_uri, options
+
 def main():
     load_dotenv()
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'buildpilot_api.settings')
-    
+    args = parse_args()
+
+    if args.prod:
+        run_prod(args)
+        return
+
+    if args.asgi:
+        run_asgi(args)
+        return
+
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -16,8 +179,8 @@ def main():
             "available on your PYTHONPATH environment variable? Did you "
             "forget to activate a virtual environment?"
         ) from exc
-    
-    execute_from_command_line(['manage.py', 'runserver', '0.0.0.0:8000'])
+
+    execute_from_command_line(['manage.py', 'runserver', f'{args.host}:{args.port}'])
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,69 +1,281 @@
-from crewai import Task
+import hashlib
+import logging
+import os
 from textwrap import dedent
 
+from budget import ANALYSIS_TOKEN_BUDGET, DESCRIPTION_TOKEN_BUDGET, count_tokens, fit_to_budget
+from incremental import heading_topic, split_sections
+
+logger = logging.getLogger(__name__)
+
+# Shared by both tasks so the formatting rule is written (and paid for) once per prompt
+NO_CODE_BLOCK_RULE = "IMPORTANT: Return the {content} content directly, without wrapping it in code blocks (no ```markdown or ``` tags)."
+
+PROJECT_ANALYSIS_PROMPT = dedent("""
+    Analyze the following project and create a comprehensive project plan:
+
+    Project Name: {project_name}
+    Project Description: {project_description}
+
+    Cover, in order of priority, each part under its own "## " heading:
+
+    1. "## Project Structure" (Primary Focus): the complete file and directory structure, with EVERY file and its exact purpose, including configuration, utility and helper modules.
+    2. "## API Design": EVERY API endpoint with its URL pattern and a brief explanation, plus authentication and authorization.
+    3. "## Technology Stack", "## Architecture" and "## Challenges": technology stack with specific versions, architecture and design patterns, potential challenges with specific solutions.
+
+    Within the structure and API parts, group the details by feature under "### " subheadings.
+
+    """) + NO_CODE_BLOCK_RULE.format(content="plain text")
+
+PROJECT_ANALYSIS_OUTPUT = "A detailed project analysis focused on project structure and API design, in plain text"
+
+README_GENERATION_PROMPT = dedent("""
+    Create a professional README.md file for the project "{project_name}" based on {project_analysis}
+
+    Start with the title "# {project_name}", then these sections, in order, each under its own "## " heading:
+
+    1. "## Project Introduction": a comprehensive description and overview, the technology stack and prerequisites.
+    2. "## Project Structure" (Primary Focus, make it extremely detailed): a complete file tree listing EVERY file and directory with its path and organization logic.
+    3. "## API Documentation": EVERY API endpoint with its URL path and a brief explanation, grouped by feature under "### " subheadings, plus API versioning and rate limiting if applicable.
+
+    """) + NO_CODE_BLOCK_RULE.format(content="raw markdown")
+
+# Used when the analysis reaches the agent as crew task context instead of inline
+ANALYSIS_FROM_CONTEXT = "the project analysis provided as context."
+
+README_GENERATION_OUTPUT = "A complete, professional README.md focused on the project structure, in raw markdown"
+
+# Fan-out mode: each README section is written by its own concurrent call
+README_FANOUT = os.getenv('PLAN_README_FANOUT', 'False').lower() == 'true'
+
+# The README_GENERATION_PROMPT sections in order: heading, what it covers and
+# the topics of the analysis sections it is written from (None: sections
+# without a topic, such as architecture and challenges)
+README_SECTIONS = (
+    ("Project Introduction",
+     "a comprehensive description and overview, the technology stack and prerequisites.",
+     ("stack", None)),
+    ("Project Structure",
+     "a complete file tree listing EVERY file and directory with its path and organization logic. This is the primary focus of the README, make it extremely detailed.",
+     ("structure",)),
+    ("API Documentation",
+     'EVERY API endpoint with its URL path and a brief explanation, grouped by feature under "### " subheadings, plus API versioning and rate limiting if applicable.',
+     ("api",)),
+)
+
+README_SECTION_PROMPT = dedent("""
+    Write the "## {heading}" section of the README.md for the project "{project_name}", based on this part of the project analysis:
+
+    {project_analysis}
+
+    The section covers {covers}
+    Start with the "## {heading}" heading and return only this section; the other sections are written separately.
+
+    """) + NO_CODE_BLOCK_RULE.format(content="raw markdown")
+
+README_SECTION_OUTPUT = "One README.md section under its \"## \" heading, in raw markdown"
+
+# Incremental regeneration: rewrite only the sections an edited description affects
+SECTION_UPDATE_RULE = "Rewrite only the sections below, keeping their \"## \" and \"### \" headings and what is still correct. Add a new \"### \" subsection under them if a new feature needs one. Return only these sections, in the same order."
+
+ANALYSIS_UPDATE_PROMPT = dedent("""
+    The requirements of the project "{project_name}" have changed.
+
+    Removed or replaced requirements:
+    {removed}
+
+    New or edited requirements:
+    {added}
+
+    Update the affected sections of the project analysis to reflect the change. {rule}
+
+    {sections}
+
+    """) + NO_CODE_BLOCK_RULE.format(content="plain text")
+
+README_UPDATE_PROMPT = dedent("""
+    The analysis of the project "{project_name}" was updated for these requirement changes:
+    {changes}
+
+    Updated analysis sections:
+    {analysis}
+
+    Update the matching sections of the README.md. {rule}
+
+    {sections}
+
+    """) + NO_CODE_BLOCK_RULE.format(content="raw markdown")
+
+SECTION_UPDATE_OUTPUT = "The rewritten sections only, each under its original heading"
+
 class CustomTasks:
+    PROMPTS = (
+        PROJECT_ANALYSIS_PROMPT,
+        PROJECT_ANALYSIS_OUTPUT,
+        README_GENERATION_PROMPT,
+        README_GENERATION_OUTPUT,
+        README_SECTION_PROMPT,
+        README_SECTION_OUTPUT,
+        ANALYSIS_UPDATE_PROMPT,
+        README_UPDATE_PROMPT,
+        SECTION_UPDATE_RULE,
+        SECTION_UPDATE_OUTPUT,
+    ) + tuple(covers for _, covers, _ in README_SECTIONS)
+
+    def __init__(self, description_budget=None, analysis_budget=None, model_name="gpt-4o-mini",
+                 readme_fanout=None):
+        # Token budgets for user-controlled prompt parts; 0 disables trimming
+        self.description_budget = DESCRIPTION_TOKEN_BUDGET if description_budget is None else description_budget
+        self.analysis_budget = ANALYSIS_TOKEN_BUDGET if analysis_budget is None else analysis_budget
+        self.model_name = model_name
+        self.readme_fanout = README_FANOUT if readme_fanout is None else readme_fanout
+
+    def prompt_fingerprint(self):
+        """Hash of all prompt text and settings, so cached plans expire when any changes"""
+        digest = hashlib.sha256()
+        settings = (str(self.description_budget), str(self.analysis_budget), str(self.readme_fanout))
+        for prompt in self.PROMPTS + settings:
+            digest.update(prompt.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def analysis_prompt(self, project_name, project_description):
+        """Analysis task description with the project description fitted to its budget"""
+        description = fit_to_budget(
+            project_description, self.description_budget, self.model_name, label="project description"
+        )
+        prompt = PROJECT_ANALYSIS_PROMPT.format(
+            project_name=project_name,
+            project_description=description,
+        )
+        self._log_prompt("analysis", prompt, self.description_budget)
+        return prompt
+
+    def readme_prompt(self, project_name, project_analysis=None):
+        """README task description; without ``project_analysis`` it refers to task context"""
+        if project_analysis is None:
+            analysis = ANALYSIS_FROM_CONTEXT
+        else:
+            analysis = "this analysis:\n\n" + fit_to_budget(
+                project_analysis, self.analysis_budget, self.model_name, label="project analysis"
+            )
+        prompt = README_GENERATION_PROMPT.format(
+            project_name=project_name,
+            project_analysis=analysis,
+        )
+        self._log_prompt("readme", prompt, self.analysis_budget)
+        return prompt
+
+    def readme_section_prompts(self, project_name, project_analysis):
+        """``(heading, prompt)`` for each README section, in README order
+
+        Each prompt carries only the analysis sections its README section is
+        written from, or the whole analysis if it has no such sections.
+        """
+        analysis_sections = split_sections(project_analysis)
+        prompts = []
+        for heading, covers, topics in README_SECTIONS:
+            relevant = "\n\n".join(
+                text for name, text in analysis_sections
+                if name is not None and heading_topic(name) in topics
+            )
+            analysis = fit_to_budget(
+                relevant or project_analysis, self.analysis_budget, self.model_name, label="project analysis"
+            )
+            prompt = README_SECTION_PROMPT.format(
+                heading=heading,
+                project_name=project_name,
+                project_analysis=analysis,
+                covers=covers,
+            )
+            self._log_prompt(f"readme section {heading!r}", prompt, self.analysis_budget)
+            prompts.append((heading, prompt))
+        return prompts
+
+    def fits_analysis_budget(self, text):
+        """Whether ``text`` fits the analysis budget as it is
+
+        Sections sent to be rewritten are spliced back into the plan, so they
+        are never trimmed; callers fall back to a full generation instead.
+        """
+        return not self.analysis_budget or count_tokens(text, self.model_name) <= self.analysis_budget
+
+    def analysis_update_prompt(self, project_name, diff, sections):
+        """Prompt to rewrite the analysis ``sections`` for a description diff"""
+        prompt = ANALYSIS_UPDATE_PROMPT.format(
+            project_name=project_name,
+            removed=self._bullets(diff.removed),
+            added=self._bullets(diff.added),
+            rule=SECTION_UPDATE_RULE,
+            sections=sections,
+        )
+        self._log_prompt("analysis update", prompt, self.analysis_budget)
+        return prompt
+
+    def readme_update_prompt(self, project_name, diff, analysis_sections, sections):
+        """Prompt to rewrite README ``sections`` from the updated analysis sections"""
+        prompt = README_UPDATE_PROMPT.format(
+            project_name=project_name,
+            changes=self._bullets(diff.removed + diff.added),
+            analysis=fit_to_budget(
+                analysis_sections, self.analysis_budget, self.model_name, label="updated analysis"
+            ),
+            rule=SECTION_UPDATE_RULE,
+            sections=sections,
+        )
+        self._log_prompt("readme update", prompt, self.analysis_budget)
+        return prompt
+
+    def _bullets(self, lines):
+        bullets = "\n".join(f"- {line}" for line in lines) or "- (none)"
+        return fit_to_budget(bullets, self.description_budget, self.model_name, label="requirement changes")
+
+    def _task(self, description, agent, expected_output):
+        from crewai import Task  # crewai takes seconds to import, so only once a task is built
+        return Task(description=description, agent=agent, expected_output=expected_output)
+
+    def _log_prompt(self, task, prompt, budget):
+        logger.info("%s prompt: %d tokens (input budget %s tokens)",
+                    task, count_tokens(prompt, self.model_name), budget or "unlimited")
+
     def project_analysis_task(self, agent, project_name, project_description):
-        return Task(
-            description=dedent(f"""
-            Analyze the following project and create a comprehensive project plan:
-            
-            Project Name: {project_name}
-            Project Description: {project_description}
-            
-            Your analysis should emphasize and provide detailed coverage of:
-            
-            1. **DETAILED PROJECT STRUCTURE PLANNING** (Primary Focus):
-               - Design a comprehensive file and directory structure
-               - Specify EVERY file that should be created with their exact purposes
-               - Include configuration files, utility files, and helper modules
-            
-            2. API design:
-               - Design and document EVERY API endpoint
-               - Specify URL patterns and provide a brief explanation of what it does
-               - Plan authentication and authorization mechanisms
-            
-            3. Supporting analysis sections:
-               - Technology stack recommendations with specific versions
-               - Project architecture overview and design patterns
-               - Potential challenges and specific solutions
-            
-            IMPORTANT: Return only the plain text content without any markdown code block wrappers (no ```markdown or ``` tags).
-            """),
+        return self._task(
+            description=self.analysis_prompt(project_name, project_description),
+            agent=agent,
+            expected_output=PROJECT_ANALYSIS_OUTPUT
+        )
+
+    def readme_generation_task(self, agent, project_name, project_analysis=None):
+        # Pass ``project_analysis`` when this task runs in its own crew; in a
+        # sequential crew the analysis already reaches it as context
+        return self._task(
+            description=self.readme_prompt(project_name, project_analysis),
+            agent=agent,
+            expected_output=README_GENERATION_OUTPUT
+        )
+
+    def analysis_update_task(self, agent, project_name, diff, sections):
+        return self._task(
+            description=self.analysis_update_prompt(project_name, diff, sections),
             agent=agent,
-            expected_output="A detailed project analysis with comprehensive project structure planning and API design as the main focus, in plain text format"
+            expected_output=SECTION_UPDATE_OUTPUT
         )
-    
-    def readme_generation_task(self, agent, project_name, project_analysis):
-        return Task(
-            description=dedent(f"""
-            Create a professional README.md file for the project "{project_name}":
-            
-            Based on this analysis: {project_analysis}
-            
-            The README should follow this structure and prioritize these sections:
-            
-            1. **Project Introduction** (First Section):
-               - Project title: {project_name}
-               - Comprehensive project description and overview
-               - Technology stack and prerequisites
-            
-            2. **DETAILED PROJECT STRUCTURE** (Primary Focus):
-               - List EVERY file and directory in the project
-               - Include file paths and organization logic
-               - Provide a comprehensive file tree structure
-            
-            3. API documentation:
-               - Document EVERY API endpoint
-               - Include URL paths and brief explanation
-               - Explain API versioning and rate limiting if applicable
-            
-            Make the project structure section extremely detailed. 
-            
-            Format it as a complete, professional README.md file with proper markdown formatting.
-            
-            IMPORTANT: Return only the markdown content without wrapping it in code blocks. 
-            Do NOT use ```markdown or ``` tags to wrap the output. Return the raw markdown content directly.
-            """),
+
+    def readme_update_task(self, agent, project_name, diff, analysis_sections, sections):
+        return self._task(
+            description=self.readme_update_prompt(project_name, diff, analysis_sections, sections),
             agent=agent,
-            expected_output="A complete, professional README.md file with detailed project structure as the main focus, in raw markdown format"
-        )
\ No newline at end of file
+            expected_output=SECTION_UPDATE_OUTPUT
+        )
+
+    def readme_section_tasks(self, agents, project_name, project_analysis):
+        """``(heading, task)`` for each README section; ``agents`` builds a fresh agent per task"""
+        tasks = []
+        for heading, prompt in self.readme_section_prompts(project_name, project_analysis):
+            agent = agents()
+            tasks.append((heading, self._task(
+                description=prompt,
+                agent=agent,
+                expected_output=README_SECTION_OUTPUT
+            )))
+        return tasks